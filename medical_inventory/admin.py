@@ -1,7 +1,7 @@
 from django.contrib import admin
 
 from django.contrib import admin
-from .models import Astronaut, Medication, Prescription, MedicationCheckout, InventoryLog, SystemLog, WarningLog, MedicationThreshold, EmergencyAccess
+from .models import Astronaut, Medication, Prescription, MedicationCheckout, InventoryLog, SystemLog, WarningLog, MedicationThreshold, EmergencyAccess, DailyInventorySnapshot
 
 @admin.register(Astronaut)
 class AstronautAdmin(admin.ModelAdmin):
@@ -13,6 +13,8 @@ class MedicationAdmin(admin.ModelAdmin):
     list_display = ['name', 'medication_type', 'dosage', 'current_quantity', 'minimum_quantity', 'is_low_stock']
     list_filter = ['medication_type']
     search_fields = ['name', 'generic_name']
+    # Stock moves only through the ledger (restock / adjust quantity)
+    readonly_fields = ['current_quantity', 'status']
 
 @admin.register(Prescription)
 class PrescriptionAdmin(admin.ModelAdmin):
@@ -34,6 +36,13 @@ class InventoryLogAdmin(admin.ModelAdmin):
     search_fields = ['medication__name']
     date_hierarchy = 'timestamp'
 
+@admin.register(DailyInventorySnapshot)
+class DailyInventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ['medication', 'date', 'opening_quantity', 'closing_quantity', 'dispensed', 'restocked']
+    list_filter = ['date']
+    search_fields = ['medication__name']
+    date_hierarchy = 'date'
+
 @admin.register(SystemLog)
 class SystemLogAdmin(admin.ModelAdmin):
     list_display = ['event_type', 'astronaut', 'timestamp', 'ip_address']
@@ -0,0 +1,37 @@
+# analytics.py - Vectorised helpers for inventory time series
+import numpy as np
+
+
+def forward_fill_series(n_series, n_days, series_idx, day_idx, values, initial):
+    """
+    Build an (n_series, n_days) matrix from sparse (series, day, value)
+    observations, carrying each value forward until the next observation.
+    Days before a series' first observation take its initial value.
+    """
+    grid = np.full((n_series, n_days + 1), np.nan)
+    grid[:, 0] = initial
+    if len(values):
+        grid[np.asarray(series_idx), np.asarray(day_idx) + 1] = values
+
+    # Index of the last observed column at or before each position
+    observed = np.where(np.isnan(grid), 0, np.arange(n_days + 1))
+    np.maximum.accumulate(observed, axis=1, out=observed)
+
+    filled = grid[np.arange(n_series)[:, None], observed]
+    return filled[:, 1:]
+
+
+def exponential_smoothing(levels, values, alpha):
+    """
+    Fold new daily observations into each series' simple exponential
+    smoothing level (level = alpha * x + (1 - alpha) * level, oldest day
+    first) for all series at once, as one matrix-vector product.
+    values is (n_series, n_days); NaN marks days a series has already
+    folded in, which must all come before its new days.
+    """
+    values = np.asarray(values, dtype=float)
+    fresh = ~np.isnan(values)
+    # A series with k new days has its old level decayed k times
+    decay = (1 - alpha) ** fresh.sum(axis=1)
+    weights = alpha * (1 - alpha) ** np.arange(values.shape[1] - 1, -1, -1)
+    return decay * np.asarray(levels, dtype=float) + np.where(fresh, values, 0) @ weights
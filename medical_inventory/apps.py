@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class MedicalInventoryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'medical_inventory'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .edge import connect_journal, edge_enabled
+        from .sync import connect_change_feed
+        if edge_enabled():
+            connect_journal()
+        else:
+            connect_change_feed()
@@ -0,0 +1,149 @@
+# caching.py - Inventory version counter and version-stamped response cache
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+
+from .routers import reading_from_replica, replica_lag_seconds
+
+INVENTORY_VERSION_KEY = 'inventory:version'
+FACE_INDEX_VERSION_KEY = 'faces:version'
+WARNINGS_VERSION_KEY = 'warnings:version'
+PAYLOAD_TIMEOUT = 60 * 60
+
+
+def get_version(key):
+    """Shared version counter stored under key in the cache"""
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a cache restart never reuses an old version number
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        get_version(key)
+        return cache.incr(key)
+
+
+def get_inventory_version():
+    """Current inventory version; bumped on every Medication/InventoryLog write"""
+    return get_version(INVENTORY_VERSION_KEY)
+
+
+def bump_inventory_version():
+    """Invalidate every cached inventory payload"""
+    return bump_version(INVENTORY_VERSION_KEY)
+
+
+def get_face_index_version():
+    return get_version(FACE_INDEX_VERSION_KEY)
+
+
+def bump_face_index_version():
+    """Make every process rebuild its in-memory face index (enrollment.py)"""
+    return bump_version(FACE_INDEX_VERSION_KEY)
+
+
+def get_warnings_version():
+    return get_version(WARNINGS_VERSION_KEY)
+
+
+def bump_warnings_version():
+    """Tell live streams the pending-warning counts changed"""
+    return bump_version(WARNINGS_VERSION_KEY)
+
+
+def _digest(*parts):
+    return hashlib.md5(':'.join(str(p) for p in parts).encode()).hexdigest()
+
+
+def _etag(request, scope, version, *extra):
+    # The calendar date is part of the stamp because "today" and "last N days" roll over at midnight
+    return '"%s"' % _digest(scope, version, timezone.now().date(), request.get_full_path(), *extra)
+
+
+def _not_modified(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    return None
+
+
+def stamp_inventory_response(response, etag):
+    response['ETag'] = etag
+    # Browsers keep the copy but must revalidate, which is a cheap 304 while nothing changed
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _payload_timeout():
+    # A replica read may predate the version it is cached under; let it expire
+    # once the replica has caught up instead of serving it for the full hour
+    return replica_lag_seconds() if reading_from_replica() else PAYLOAD_TIMEOUT
+
+
+def get_cached_payload(scope, build, key_extra=''):
+    """Return build() from cache, recomputing only when the inventory version changed"""
+    version = get_inventory_version()
+    key = f'inventory:{scope}:{version}:{timezone.now().date()}:{_digest(key_extra)}'
+    payload = cache.get(key)
+    if payload is None:
+        payload = build()
+        cache.set(key, payload, _payload_timeout())
+    return payload
+
+
+def inventory_etag(request, scope, *extra):
+    """
+    (etag, not_modified_response) for a per-user page whose data depends only
+    on the inventory version. extra should hold anything else the page varies on.
+    """
+    etag = _etag(request, scope, get_inventory_version(), *extra)
+    return etag, _not_modified(request, etag)
+
+
+def cache_inventory_response(scope):
+    """
+    Cache a JSON view's body per inventory version and query string, and
+    answer If-None-Match revalidation with 304 without running the view.
+    The ETag is a hash of the body, not of the version: a body read from a
+    lagging replica expires after the replica lag (_payload_timeout), and
+    the caught-up body that replaces it gets a new tag, so browsers don't
+    keep revalidating the stale copy.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            key = 'inventory:%s:%s' % (
+                scope, _digest(get_inventory_version(), timezone.now().date(), request.get_full_path())
+            )
+            cached = cache.get(key)
+            if cached is None:
+                response = view_func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                etag = '"%s"' % hashlib.md5(response.content).hexdigest()
+                cached = (response.content, response['Content-Type'], etag)
+                cache.set(key, cached, _payload_timeout())
+
+            content, content_type, etag = cached
+            not_modified = _not_modified(request, etag)
+            if not_modified:
+                return not_modified
+            return stamp_inventory_response(HttpResponse(content, content_type=content_type), etag)
+        return wrapper
+    return decorator
@@ -0,0 +1,28 @@
+# checks.py - System checks for deployment settings the app depends on
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Backends whose data is private to one process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches)
+def shared_cache_check(app_configs, **kwargs):
+    """
+    The inventory, face index and warnings version counters live in the
+    default cache. Management commands (sync_edge, enroll_crew,
+    register_face, sweep_expired) bump them from their own processes, so a
+    per-process cache would leave web workers serving stale payloads, 304s
+    and face indexes until they restart.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f'The default cache ({backend}) is not shared between processes.',
+            hint='Set REDIS_URL, or use FileBasedCache (the default without REDIS_URL) or DatabaseCache.',
+            id='medical_inventory.E001',
+        )]
+    return []
@@ -0,0 +1,225 @@
+# columnar.py - Typed, compressed, month-partitioned column exports of the logs
+import json
+import os
+from datetime import timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import AccessLog, AccessLogItem, InventoryLog, MedicationCheckout, SystemLog
+
+# Parquet needs pyarrow (optional); otherwise columns go to compressed NumPy .npz files
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+STATE_FILE = '_export_state.json'
+DEFAULT_CHUNK_SIZE = 50000
+# Rows younger than this are left for the next export: ids are handed out
+# before commit, so a lower id can still become visible after a higher one
+SETTLE_SECONDS = 60
+
+# table name -> model, timestamp used for month partitioning, (column, ORM path, type)
+TABLES = {
+    'inventory_log': {
+        'model': InventoryLog,
+        'time': 'timestamp',
+        'columns': [
+            ('id', 'id', 'int'),
+            ('medication_id', 'medication_id', 'int'),
+            ('medication', 'medication__name', 'string'),
+            ('log_type', 'log_type', 'string'),
+            ('quantity_change', 'quantity_change', 'int'),
+            ('previous_quantity', 'previous_quantity', 'int'),
+            ('new_quantity', 'new_quantity', 'int'),
+            ('timestamp', 'timestamp', 'timestamp'),
+            ('performed_by_id', 'performed_by_id', 'int'),
+            ('notes', 'notes', 'string'),
+        ],
+    },
+    'access_log': {
+        'model': AccessLog,
+        'time': 'timestamp',
+        'columns': [
+            ('id', 'id', 'int'),
+            ('event_type', 'event_type', 'string'),
+            ('timestamp', 'timestamp', 'timestamp'),
+            ('astronaut_id', 'astronaut_id', 'int'),
+            ('astronaut', 'astronaut__name', 'string'),
+            ('door_open_seconds', 'door_open_seconds', 'int'),
+            ('notes', 'notes', 'string'),
+        ],
+    },
+    'access_log_item': {
+        'model': AccessLogItem,
+        'time': 'access_log__timestamp',
+        'columns': [
+            ('id', 'id', 'int'),
+            ('access_log_id', 'access_log_id', 'int'),
+            ('timestamp', 'access_log__timestamp', 'timestamp'),
+            ('medication_id', 'medication_id', 'int'),
+            ('medication', 'medication__name', 'string'),
+            ('quantity', 'quantity', 'int'),
+        ],
+    },
+    'medication_checkout': {
+        'model': MedicationCheckout,
+        'time': 'checkout_time',
+        'columns': [
+            ('id', 'id', 'int'),
+            ('astronaut_id', 'astronaut_id', 'int'),
+            ('medication_id', 'medication_id', 'int'),
+            ('medication', 'medication__name', 'string'),
+            ('quantity', 'quantity', 'int'),
+            ('checkout_time', 'checkout_time', 'timestamp'),
+            ('is_prescription', 'is_prescription', 'bool'),
+            ('notes', 'notes', 'string'),
+        ],
+    },
+    'system_log': {
+        'model': SystemLog,
+        'time': 'timestamp',
+        'columns': [
+            ('id', 'id', 'int'),
+            ('event_type', 'event_type', 'string'),
+            ('astronaut_id', 'astronaut_id', 'int'),
+            ('description', 'description', 'string'),
+            ('timestamp', 'timestamp', 'timestamp'),
+            ('ip_address', 'ip_address', 'string'),
+        ],
+    },
+}
+
+
+def resolve_format(fmt='auto'):
+    if fmt == 'auto':
+        return 'parquet' if PYARROW_AVAILABLE else 'npz'
+    if fmt == 'parquet' and not PYARROW_AVAILABLE:
+        raise ValueError('Parquet export needs pyarrow (pip install pyarrow)')
+    return fmt
+
+
+def _naive_utc(value):
+    return value.astimezone(dt_timezone.utc).replace(tzinfo=None) if value else None
+
+
+def _numpy_columns(spec, columns):
+    """Typed NumPy arrays; nullable columns get a companion '<name>__null' mask"""
+    arrays = {}
+    for (name, _path, kind), values in zip(spec, columns):
+        nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        if kind == 'int':
+            arrays[name] = np.array([0 if v is None else v for v in values], dtype=np.int64)
+        elif kind == 'bool':
+            arrays[name] = np.array([bool(v) for v in values], dtype=bool)
+        elif kind == 'timestamp':
+            arrays[name] = np.array([_naive_utc(v) for v in values], dtype='datetime64[us]')
+        else:
+            arrays[name] = np.array(['' if v is None else str(v) for v in values], dtype=str)
+        if nulls.any():
+            arrays[f'{name}__null'] = nulls
+    return arrays
+
+
+def _arrow_table(spec, columns):
+    types = {'int': pa.int64(), 'bool': pa.bool_(), 'timestamp': pa.timestamp('us', tz='UTC'), 'string': pa.string()}
+    return pa.table({
+        name: pa.array(
+            [str(v) if (kind == 'string' and v is not None) else v for v in values],
+            type=types[kind]
+        )
+        for (name, _path, kind), values in zip(spec, columns)
+    })
+
+
+def write_part(directory, basename, spec, rows, fmt):
+    """Write one column file for a batch of rows; returns the file path"""
+    os.makedirs(directory, exist_ok=True)
+    columns = list(zip(*rows))
+    if fmt == 'parquet':
+        path = os.path.join(directory, f'{basename}.parquet')
+        pq.write_table(_arrow_table(spec, columns), path, compression='zstd')
+    else:
+        path = os.path.join(directory, f'{basename}.npz')
+        np.savez_compressed(path, **_numpy_columns(spec, columns))
+    return path
+
+
+def export_table(table, output_dir, since_id=0, fmt='npz', chunk_size=DEFAULT_CHUNK_SIZE,
+                 settle_seconds=SETTLE_SECONDS):
+    """
+    Export rows with id > since_id as month partitions:
+    <output_dir>/<table>/month=YYYY-MM/part-<first_id>-<last_id>.<ext>
+    Stops short of the first row written in the last settle_seconds, so a
+    transaction still committing below it isn't skipped by the cursor.
+    Reads chunk_size rows at a time. Returns (last_id, rows_written, files).
+    """
+    config = TABLES[table]
+    spec = config['columns']
+    time_index = [path for _name, path, _kind in spec].index(config['time'])
+    queryset = config['model'].objects.filter(pk__gt=since_id)
+    if settle_seconds:
+        unsettled = queryset.filter(**{
+            f"{config['time']}__gt": timezone.now() - timedelta(seconds=settle_seconds)
+        }).aggregate(first=Min('pk'))['first']
+        if unsettled is not None:
+            queryset = queryset.filter(pk__lt=unsettled)
+    queryset = queryset.order_by('pk').values_list(*[path for _name, path, _kind in spec])
+
+    last_id, total, files = since_id, 0, []
+    while True:
+        rows = list(queryset.filter(pk__gt=last_id)[:chunk_size])
+        if not rows:
+            break
+
+        by_month = {}
+        for row in rows:
+            month = row[time_index].astimezone(dt_timezone.utc).strftime('%Y-%m')
+            by_month.setdefault(month, []).append(row)
+
+        for month, month_rows in by_month.items():
+            directory = os.path.join(output_dir, table, f'month={month}')
+            basename = f'part-{month_rows[0][0]}-{month_rows[-1][0]}'
+            files.append(write_part(directory, basename, spec, month_rows, fmt))
+
+        last_id = rows[-1][0]
+        total += len(rows)
+    return last_id, total, files
+
+
+def load_state(output_dir):
+    path = os.path.join(output_dir, STATE_FILE)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+
+def save_state(output_dir, state):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def export_tables(output_dir, tables=None, state=None, fmt='npz', chunk_size=DEFAULT_CHUNK_SIZE,
+                  settle_seconds=SETTLE_SECONDS):
+    """
+    Incremental export of several tables. state maps table -> last exported id
+    and is returned updated, along with {table: rows_written}.
+    """
+    state = dict(state or {})
+    written = {}
+    for table in tables or TABLES:
+        last_id, count, _files = export_table(
+            table, output_dir, since_id=int(state.get(table, 0)), fmt=fmt, chunk_size=chunk_size,
+            settle_seconds=settle_seconds,
+        )
+        state[table] = last_id
+        written[table] = count
+    return state, written
@@ -0,0 +1,435 @@
+# edge.py - Offline-first edge mode: local SQLite, write journal, batched upstream sync
+import contextvars
+from itertools import groupby
+
+import requests
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F, Sum
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .caching import bump_face_index_version, bump_inventory_version, bump_warnings_version
+from .models import (
+    AccessLog, AccessLogItem, EmergencyAccess, InventoryLog, Medication, MedicationCheckout, MedicationLot,
+    SyncCheckpoint, SyncCursor, SyncJournal, SystemLog, WarningLog,
+)
+from .snapshots import apply_log_to_snapshot
+from .sync import (
+    CHANGE_BATCH_SIZE, FEED_LABELS, changes_since, decode_payload, encode_payload, from_wire,
+    record_changes,
+)
+
+CENTRAL_ALIAS = 'central'
+PUSH_BATCH_SIZE = 500
+
+# Written at the edge and pushed upstream. Parents come before children so a
+# batch applied in journal order never references a row that isn't there yet.
+JOURNALED_MODELS = [
+    Medication, MedicationLot, MedicationCheckout, InventoryLog, AccessLog, AccessLogItem,
+    SystemLog, WarningLog, EmergencyAccess,
+]
+# Stock columns that are merged as deltas instead of last-writer-wins
+QUANTITY_FIELDS = {Medication: 'current_quantity', MedicationLot: 'quantity'}
+# Crew, catalogue and history come back down through the change feed (sync.py)
+
+_suppressed = contextvars.ContextVar('edge_journal_suppressed', default=False)
+
+
+def edge_enabled():
+    return getattr(settings, 'EDGE_MODE', False)
+
+
+def id_offset():
+    """First primary key this node hands out, far above anything the central sequences reach"""
+    return settings.EDGE_NODE_ID << 40
+
+
+# ============================================================================
+# JOURNAL
+# ============================================================================
+
+def _attnames(model):
+    return [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+
+
+def _comparable(instance, attname):
+    value = getattr(instance, attname)
+    # FieldFile is mutated in place when a new file is saved; compare names
+    return value.name if isinstance(value, FieldFile) else value
+
+
+def _serialize(instance, attnames):
+    return {
+        attname: None if getattr(instance, attname) is None
+        else instance._meta.get_field(attname).value_to_string(instance)
+        for attname in attnames
+    }
+
+
+def _deserialize(model, payload):
+    return {
+        attname: None if value is None else model._meta.get_field(attname).to_python(value)
+        for attname, value in payload.items()
+    }
+
+
+def _journal_entry(instance, operation, payload=None, quantity_delta=0):
+    return SyncJournal(
+        model=instance._meta.label_lower,
+        object_id=instance.pk,
+        operation=operation,
+        payload=payload or {},
+        quantity_delta=quantity_delta,
+    )
+
+
+def journal_save(sender, instance, created, raw=False, using=None, **kwargs):
+    """post_save receiver: record a local insert/update in the same transaction as the write"""
+    if raw or using != DEFAULT_DB_ALIAS or _suppressed.get():
+        return
+
+    attnames = _attnames(sender)
+    loaded = getattr(instance, '_loaded_values', None)
+    if created:
+        entry = _journal_entry(instance, 'INSERT', _serialize(instance, attnames))
+    else:
+        if loaded is None:
+            changed = attnames
+        else:
+            changed = [a for a in attnames if a in loaded and _comparable(instance, a) != loaded[a]]
+        delta = 0
+        quantity_field = QUANTITY_FIELDS.get(sender)
+        if quantity_field and loaded is not None and quantity_field in changed:
+            delta = getattr(instance, quantity_field) - loaded[quantity_field]
+            changed.remove(quantity_field)
+        entry = _journal_entry(instance, 'UPDATE', _serialize(instance, changed), delta) if changed or delta else None
+
+    if entry is not None:
+        entry.save()
+    # The next save of this same instance only records what changes after now
+    instance._loaded_values = {a: _comparable(instance, a) for a in attnames}
+
+
+def journal_delete(sender, instance, using=None, **kwargs):
+    """post_delete receiver"""
+    if using != DEFAULT_DB_ALIAS or _suppressed.get():
+        return
+    _journal_entry(instance, 'DELETE').save()
+
+
+def journal_bulk_create(objs):
+    """bulk_create() sends no signals; journal its rows explicitly"""
+    if not edge_enabled() or not objs:
+        return
+    attnames = _attnames(type(objs[0]))
+    SyncJournal.objects.bulk_create([_journal_entry(obj, 'INSERT', _serialize(obj, attnames)) for obj in objs])
+
+
+def update_journaled(queryset, **values):
+    """
+    queryset.update(**values) that is also journaled in edge mode (update()
+    sends no signals). Values must be plain values, not expressions.
+    """
+    if not edge_enabled():
+        return queryset.update(**values)
+
+    model = queryset.model
+    ids = list(queryset.values_list('pk', flat=True))
+    if not ids:
+        return 0
+    updated = model.objects.filter(pk__in=ids).update(**values)
+    probe = model(**values)
+    payload = _serialize(probe, [model._meta.get_field(name).attname for name in values])
+    SyncJournal.objects.bulk_create([
+        SyncJournal(model=model._meta.label_lower, object_id=pk, operation='UPDATE', payload=payload)
+        for pk in ids
+    ])
+    return updated
+
+
+def connect_journal():
+    """Hook the journal into every edge-written model (called from AppConfig.ready in edge mode)"""
+    for model in JOURNALED_MODELS:
+        label = model._meta.label_lower
+        post_save.connect(journal_save, sender=model, dispatch_uid=f'edge_journal_save:{label}')
+        post_delete.connect(journal_delete, sender=model, dispatch_uid=f'edge_journal_delete:{label}')
+
+
+def pending_entries():
+    return SyncJournal.objects.filter(synced_at__isnull=True)
+
+
+def pending_quantity_deltas(model=Medication):
+    """{object_id: stock change not yet pushed upstream} for Medication or MedicationLot"""
+    rows = pending_entries().filter(model=model._meta.label_lower).exclude(quantity_delta=0)
+    return {
+        row['object_id']: row['delta']
+        for row in rows.values('object_id').annotate(delta=Sum('quantity_delta'))
+    }
+
+
+# ============================================================================
+# PUSH (edge -> central)
+# ============================================================================
+
+def _has_auto_now(model):
+    return any(
+        getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)
+        for f in model._meta.concrete_fields
+    )
+
+
+def _apply_inserts(model, entries, using):
+    objs = [model(pk=e.object_id, **_deserialize(model, e.payload)) for e in entries]
+    if _has_auto_now(model):
+        # bulk_create would stamp auto_now fields with the upload time; a raw save keeps the edge's
+        for obj in objs:
+            obj.save_base(raw=True, force_insert=True, using=using)
+    else:
+        model.objects.using(using).bulk_create(objs)
+    if model is InventoryLog:
+        for log in objs:
+            apply_log_to_snapshot(log, using=using)
+
+
+def _apply_update(model, entry, using):
+    # Fields are last-writer-wins; stock is merged so concurrent dispensing on
+    # several nodes and restocks on the ground all add up
+    values = _deserialize(model, entry.payload)
+    if entry.quantity_delta:
+        field = QUANTITY_FIELDS[model]
+        values[field] = F(field) + entry.quantity_delta
+    rows = model.objects.using(using).filter(pk=entry.object_id)
+    if not rows.update(**values):
+        # Deleted upstream; the next pull removes it here too
+        return
+    if model is Medication:
+        rows.get().save(using=using, update_fields=['status'])  # save() recomputes status
+
+
+def apply_entries(entries, using):
+    """Apply journal entries in order; consecutive inserts of one model go in one statement"""
+    for (label, operation), group in groupby(entries, key=lambda e: (e.model, e.operation)):
+        model = apps.get_model(label)
+        group = list(group)
+        if operation == 'INSERT':
+            _apply_inserts(model, group, using)
+        elif operation == 'UPDATE':
+            for entry in group:
+                _apply_update(model, entry, using)
+        else:
+            model.objects.using(using).filter(pk__in=[e.object_id for e in group]).delete()
+        if label in FEED_LABELS:
+            # Bulk writes send no signals; other nodes pull these through the feed
+            record_changes(model, [e.object_id for e in group], deleted=operation == 'DELETE', using=using)
+
+
+def apply_pushed_batch(node_id, entries, using=DEFAULT_DB_ALIAS):
+    """
+    Apply one batch of a node's journal on the central side, in one
+    transaction. The per-node checkpoint makes a batch whose local 'synced'
+    mark was lost (crash, dropped link) a no-op when it is retried.
+    Returns the last journal id applied for that node.
+    """
+    with transaction.atomic(using=using):
+        checkpoint, _ = SyncCheckpoint.objects.using(using).select_for_update().get_or_create(node_id=node_id)
+        apply_entries([e for e in entries if e.id > checkpoint.last_journal_id], using)
+        checkpoint.last_journal_id = max(checkpoint.last_journal_id, entries[-1].id)
+        checkpoint.save(using=using)
+    return checkpoint.last_journal_id
+
+
+def journal_to_wire(entry):
+    return [entry.id, entry.model, entry.object_id, entry.operation, entry.payload, entry.quantity_delta]
+
+
+def journal_from_wire(row):
+    entry_id, model, object_id, operation, payload, quantity_delta = row
+    if model not in {m._meta.label_lower for m in JOURNALED_MODELS}:
+        raise ValueError(f'{model} is not synced')
+    return SyncJournal(
+        id=entry_id, model=model, object_id=object_id, operation=operation,
+        payload=payload, quantity_delta=quantity_delta,
+    )
+
+
+def push_journal(transport, batch_size=PUSH_BATCH_SIZE):
+    """
+    Push pending journal entries upstream, oldest first, one central
+    transaction per batch. Returns the number of entries pushed; transport
+    errors propagate and leave the rest of the journal for the next run.
+    """
+    pushed = 0
+    while True:
+        entries = list(pending_entries().order_by('id')[:batch_size])
+        if not entries:
+            return pushed
+        transport.push(entries)
+        pending_entries().filter(id__lte=entries[-1].id).update(synced_at=timezone.now())
+        pushed += len(entries)
+
+
+# ============================================================================
+# PULL (central -> edge)
+# ============================================================================
+
+def apply_changes(payload, pending_deltas):
+    """Upsert one pulled batch into the local database; returns rows touched"""
+    touched = 0
+    for label, block in payload['models'].items():
+        model = FEED_LABELS[label]
+        fields = [model._meta.get_field(attname) for attname in block['fields']]
+        objs = [
+            model(**{f.attname: from_wire(f, value) for f, value in zip(fields, row)})
+            for row in block['rows']
+        ]
+        if model in QUANTITY_FIELDS:
+            # Keep local stock moves that haven't made it upstream yet
+            field = QUANTITY_FIELDS[model]
+            deltas = pending_deltas.get(model, {})
+            for obj in objs:
+                if obj.pk in deltas:
+                    setattr(obj, field, getattr(obj, field) + deltas[obj.pk])
+                    if model is Medication:
+                        obj.update_status()
+        new_logs = []
+        if model is InventoryLog:
+            known = set(InventoryLog.objects.filter(pk__in=[o.pk for o in objs]).values_list('pk', flat=True))
+            new_logs = [log for log in objs if log.pk not in known]
+
+        model._base_manager.bulk_create(
+            objs, batch_size=500, update_conflicts=True, unique_fields=['id'],
+            update_fields=[f.name for f in fields if not f.primary_key],
+        )
+        for log in new_logs:
+            # Other sites' stock moves belong in this node's history charts too
+            apply_log_to_snapshot(log)
+        touched += len(objs)
+
+    for label in reversed(list(FEED_LABELS)):
+        ids = payload['deleted'].get(label)
+        if ids:
+            FEED_LABELS[label]._base_manager.filter(pk__in=ids).delete()
+            touched += len(ids)
+    return touched
+
+
+def pull_changes(transport, batch_size=CHANGE_BATCH_SIZE):
+    """
+    Pull central changes since this node's cursor, a batch at a time. Each
+    batch is applied and the cursor advanced in one local transaction, so an
+    interrupted pull resumes where it stopped. Returns rows touched.
+    """
+    cursor, _ = SyncCursor.objects.get_or_create(source=CENTRAL_ALIAS)
+    touched = 0
+    token = _suppressed.set(True)
+    try:
+        while True:
+            payload = transport.changes(cursor.seq, batch_size)
+            with transaction.atomic():
+                pending_deltas = {model: pending_quantity_deltas(model) for model in QUANTITY_FIELDS}
+                touched += apply_changes(payload, pending_deltas)
+                cursor.seq = payload['cursor']
+                cursor.save()
+            if not payload['more']:
+                break
+    finally:
+        _suppressed.reset(token)
+
+    if touched:
+        # bulk_create sent no signals
+        bump_inventory_version()
+        bump_face_index_version()
+        bump_warnings_version()
+    return touched
+
+
+# ============================================================================
+# TRANSPORTS
+# ============================================================================
+
+class DatabaseTransport:
+    """Talks to the central database directly through the 'central' alias"""
+
+    def __init__(self, using=CENTRAL_ALIAS):
+        self.using = using
+
+    def push(self, entries):
+        return apply_pushed_batch(settings.EDGE_NODE_ID, entries, using=self.using)
+
+    def changes(self, since, limit):
+        return changes_since(since, limit, using=self.using)
+
+    def checkpoint(self):
+        checkpoint = SyncCheckpoint.objects.using(self.using).filter(node_id=settings.EDGE_NODE_ID).first()
+        return checkpoint.last_journal_id if checkpoint else 0
+
+    def close(self):
+        connections[self.using].close()
+
+
+class HttpTransport:
+    """Talks to the central server's sync API with compressed payloads (SYNC_CENTRAL_URL)"""
+
+    def __init__(self, base_url, token, codec='gzip', timeout=60):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.codec = codec
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+
+    def push(self, entries):
+        body = encode_payload(
+            {'node': settings.EDGE_NODE_ID, 'entries': [journal_to_wire(e) for e in entries]}, self.codec
+        )
+        response = self.session.post(
+            self.base_url + 'push/', data=body, timeout=self.timeout,
+            headers={'Content-Type': 'application/octet-stream', 'X-Sync-Encoding': self.codec},
+        )
+        response.raise_for_status()
+        return response.json()['last_journal_id']
+
+    def changes(self, since, limit):
+        response = self.session.get(
+            self.base_url + 'changes/', timeout=self.timeout,
+            params={'since': since, 'limit': limit, 'encoding': self.codec},
+        )
+        response.raise_for_status()
+        return decode_payload(response.content, response.headers.get('X-Sync-Encoding', self.codec))
+
+    def checkpoint(self):
+        response = self.session.get(f'{self.base_url}checkpoint/{settings.EDGE_NODE_ID}/', timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['last_journal_id']
+
+    def close(self):
+        self.session.close()
+
+
+def default_transport():
+    """HTTP when SYNC_CENTRAL_URL is set, otherwise the central database alias"""
+    url = getattr(settings, 'SYNC_CENTRAL_URL', '')
+    if url:
+        return HttpTransport(url, settings.SYNC_TOKEN, codec=getattr(settings, 'SYNC_ENCODING', 'gzip'))
+    return DatabaseTransport()
+
+
+def reserve_local_ids(min_journal_id=0):
+    """
+    Move this node's SQLite AUTOINCREMENT counters into its private id range
+    so rows created offline never collide with central rows or other nodes'.
+    """
+    offset = id_offset()
+    with connections[DEFAULT_DB_ALIAS].cursor() as cursor:
+        for model in JOURNALED_MODELS + [SyncJournal]:
+            table = model._meta.db_table
+            start = max(offset, min_journal_id) if model is SyncJournal else offset
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+            elif row[0] < start:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
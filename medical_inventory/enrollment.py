@@ -0,0 +1,167 @@
+# enrollment.py - Background face enrollment and the shared in-memory face index
+import logging
+import multiprocessing
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+
+from .caching import bump_face_index_version, get_face_index_version
+from .faces import encode_face_file
+from .models import Astronaut
+from .sync import record_changes
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_jobs = None
+_encoder = None
+_face_index = None
+
+
+def _executors():
+    """
+    Jobs run on a small thread pool; the encoding itself goes to a separate
+    process so dlib never holds this server process's GIL.
+    """
+    global _jobs, _encoder
+    with _lock:
+        if _jobs is None:
+            workers = getattr(settings, 'ENROLLMENT_WORKERS', 1)
+            _jobs = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='enrollment')
+            _encoder = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _jobs, _encoder
+
+
+def _encode(data):
+    global _encoder
+    try:
+        return _executors()[1].submit(encode_face_file, data).result()
+    except BrokenProcessPool:
+        # A crashed encoder (e.g. OOM-killed) would otherwise fail every later job
+        with _lock:
+            _encoder.shutdown(wait=False)
+            _encoder = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'ENROLLMENT_WORKERS', 1),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _encoder.submit(encode_face_file, data).result()
+
+
+def queue_enrollment(astronaut):
+    """
+    Mark astronaut PENDING and encode its stored photo once the current
+    transaction commits. The caller saves the astronaut.
+    """
+    astronaut.enrollment_status = 'PENDING'
+    astronaut.enrollment_error = ''
+    photo_name = astronaut.photo.name
+    # pk is read at commit time so brand-new (not yet saved) astronauts work too
+    transaction.on_commit(lambda: _executors()[0].submit(run_enrollment, astronaut.pk, photo_name))
+
+
+def _set_login_active(astronaut_pk, active):
+    """An astronaut's login works only once a face is enrolled"""
+    users = User.objects.filter(astronaut__pk=astronaut_pk, is_staff=False).exclude(is_active=active)
+    if not active:
+        # A failed re-enrollment leaves the face that already works in place
+        users = users.filter(astronaut__face_encoding__isnull=True)
+    user_ids = list(users.values_list('pk', flat=True))
+    if user_ids:
+        User.objects.filter(pk__in=user_ids).update(is_active=active)
+        record_changes(User, user_ids)
+
+
+def run_enrollment(astronaut_pk, photo_name):
+    """Encode one astronaut's photo and publish the result (runs on the job pool)"""
+    close_old_connections()
+    # Filtering on the photo name drops stale results if a newer photo was uploaded meanwhile
+    pending = Astronaut.objects.filter(pk=astronaut_pk, photo=photo_name)
+    try:
+        astronaut = pending.only('id', 'photo').first()
+        if astronaut is None:
+            return
+        with astronaut.photo.open('rb') as f:
+            data = f.read()
+
+        result = _encode(data)
+        if result['error']:
+            pending.update(enrollment_status='FAILED', enrollment_error=result['error'])
+            _set_login_active(astronaut_pk, False)
+            logger.warning('Enrollment failed for astronaut %s: %s', astronaut_pk, result['error'])
+            return
+
+        pending.update(
+            face_encoding=pickle.dumps(result['encoding']),
+            enrollment_status='READY',
+            enrollment_error='',
+        )
+        _set_login_active(astronaut_pk, True)
+        bump_face_index_version()
+        record_changes(Astronaut, [astronaut_pk])
+        logger.info('Enrollment complete for astronaut %s', astronaut_pk)
+    except Exception as e:
+        pending.update(enrollment_status='FAILED', enrollment_error=str(e)[:255])
+        _set_login_active(astronaut_pk, False)
+        logger.exception('Enrollment error for astronaut %s', astronaut_pk)
+    finally:
+        close_old_connections()
+
+
+def process_pending_enrollments():
+    """Run PENDING enrollments inline (jobs are lost if the server restarts mid-queue)"""
+    pending = list(Astronaut.objects.filter(enrollment_status='PENDING').exclude(photo='').values_list('pk', 'photo'))
+    for astronaut_pk, photo_name in pending:
+        run_enrollment(astronaut_pk, photo_name)
+    return len(pending)
+
+
+# ============================================================================
+# FACE INDEX
+# ============================================================================
+
+class FaceIndex:
+    """Immutable snapshot of every enrolled face as one (n, 128) matrix"""
+
+    def __init__(self, version, ids, names, matrix):
+        self.version = version
+        self.ids = ids
+        self.names = names
+        self.matrix = matrix
+
+    @classmethod
+    def build(cls, version):
+        rows = Astronaut.objects.with_face_encoding().filter(
+            face_encoding__isnull=False
+        ).values_list('id', 'name', 'face_encoding')
+        ids, names, encodings = [], [], []
+        for astronaut_pk, name, encoding in rows:
+            ids.append(astronaut_pk)
+            names.append(name)
+            encodings.append(pickle.loads(encoding))
+        matrix = np.vstack(encodings) if encodings else np.empty((0, 128))
+        return cls(version, ids, names, matrix)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def get_face_index():
+    """
+    Current face index for this process. It is rebuilt only when the shared
+    version moves (bumped by any process through the shared cache, including
+    enroll_crew, register_face and sync_edge), and swapped in as a whole so
+    readers never see a partial update.
+    """
+    global _face_index
+    version = get_face_index_version()
+    index = _face_index
+    if index is None or index.version != version:
+        index = FaceIndex.build(version)
+        _face_index = index
+    return index
@@ -0,0 +1,167 @@
+# events.py - Server-sent inventory change feed
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
+
+from .caching import get_inventory_version, get_warnings_version
+from .models import InventoryLog, Medication, MedicationCheckout, WarningLog
+
+POLL_INTERVAL = 1.0
+# Safety net for workers that don't share the cache: look at the log itself this often
+RESYNC_INTERVAL = 15.0
+MAX_CHANGES_PER_EVENT = 500
+# Ids are handed out before commit, so a lower id can become visible after a
+# higher one; the cursor stays behind rows younger than this and re-reads them
+COMMIT_LAG_SECONDS = 5
+# Reconnect delay sent to EventSource clients (ms); WSGI clients reconnect after every batch
+RETRY_MS = 3000
+
+
+def latest_log_id():
+    return InventoryLog.objects.aggregate(last=Max('id'))['last'] or 0
+
+
+def inventory_stats():
+    """Dashboard header numbers, same definitions as inventory_dashboard"""
+    stats = Medication.objects.aggregate(
+        total_medications=Count('id'),
+        low_stock_count=Count('id', filter=Q(current_quantity__lte=F('minimum_quantity'))),
+    )
+    today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    stats['total_checkouts_today'] = MedicationCheckout.objects.filter(
+        checkout_time__gte=today_start
+    ).count()
+    return stats
+
+
+def changes_since(cursor):
+    """
+    Compact deltas for every medication touched by an InventoryLog row after
+    cursor, as (new_cursor, [{'id', 'quantity', 'minimum', 'status'}]).
+    The new cursor stops short of rows written in the last
+    COMMIT_LAG_SECONDS, so those medications are sent again on the next
+    poll (deltas are current state, so a repeat is harmless) and a
+    lower id committing late isn't skipped.
+    """
+    rows = list(
+        InventoryLog.objects.filter(id__gt=cursor).order_by('id').values_list(
+            'id', 'timestamp', 'medication_id', 'medication__current_quantity',
+            'medication__minimum_quantity', 'medication__status',
+        )[:MAX_CHANGES_PER_EVENT]
+    )
+    if not rows:
+        return cursor, []
+
+    settled = timezone.now() - timedelta(seconds=COMMIT_LAG_SECONDS)
+    new_cursor = rows[-1][0]
+    latest = {}
+    for log_id, timestamp, med_id, quantity, minimum, status in rows:
+        latest[med_id] = {'id': med_id, 'quantity': quantity, 'minimum': minimum, 'status': status}
+        if timestamp > settled:
+            new_cursor = min(new_cursor, log_id - 1)
+    return new_cursor, list(latest.values())
+
+
+def warning_stats():
+    """Unacknowledged warning counts; served from the pending-only partial index"""
+    return WarningLog.objects.filter(acknowledged=False).aggregate(
+        pending=Count('id'),
+        critical=Count('id', filter=Q(severity='CRITICAL')),
+    )
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class InventoryFeed:
+    """Cursor + version bookkeeping shared by the sync and async streams"""
+
+    def __init__(self, cursor=None):
+        self.cursor = cursor
+        self.version = None
+        self.warnings_version = None
+        self.last_resync = 0.0
+        self.last_ping = time.monotonic()
+
+    def start(self):
+        if self.cursor is None:
+            self.cursor = latest_log_id()
+            self.version = get_inventory_version()
+        # A resuming client (Last-Event-ID) gets whatever it missed on the first tick
+        self.last_resync = time.monotonic()
+        return f'retry: {RETRY_MS}\nid: {self.cursor}\n\n'
+
+    def tick(self):
+        """Return the next chunk to send, or None if there is nothing to say yet"""
+        now = time.monotonic()
+        chunk = (self._inventory_event(now) or '') + (self._warnings_event() or '')
+        if chunk:
+            self.last_ping = now
+            return chunk
+        if now - self.last_ping >= RESYNC_INTERVAL:
+            self.last_ping = now
+            return ': ping\n\n'
+        return None
+
+    def _inventory_event(self, now):
+        version = get_inventory_version()
+        if version == self.version and now - self.last_resync < RESYNC_INTERVAL:
+            return None
+
+        self.version = version
+        self.last_resync = now
+        cursor, changes = changes_since(self.cursor)
+        if not changes:
+            return None
+        self.cursor = cursor
+        return format_event('inventory', {'changes': changes, 'stats': inventory_stats()}, cursor)
+
+    def _warnings_event(self):
+        # Sent on connect and then only when a warning is written or acknowledged
+        version = get_warnings_version()
+        if version == self.warnings_version:
+            return None
+        self.warnings_version = version
+        return format_event('warnings', warning_stats())
+
+
+def _max_seconds():
+    # Bounded so clients reconnect (with Last-Event-ID) and workers are recycled
+    return getattr(settings, 'INVENTORY_EVENTS_MAX_SECONDS', 300)
+
+
+def event_stream(cursor=None):
+    """
+    WSGI servers: one batch, then the response ends so the worker is freed
+    at once. The client reconnects after the retry delay with Last-Event-ID
+    and picks up from there, which turns the stream into a cheap poll.
+    """
+    feed = InventoryFeed(cursor)
+    yield feed.start()
+    chunk = feed.tick()
+    if chunk:
+        yield chunk
+
+
+async def async_event_stream(cursor=None):
+    """Non-blocking generator for ASGI servers (nasa/asgi.py)"""
+    feed = InventoryFeed(cursor)
+    yield await sync_to_async(feed.start)()
+    deadline = time.monotonic() + _max_seconds()
+    while time.monotonic() < deadline:
+        chunk = await sync_to_async(feed.tick)()
+        if chunk:
+            yield chunk
+        await asyncio.sleep(POLL_INTERVAL)
@@ -0,0 +1,99 @@
+# expiry.py - Expiry sweep: write off expired lots in bulk, list what expires soon
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .caching import bump_inventory_version, get_cached_payload
+from .ledger import FEFO_ORDER
+from .models import InventoryLog, Medication, MedicationLot
+from .snapshots import build_snapshots, save_snapshots
+from .sync import record_changes
+
+
+def warning_days():
+    return getattr(settings, 'EXPIRY_WARNING_DAYS', 30)
+
+
+def expired_lots(today=None):
+    """Lots still holding stock past their expiration date (range scan on the in-stock expiry index)"""
+    today = today or timezone.localdate()
+    return MedicationLot.objects.filter(quantity__gt=0, expiration_date__lt=today)
+
+
+def sweep_expired(today=None):
+    """
+    Write off every expired lot: one EXPIRED log per lot, then the lots,
+    medications, daily snapshots and change feed are updated with a handful
+    of bulk statements however many lots expired. Returns the logs written.
+    """
+    today = today or timezone.localdate()
+    medication_ids = sorted(set(expired_lots(today).values_list('medication_id', flat=True)))
+    if not medication_ids:
+        return []
+
+    now = timezone.now()
+    with transaction.atomic():
+        # The same row locks as any other stock movement (ledger._move), taken in id order
+        medications = {
+            m.pk: m for m in Medication.objects.select_for_update().filter(pk__in=medication_ids).order_by('pk')
+        }
+        # Re-read under the locks: a checkout may have emptied a lot meanwhile
+        lots = list(expired_lots(today).filter(medication_id__in=medication_ids).order_by('medication_id', *FEFO_ORDER))
+        logs = []
+        for lot in lots:
+            medication = medications[lot.medication_id]
+            previous = medication.current_quantity
+            medication.current_quantity -= lot.quantity
+            logs.append(InventoryLog(
+                medication=medication,
+                lot=lot,
+                log_type='EXPIRED',
+                quantity_change=-lot.quantity,
+                previous_quantity=previous,
+                new_quantity=medication.current_quantity,
+                notes=f'Expired {lot.expiration_date:%Y-%m-%d}',
+                timestamp=now,
+            ))
+        InventoryLog.objects.bulk_create(logs)
+        MedicationLot.objects.filter(pk__in=[lot.pk for lot in lots]).update(quantity=0)
+
+        next_expiry = dict(
+            MedicationLot.objects.filter(medication_id__in=medication_ids, quantity__gt=0).order_by()
+            .values('medication_id').annotate(next_expiry=Min('expiration_date'))
+            .values_list('medication_id', 'next_expiry')
+        )
+        for medication in medications.values():
+            medication.expiration_date = next_expiry.get(medication.pk) or medication.expiration_date
+            medication.update_status()
+        Medication.objects.bulk_update(medications.values(), ['current_quantity', 'status', 'expiration_date'])
+
+        # Bulk writes send no signals; do what they would have done
+        start_of_day = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+        save_snapshots(build_snapshots(since=start_of_day, medication_ids=medication_ids))
+        record_changes(InventoryLog, [log.pk for log in logs])
+        record_changes(MedicationLot, [lot.pk for lot in lots])
+        record_changes(Medication, medication_ids)
+    bump_inventory_version()
+    return logs
+
+
+def expiring_soon(days=None):
+    """
+    Lots in stock that expire within `days` (default EXPIRY_WARNING_DAYS),
+    soonest first, including expired ones the sweep hasn't written off yet.
+    Cached per inventory version and day, so the dashboard never scans lots.
+    """
+    days = warning_days() if days is None else days
+
+    def build():
+        today = timezone.localdate()
+        rows = MedicationLot.objects.filter(
+            quantity__gt=0, expiration_date__lte=today + timedelta(days=days)
+        ).order_by('expiration_date', 'medication__name').values(
+            'id', 'medication_id', 'lot_number', 'expiration_date', 'quantity', name=F('medication__name'),
+        )
+        return [dict(row, days_left=(row['expiration_date'] - today).days) for row in rows]
+    return get_cached_payload('expiring', build, key_extra=days)
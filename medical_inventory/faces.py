@@ -0,0 +1,52 @@
+# faces.py - Face encoding helpers that are safe to run in worker processes
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import face_recognition
+import numpy as np
+from PIL import Image, ImageOps
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+# Enrollment photos are often straight off a camera; HOG detection doesn't need 24MP
+ENROLL_MAX_SIDE = 1600
+
+
+def load_face_image(source, max_side=ENROLL_MAX_SIDE):
+    """RGB array from an image path or raw image bytes"""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    img = ImageOps.exif_transpose(Image.open(source)).convert('RGB')
+    img.thumbnail((max_side, max_side))
+    return np.array(img)
+
+
+def encode_face_file(source):
+    """
+    Encode the single face in an image (path or bytes). Returns {'encoding', 'error'};
+    error is set (and encoding None) for unreadable files, no face or several faces.
+    Runs in a worker process, so it must not touch the database.
+    """
+    try:
+        image = load_face_image(source)
+    except (OSError, ValueError) as e:
+        return {'encoding': None, 'error': f'unreadable image ({e})'}
+
+    locations = face_recognition.face_locations(image, model='hog')
+    if not locations:
+        return {'encoding': None, 'error': 'no face detected'}
+    if len(locations) > 1:
+        return {'encoding': None, 'error': f'{len(locations)} faces detected'}
+
+    encoding = face_recognition.face_encodings(image, locations)[0]
+    return {'encoding': encoding, 'error': None}
+
+
+def encode_face_files(paths, workers=None):
+    """Encode many images across a process pool; yields results in input order"""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) == 1:
+        yield from map(encode_face_file, paths)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(encode_face_file, paths)
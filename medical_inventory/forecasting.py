@@ -0,0 +1,101 @@
+# forecasting.py - Consumption rates and days of supply from the daily checkout rollups
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .analytics import exponential_smoothing
+from .caching import get_cached_payload
+from .models import ConsumptionForecast, DailyInventorySnapshot, Medication
+
+# Weight of the newest day in the smoothed rate (a half-life of about a week)
+SMOOTHING_ALPHA = 0.1
+# History a medication's first rate is seeded from
+HISTORY_DAYS = 90
+# Below this many units a day a medication is treated as not being used
+MIN_DAILY_RATE = 0.01
+# Days of supply are reported up to this far out; beyond it the number means nothing
+MAX_DAYS_OF_SUPPLY = 3650
+
+
+def update_rates(today=None):
+    """
+    Fold every complete day since each medication's last update into its
+    smoothed daily consumption (units checked out per day), all medications
+    in one vectorised pass. Only DailyInventorySnapshot rows newer than the
+    stored rates are read, so keeping up costs one small query a day. A
+    rollup rewritten for a day already folded in drops the stored rate
+    (snapshots.forget_forecasts), which is then re-seeded from the window.
+    Returns {medication_id: daily_rate}.
+    """
+    today = today or timezone.localdate()
+    through = today - timedelta(days=1)  # Today isn't over yet
+    window_start = through - timedelta(days=HISTORY_DAYS - 1)
+    stored = {f.medication_id: f for f in ConsumptionForecast.objects.all()}
+    starts = {
+        pk: stored[pk].through_date + timedelta(days=1) if pk in stored else window_start
+        for pk in Medication.objects.values_list('id', flat=True)
+    }
+    stale = [pk for pk, start in starts.items() if start <= through]
+    if not stale:
+        return {pk: f.daily_rate for pk, f in stored.items()}
+
+    first = min(starts[pk] for pk in stale)
+    n_days = (through - first).days + 1
+    row = {pk: i for i, pk in enumerate(stale)}
+    values = np.zeros((len(stale), n_days))
+    history = list(DailyInventorySnapshot.objects.filter(
+        medication_id__in=stale, date__gte=first, date__lte=through
+    ).values_list('medication_id', 'date', 'dispensed'))
+    if history:
+        med_ids, dates, dispensed = zip(*history)
+        values[[row[pk] for pk in med_ids], [(d - first).days for d in dates]] = dispensed
+    # Days a medication has already folded in are skipped
+    start_idx = np.array([(starts[pk] - first).days for pk in stale])
+    values[np.arange(n_days)[None, :] < start_idx[:, None]] = np.nan
+
+    levels = np.array([stored[pk].daily_rate if pk in stored else np.nan for pk in stale])
+    new = np.isnan(levels)
+    if new.any():
+        # A new medication starts from its average over the window rather than from zero
+        levels[new] = np.nanmean(values[new], axis=1)
+    rates = exponential_smoothing(levels, values, SMOOTHING_ALPHA)
+
+    ConsumptionForecast.objects.bulk_create(
+        [
+            ConsumptionForecast(medication_id=pk, daily_rate=float(rate), through_date=through)
+            for pk, rate in zip(stale, rates)
+        ],
+        update_conflicts=True, unique_fields=['medication'], update_fields=['daily_rate', 'through_date', 'updated_at'],
+    )
+    result = {pk: f.daily_rate for pk, f in stored.items()}
+    result.update((pk, float(rate)) for pk, rate in zip(stale, rates))
+    return result
+
+
+def forecast():
+    """
+    {medication_id: {'daily_rate', 'days_of_supply', 'runout_date'}}.
+    days_of_supply and runout_date are None for medications not being used.
+    Cached per inventory version and day: a checkout only re-derives days
+    of supply from the stored rates, and the rates themselves move forward
+    when a day completes.
+    """
+    def build():
+        today = timezone.localdate()
+        rates = update_rates(today)
+        stock = dict(Medication.objects.values_list('id', 'current_quantity'))
+        ids = list(stock)
+        daily = np.array([rates.get(pk, 0.0) for pk in ids])
+        used = daily >= MIN_DAILY_RATE
+        quantities = np.array([stock[pk] for pk in ids], dtype=float)
+        days = np.minimum(np.divide(quantities, daily, out=np.full(len(ids), np.nan), where=used), MAX_DAYS_OF_SUPPLY)
+        return {
+            pk: {
+                'daily_rate': round(float(rate), 2),
+                'days_of_supply': round(float(supply), 1) if is_used else None,
+                'runout_date': today + timedelta(days=int(supply)) if is_used else None,
+            }
+            for pk, rate, supply, is_used in zip(ids, daily, days, used)
+        }
+    return get_cached_payload('forecast', build)
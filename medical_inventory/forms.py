@@ -2,7 +2,7 @@ from django import forms
 from django.contrib.auth.models import User
 from .models import (
     Medication, Astronaut, Prescription, MedicationCheckout, 
-    MedicationThreshold, InventoryLog
+    MedicationThreshold
 )
 
 
@@ -14,7 +14,8 @@ class MedicationForm(forms.ModelForm):
             'name', 'generic_name', 'medication_type', 'dosage', 
             'description', 'current_quantity', 'minimum_quantity', 
             'container_location', 'expiration_date', 'pill_image',
-            'pill_shape', 'pill_color', 'pill_imprint', 'pill_size'
+            'pill_shape', 'pill_color', 'pill_imprint', 'pill_size',
+            'unit_mass_g', 'unit_volume_ml'
         ]
         widgets = {
             'name': forms.TextInput(attrs={
@@ -62,6 +63,16 @@ class MedicationForm(forms.ModelForm):
                 'placeholder': 'Text/numbers on pill'
             }),
             'pill_size': forms.Select(attrs={'class': 'form-control'}),
+            'unit_mass_g': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': '0',
+                'step': 'any'
+            }),
+            'unit_volume_ml': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': '0',
+                'step': 'any'
+            }),
         }
         
     def clean_current_quantity(self):
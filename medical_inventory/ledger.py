@@ -0,0 +1,292 @@
+# ledger.py - InventoryLog is the stock ledger; every quantity change goes through here
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import (
+    Count, DateTimeField, F, IntegerField, Min, OuterRef, RowRange, Subquery, Sum, Value, Window,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .caching import get_cached_payload
+from .models import InventoryLog, Medication, MedicationLot, StockSnapshot
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Snapshots are taken this far in the past so checkouts still in flight (log
+# written, transaction not yet committed) are never left out of one
+SNAPSHOT_SETTLE = timedelta(minutes=5)
+
+
+class InsufficientStock(ValueError):
+    pass
+
+
+# ============================================================================
+# WRITING
+# ============================================================================
+
+# Dispensing order: first expiring first out; lots without an expiry go last
+FEFO_ORDER = [F('expiration_date').asc(nulls_last=True), F('received_at').asc(), F('id').asc()]
+
+
+def pick_lots(medication_id, quantity, using=DEFAULT_DB_ALIAS):
+    """
+    FEFO allocation in one query: only the lots needed to cover `quantity`
+    come back (running total of the lots before each one < quantity).
+    Returns ([(lot, units)], units not covered by any lot).
+    """
+    lots = MedicationLot.objects.using(using).filter(medication_id=medication_id, quantity__gt=0).annotate(
+        drawn_before=Coalesce(Window(Sum('quantity'), order_by=FEFO_ORDER, frame=RowRange(end=-1)), 0)
+    ).filter(drawn_before__lt=quantity).order_by(*FEFO_ORDER)
+    picks, remaining = [], quantity
+    for lot in lots:
+        units = min(lot.quantity, remaining)
+        picks.append((lot, units))
+        remaining -= units
+    return picks, remaining
+
+
+def _receiving_lot(medication, expiration_date, lot_number, using):
+    lot = MedicationLot.objects.using(using).filter(
+        medication=medication, expiration_date=expiration_date, lot_number=lot_number
+    ).order_by('id').first()
+    return lot or MedicationLot(medication=medication, expiration_date=expiration_date, lot_number=lot_number)
+
+
+def _slices(locked, change, lot, expiration_date, lot_number, using):
+    """[(lot or None, signed units)] a movement of `change` is booked as"""
+    if change == 0:
+        return [(None, 0)]
+    if change > 0:
+        return [(lot or _receiving_lot(locked, expiration_date, lot_number, using), change)]
+    if lot is not None:
+        if lot.quantity < -change:
+            raise InsufficientStock(f'Lot {lot.lot_number or lot.pk} of {locked.name} has only {lot.quantity} left')
+        return [(lot, change)]
+    picks, uncovered = pick_lots(locked.pk, -change, using)
+    slices = [(picked, -units) for picked, units in picks]
+    if uncovered:
+        # Stock recorded before lots existed, or lots not synced yet; stock_ledger --check reports it
+        slices.append((None, -uncovered))
+    return slices
+
+
+def _move(medication, log_type, change_for, performed_by, notes, timestamp, using,
+          lot=None, expiration_date=None, lot_number=''):
+    with transaction.atomic(using=using):
+        # The medication row lock orders concurrent movements - and every change
+        # to its lots - so each log's previous/new quantities chain exactly
+        # and neither the projection nor a lot can lose an update
+        locked = Medication.objects.using(using).select_for_update().get(pk=medication.pk)
+        previous = locked.current_quantity
+        quantity_change = change_for(previous)
+        if quantity_change < 0 and previous + quantity_change < 0:
+            raise InsufficientStock(f'Insufficient stock for {locked.name}: {previous} left')
+        if lot is not None:
+            lot = MedicationLot.objects.using(using).get(pk=lot.pk, medication=locked)
+
+        timestamp = timestamp or timezone.now()
+        logs = []
+        running = previous
+        for target, units in _slices(locked, quantity_change, lot, expiration_date, lot_number, using):
+            if target is not None:
+                target.quantity += units
+                target.save(using=using)  # a full save, so edge mode journals the lot
+            logs.append(InventoryLog.objects.using(using).create(
+                medication=locked,
+                lot=target,
+                log_type=log_type,
+                quantity_change=units,
+                previous_quantity=running,
+                new_quantity=running + units,
+                performed_by=performed_by,
+                notes=notes,
+                timestamp=timestamp,
+            ))
+            running += units
+
+        locked.current_quantity = running
+        # Shown wherever one date is shown: the next lot to expire
+        next_expiry = MedicationLot.objects.using(using).filter(
+            medication=locked, quantity__gt=0
+        ).aggregate(next_expiry=Min('expiration_date'))['next_expiry']
+        locked.expiration_date = next_expiry or locked.expiration_date
+        locked.save(using=using, update_fields=['current_quantity', 'status', 'expiration_date'])  # save() recomputes status
+    medication.current_quantity = locked.current_quantity
+    medication.status = locked.status
+    medication.expiration_date = locked.expiration_date
+    return logs
+
+
+def record_movement(medication, quantity_change, log_type, performed_by=None, notes='', timestamp=None,
+                    lot=None, expiration_date=None, lot_number='', using=DEFAULT_DB_ALIAS):
+    """
+    Append one stock movement to the ledger and move the cached
+    Medication.current_quantity with it. Additions go into `lot`, or the lot
+    with this expiration_date/lot_number (created if new). Removals come out
+    of `lot`, or first-expiring-first-out across the medication's lots, one
+    log row per lot drawn from. Removing more than is in stock raises
+    InsufficientStock. Updates `medication` in place; returns the log rows.
+    """
+    return _move(medication, log_type, lambda previous: quantity_change, performed_by, notes, timestamp, using,
+                 lot=lot, expiration_date=expiration_date, lot_number=lot_number)
+
+
+def set_quantity(medication, new_quantity, log_type='ADJUSTMENT', performed_by=None, notes='', using=DEFAULT_DB_ALIAS):
+    """Stock count correction: books the difference to the counted quantity (FEFO when it is a loss)"""
+    if new_quantity < 0:
+        raise InsufficientStock('Quantity cannot be negative')
+    return _move(medication, log_type, lambda previous: new_quantity - previous, performed_by, notes, None, using)
+
+
+def lot_summaries():
+    """
+    {medication_id: {'next_expiry', 'next_quantity', 'lots'}} for the
+    selection page, cached per inventory version (every lot change moves
+    its medication's stock, which bumps the version).
+    """
+    def build():
+        summaries = {}
+        lots = MedicationLot.objects.filter(quantity__gt=0).order_by('medication_id', *FEFO_ORDER)
+        for lot in lots.values('medication_id', 'expiration_date', 'quantity'):
+            summary = summaries.get(lot['medication_id'])
+            if summary is None:
+                summaries[lot['medication_id']] = {
+                    'next_expiry': lot['expiration_date'],
+                    'next_quantity': lot['quantity'],
+                    'lots': 1,
+                }
+                continue
+            summary['lots'] += 1
+            if lot['expiration_date'] == summary['next_expiry']:
+                summary['next_quantity'] += lot['quantity']
+        return summaries
+    return get_cached_payload('lots', build)
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+def _levels(when, medication_ids, use_snapshots, using):
+    medications = Medication.objects.using(using).order_by()
+    if medication_ids is not None:
+        medications = medications.filter(pk__in=medication_ids)
+
+    if use_snapshots:
+        latest = StockSnapshot.objects.using(using).filter(
+            medication=OuterRef('pk'), as_of__lte=when
+        ).order_by('-as_of')
+        medications = medications.annotate(
+            base_at=Coalesce(Subquery(latest.values('as_of')[:1]), Value(EPOCH, output_field=DateTimeField())),
+            base=Coalesce(Subquery(latest.values('quantity')[:1]), 0),
+        )
+    else:
+        medications = medications.annotate(base_at=Value(EPOCH, output_field=DateTimeField()), base=Value(0))
+
+    tail = InventoryLog.objects.using(using).filter(
+        medication=OuterRef('pk'), timestamp__gt=OuterRef('base_at'), timestamp__lte=when
+    ).order_by().values('medication')
+    return medications.annotate(
+        tail=Coalesce(Subquery(tail.annotate(total=Sum('quantity_change')).values('total'),
+                               output_field=IntegerField()), 0),
+        tail_entries=Coalesce(Subquery(tail.annotate(n=Count('id')).values('n'),
+                                       output_field=IntegerField()), 0),
+    )
+
+
+def stock_levels(when=None, medication_ids=None, use_snapshots=True, using=DEFAULT_DB_ALIAS):
+    """
+    {medication_id: stock at `when` (default now)} from the ledger alone, in
+    one query: each medication's latest snapshot at or before `when` plus
+    the sum of its log tail after that. use_snapshots=False sums the whole
+    history (what the consistency check compares snapshots against).
+    """
+    when = when or timezone.now()
+    return {
+        row['id']: row['base'] + row['tail']
+        for row in _levels(when, medication_ids, use_snapshots, using).values('id', 'base', 'tail')
+    }
+
+
+def stock_at(medication, when, using=DEFAULT_DB_ALIAS):
+    return stock_levels(when, [medication.pk], using=using).get(medication.pk, 0)
+
+
+# ============================================================================
+# SNAPSHOTS AND CHECKS
+# ============================================================================
+
+def take_snapshots(when=None, min_tail=1, using=DEFAULT_DB_ALIAS):
+    """
+    Checkpoint every medication whose log tail since its last snapshot has
+    at least `min_tail` entries. Two queries whatever the number of
+    medications; returns the number of snapshots written.
+    """
+    when = when or timezone.now() - SNAPSHOT_SETTLE
+    rows = _levels(when, None, True, using).filter(tail_entries__gte=min_tail).values('id', 'base', 'tail')
+    snapshots = [
+        StockSnapshot(medication_id=row['id'], as_of=when, quantity=row['base'] + row['tail'])
+        for row in rows
+    ]
+    StockSnapshot.objects.using(using).bulk_create(
+        snapshots, update_conflicts=True, unique_fields=['medication', 'as_of'], update_fields=['quantity'],
+    )
+    return len(snapshots)
+
+
+def check_consistency(using=DEFAULT_DB_ALIAS):
+    """
+    Bulk consistency check, a handful of queries in total:
+      projection - Medication.current_quantity that differs from the ledger
+      snapshots  - snapshots whose quantity differs from the full log sum at as_of
+      chain      - logs whose previous + change != new
+      lots       - medications whose lots don't add up to current_quantity
+    Returns {check: [finding dicts]}.
+    """
+    ledger = stock_levels(use_snapshots=False, using=using)
+    projection = [
+        {'medication_id': pk, 'name': name, 'current_quantity': current, 'ledger': ledger.get(pk, 0)}
+        for pk, name, current in Medication.objects.using(using).values_list('id', 'name', 'current_quantity')
+        if current != ledger.get(pk, 0)
+    ]
+
+    history = InventoryLog.objects.using(using).filter(
+        medication=OuterRef('medication'), timestamp__lte=OuterRef('as_of')
+    ).order_by().values('medication').annotate(total=Sum('quantity_change')).values('total')
+    snapshots = [
+        {'snapshot_id': pk, 'medication_id': med_id, 'as_of': as_of.isoformat(), 'quantity': quantity, 'ledger': actual}
+        for pk, med_id, as_of, quantity, actual in StockSnapshot.objects.using(using).annotate(
+            actual=Coalesce(Subquery(history, output_field=IntegerField()), 0)
+        ).exclude(quantity=F('actual')).values_list('id', 'medication_id', 'as_of', 'quantity', 'actual')
+    ]
+
+    chain = list(
+        InventoryLog.objects.using(using).exclude(
+            new_quantity=F('previous_quantity') + F('quantity_change')
+        ).order_by('id').values('id', 'medication_id', 'previous_quantity', 'quantity_change', 'new_quantity')
+    )
+    in_lots = dict(
+        MedicationLot.objects.using(using).order_by().values('medication_id')
+        .annotate(total=Sum('quantity')).values_list('medication_id', 'total')
+    )
+    lots = [
+        {'medication_id': pk, 'name': name, 'current_quantity': current, 'in_lots': in_lots.get(pk, 0)}
+        for pk, name, current in Medication.objects.using(using).values_list('id', 'name', 'current_quantity')
+        if current != in_lots.get(pk, 0)
+    ]
+    return {'projection': projection, 'snapshots': snapshots, 'chain': chain, 'lots': lots}
+
+
+def repair_projection(medication_ids=None, using=DEFAULT_DB_ALIAS):
+    """Reset current_quantity to the ledger where they differ; returns the medications fixed"""
+    ledger = stock_levels(medication_ids=medication_ids, use_snapshots=False, using=using)
+    fixed = []
+    with transaction.atomic(using=using):
+        medications = Medication.objects.using(using).select_for_update().filter(pk__in=list(ledger))
+        for medication in medications:
+            if medication.current_quantity != ledger[medication.pk]:
+                medication.current_quantity = ledger[medication.pk]
+                medication.save(using=using, update_fields=['current_quantity', 'status'])
+                fixed.append(medication)
+    return fixed
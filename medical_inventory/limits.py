@@ -0,0 +1,140 @@
+# limits.py - Rolling-window withdrawal limits for MedicationThreshold
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .caching import bump_warnings_version
+from .edge import journal_bulk_create
+from .models import Astronaut, MedicationThreshold, WarningLog, WithdrawalCounter
+
+BUCKET = timedelta(hours=1)
+WINDOW = timedelta(hours=24)
+# Buckets older than this can never be in a window again
+RETENTION = WINDOW + BUCKET
+
+
+def bucket_start(when):
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def window_start(now):
+    """
+    First bucket overlapping the rolling 24h window. The oldest bucket is
+    counted whole, so the window covers 24-25h and a limit is never
+    under-counted at the hour edge.
+    """
+    return bucket_start(now - WINDOW)
+
+
+def rolling_totals(astronaut, medication_ids, now=None):
+    """{medication_id: units withdrawn in the last 24h} from at most 25 buckets each"""
+    now = now or timezone.now()
+    rows = WithdrawalCounter.objects.filter(
+        astronaut=astronaut,
+        medication_id__in=medication_ids,
+        bucket_start__gte=window_start(now),
+    ).values('medication_id').annotate(total=Sum('quantity'))
+    return {row['medication_id']: row['total'] for row in rows}
+
+
+def evaluate_withdrawals(astronaut, items, thresholds, totals):
+    """
+    Unsaved WarningLog rows for [(medication, quantity)] given thresholds
+    {medication_id: MedicationThreshold} and rolling totals before this checkout.
+    """
+    totals = defaultdict(int, totals)
+    warnings = []
+    for medication, quantity in items:
+        threshold = thresholds.get(medication.id)
+        if threshold is None:
+            continue
+
+        if quantity > threshold.single_dose_limit:
+            severity = 'CRITICAL' if quantity > threshold.single_dose_limit * 1.5 else 'HIGH'
+            warnings.append(WarningLog(
+                astronaut=astronaut,
+                medication=medication,
+                quantity_taken=quantity,
+                warning_message=f"Single dose limit exceeded: {quantity} units (limit: {threshold.single_dose_limit})",
+                severity=severity,
+            ))
+
+        totals[medication.id] += quantity
+        total = totals[medication.id]
+        if total > threshold.daily_limit:
+            warnings.append(WarningLog(
+                astronaut=astronaut,
+                medication=medication,
+                quantity_taken=quantity,
+                warning_message=f"Daily limit exceeded: {total} units in 24h (limit: {threshold.daily_limit})",
+                severity='CRITICAL',
+            ))
+        elif total * 100 >= threshold.daily_limit * threshold.warning_percentage:
+            warnings.append(WarningLog(
+                astronaut=astronaut,
+                medication=medication,
+                quantity_taken=quantity,
+                warning_message=f"Approaching daily limit: {total} units in 24h (limit: {threshold.daily_limit})",
+                severity='MEDIUM',
+            ))
+    return warnings
+
+
+def record_withdrawals(astronaut, items, now=None):
+    """Add this checkout to the current hour's buckets and prune expired ones"""
+    now = now or timezone.now()
+    current = bucket_start(now)
+    quantities = defaultdict(int)
+    for medication, quantity in items:
+        quantities[medication.id] += quantity
+
+    for medication_id, quantity in quantities.items():
+        bucket = WithdrawalCounter.objects.filter(
+            astronaut=astronaut, medication_id=medication_id, bucket_start=current
+        )
+        if bucket.update(quantity=F('quantity') + quantity):
+            continue
+        try:
+            with transaction.atomic():
+                WithdrawalCounter.objects.create(
+                    astronaut=astronaut, medication_id=medication_id,
+                    bucket_start=current, quantity=quantity,
+                )
+        except IntegrityError:
+            # Another checkout created this hour's bucket first
+            bucket.update(quantity=F('quantity') + quantity)
+
+    WithdrawalCounter.objects.filter(
+        astronaut=astronaut,
+        medication_id__in=list(quantities),
+        bucket_start__lt=now - RETENTION,
+    ).delete()
+
+
+def apply_checkout_limits(astronaut, items, now=None):
+    """
+    Check [(medication, quantity)] against MedicationThreshold, count the
+    withdrawal and bulk-write any WarningLog rows. Call inside the checkout
+    transaction; returns the warnings. One query for thresholds and one for
+    counters regardless of the number of line items.
+    """
+    now = now or timezone.now()
+    # Serialise checkouts per astronaut so two terminals can't both slip under the limit
+    Astronaut.objects.select_for_update().only('id').get(pk=astronaut.pk)
+
+    medication_ids = {medication.id for medication, _quantity in items}
+    thresholds = {
+        t.medication_id: t for t in MedicationThreshold.objects.filter(medication_id__in=medication_ids)
+    }
+    totals = rolling_totals(astronaut, list(thresholds), now) if thresholds else {}
+
+    warnings = evaluate_withdrawals(astronaut, items, thresholds, totals)
+    record_withdrawals(astronaut, items, now)
+    if warnings:
+        WarningLog.objects.bulk_create(warnings)
+        journal_bulk_create(warnings)
+        transaction.on_commit(bump_warnings_version)
+    return warnings
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from medical_inventory.models import DailyInventorySnapshot
+from medical_inventory.snapshots import build_snapshots, save_snapshots
+from datetime import datetime, time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DailyInventorySnapshot rows from the existing InventoryLog history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days on or after this date (YYYY-MM-DD)')
+        parser.add_argument('--medication', type=int, action='append', dest='medications',
+                            help='Only rebuild this medication ID (repeatable)')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete the selected snapshot rows before rebuilding')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since_date = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since must be YYYY-MM-DD')
+            # Whole days only, otherwise a partial day would overwrite a full snapshot
+            since = timezone.make_aware(datetime.combine(since_date, time.min))
+
+        self.stdout.write('Aggregating inventory log...')
+        snapshots = build_snapshots(since=since, medication_ids=options['medications'])
+
+        with transaction.atomic():
+            if options['clear']:
+                existing = DailyInventorySnapshot.objects.all()
+                if since:
+                    existing = existing.filter(date__gte=since.date())
+                if options['medications']:
+                    existing = existing.filter(medication_id__in=options['medications'])
+                deleted, _ = existing.delete()
+                self.stdout.write(f'Removed {deleted} existing snapshot rows')
+            save_snapshots(snapshots, batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Wrote {len(snapshots)} daily snapshot rows'))
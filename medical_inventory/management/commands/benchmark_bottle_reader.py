@@ -0,0 +1,189 @@
+from django.core.management.base import BaseCommand, CommandError
+from medical_inventory.models import Medication
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+import numpy as np
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import time
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def percentile_summary(values):
+    """p50/p95/mean of a list of millisecond timings"""
+    if not values:
+        return {'p50': None, 'p95': None, 'mean': None, 'count': 0}
+    arr = np.asarray(values, dtype=float)
+    return {
+        'p50': round(float(np.percentile(arr, 50)), 2),
+        'p95': round(float(np.percentile(arr, 95)), 2),
+        'mean': round(float(arr.mean()), 2),
+        'count': int(arr.size),
+    }
+
+
+def load_corpus(corpus_dir, labels_path=None):
+    """
+    Collect (image_path, expected_medication_name) pairs.
+    Uses a labels CSV (filename,medication) if present, otherwise the name
+    of the sub-directory each image lives in is the expected medication.
+    """
+    labels_path = labels_path or os.path.join(corpus_dir, 'labels.csv')
+    samples = []
+
+    if os.path.exists(labels_path):
+        with open(labels_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                image_path = row['filename']
+                if not os.path.isabs(image_path):
+                    image_path = os.path.join(corpus_dir, image_path)
+                samples.append((image_path, row['medication'].strip()))
+        return samples
+
+    for root, _dirs, files in os.walk(corpus_dir):
+        if os.path.abspath(root) == os.path.abspath(corpus_dir):
+            continue
+        label = os.path.basename(root)
+        for filename in sorted(files):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(root, filename), label))
+    return samples
+
+
+def render_synthetic_label(medication, path, rng):
+    """Render a pharmacy-style bottle label for a medication with mild camera noise"""
+    width, height = 1200, 700
+    label = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(label)
+    title_font = ImageFont.load_default(size=72)
+    body_font = ImageFont.load_default(size=40)
+
+    draw.rectangle([20, 20, width - 20, height - 20], outline='black', width=4)
+    draw.text((60, 60), medication.name.upper(), fill='black', font=title_font)
+    y = 180
+    if medication.generic_name:
+        draw.text((60, y), f'({medication.generic_name})', fill='black', font=body_font)
+        y += 70
+    draw.text((60, y), f'{medication.dosage}', fill='black', font=body_font)
+    draw.text((60, y + 70), 'Take 1 tablet by mouth as directed', fill='black', font=body_font)
+    draw.text((60, y + 140), f'LOT {rng.randint(10000, 99999)}  QTY {rng.randint(10, 120)}', fill='black', font=body_font)
+
+    label = label.rotate(rng.uniform(-4, 4), expand=True, fillcolor=(200, 200, 200))
+    label = label.filter(ImageFilter.GaussianBlur(rng.uniform(0, 1.2)))
+    pixels = np.asarray(label, dtype=np.int16)
+    noise = np.random.default_rng(rng.randint(0, 2**31)).normal(0, 8, pixels.shape)
+    Image.fromarray(np.clip(pixels + noise, 0, 255).astype(np.uint8)).save(path, quality=85)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the bottle reader OCR pipeline (per-stage timing, latency percentiles, top-1/top-3 accuracy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('corpus_dir', nargs='?', help='Directory of labelled bottle images')
+        parser.add_argument('--labels', help='CSV with filename,medication columns (default: <corpus_dir>/labels.csv)')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Render this many synthetic labels per medication in the database')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for synthetic label rendering')
+        parser.add_argument('--repeat', type=int, default=1, help='Run every image this many times')
+        parser.add_argument('--backend', choices=['auto', 'tesserocr', 'pytesseract'],
+                            help='Override settings.OCR_BACKEND for this run')
+        parser.add_argument('--per-image', action='store_true', help='Include per-image results in the report')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        from django.conf import settings
+        from medical_inventory import ocr
+        from medical_inventory.views import PillBottleReader
+
+        if options['backend']:
+            settings.OCR_BACKEND = options['backend']
+            ocr.set_ocr_backend(None)
+
+        samples = []
+        if options['corpus_dir']:
+            if not os.path.isdir(options['corpus_dir']):
+                raise CommandError(f"Corpus directory not found: {options['corpus_dir']}")
+            samples.extend(load_corpus(options['corpus_dir'], options['labels']))
+
+        with tempfile.TemporaryDirectory(prefix='bottle_bench_') as synth_dir:
+            if options['synthetic']:
+                rng = random.Random(options['seed'])
+                for med in Medication.objects.only('id', 'name', 'generic_name', 'dosage').order_by('id'):
+                    for i in range(options['synthetic']):
+                        path = os.path.join(synth_dir, f'med{med.id}_{i}.jpg')
+                        render_synthetic_label(med, path, rng)
+                        samples.append((path, med.name))
+
+            if not samples:
+                raise CommandError('No images to benchmark: pass a corpus directory and/or --synthetic N')
+
+            reader = PillBottleReader()
+            report = self.run(reader, samples, options['repeat'], options['per_image'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ {report['runs']} runs, top-1 {report['accuracy']['top1']:.1%}, "
+                f"p95 {report['latency_ms']['p95']} ms -> {options['output']}"
+            ))
+        else:
+            self.stdout.write(output)
+
+    def run(self, reader, samples, repeat, per_image):
+        latencies = []
+        stage_samples = {}
+        top1 = top3 = runs = 0
+        results = []
+
+        for image_path, expected in samples:
+            for _ in range(repeat):
+                timings = {}
+                start = time.perf_counter()
+                # The pipeline is chatty on stdout; keep the report clean
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = reader.process_bottle_image(image_path, timings=timings)
+                elapsed = (time.perf_counter() - start) * 1000
+
+                ranked = [m['name'] for m in result.get('all_matches', [])]
+                hit1 = bool(ranked) and ranked[0].lower() == expected.lower()
+                hit3 = any(name.lower() == expected.lower() for name in ranked[:3])
+
+                runs += 1
+                top1 += hit1
+                top3 += hit3
+                latencies.append(elapsed)
+                for stage, ms in timings.items():
+                    stage_samples.setdefault(stage, []).append(ms)
+
+                if per_image:
+                    results.append({
+                        'image': image_path,
+                        'expected': expected,
+                        'predicted': ranked[:3],
+                        'top1': hit1,
+                        'top3': hit3,
+                        'latency_ms': round(elapsed, 2),
+                        'stages_ms': {k: round(v, 2) for k, v in timings.items()},
+                    })
+
+        report = {
+            'backend': reader.ocr.name,
+            'images': len(samples),
+            'runs': runs,
+            'latency_ms': percentile_summary(latencies),
+            'stages_ms': {stage: percentile_summary(values) for stage, values in stage_samples.items()},
+            'accuracy': {
+                'top1': top1 / runs if runs else 0.0,
+                'top3': top3 / runs if runs else 0.0,
+            },
+        }
+        if per_image:
+            report['results'] = results
+        return report
@@ -0,0 +1,191 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.handlers.wsgi import WSGIHandler
+from django.contrib.auth.models import User
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from medical_inventory.caching import bump_inventory_version
+from medical_inventory.management.commands.benchmark_bottle_reader import percentile_summary
+from wsgiref.util import setup_testing_defaults
+import copy
+import io
+import json
+import time
+
+STRATEGIES = ('none', 'persistent', 'persistent-unchecked', 'pool')
+
+
+def apply_strategy(connection, strategy, base_settings, max_age):
+    """Reconfigure a connection alias in-process; takes effect on its next connect"""
+    connection.close()
+    if getattr(connection, 'pool', None):
+        connection.close_pool()
+
+    settings_dict = connection.settings_dict
+    settings_dict.clear()
+    settings_dict.update(copy.deepcopy(base_settings))
+    settings_dict['OPTIONS'].pop('pool', None)
+
+    if strategy == 'none':
+        settings_dict['CONN_MAX_AGE'] = 0
+        settings_dict['CONN_HEALTH_CHECKS'] = False
+    elif strategy == 'persistent':
+        settings_dict['CONN_MAX_AGE'] = max_age
+        settings_dict['CONN_HEALTH_CHECKS'] = True
+    elif strategy == 'persistent-unchecked':
+        settings_dict['CONN_MAX_AGE'] = max_age
+        settings_dict['CONN_HEALTH_CHECKS'] = False
+    elif strategy == 'pool':
+        settings_dict['CONN_MAX_AGE'] = 0
+        settings_dict['CONN_HEALTH_CHECKS'] = False
+        settings_dict['OPTIONS']['pool'] = base_settings['OPTIONS'].get('pool') or {'min_size': 1, 'max_size': 2}
+
+
+def pool_unavailable(connection):
+    """Why the pool strategy can't run here, or None"""
+    if connection.vendor != 'postgresql':
+        return f'{connection.vendor} has no connection pool'
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return 'psycopg[pool] is not installed'
+    return None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark per-request latency of each database connection strategy (see DB_CONN_STRATEGY)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='URL to request (repeatable; default: medication list and inventory dashboard)')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per path per strategy')
+        parser.add_argument('--strategy', action='append', dest='strategies', choices=STRATEGIES,
+                            help='Strategy to measure (repeatable; default: all)')
+        parser.add_argument('--max-age', type=int, default=600, help='CONN_MAX_AGE for the persistent strategies')
+        parser.add_argument('--user', help='Username to log in as (default: first staff user)')
+        parser.add_argument('--warm-cache', action='store_true',
+                            help='Keep response caches between requests (default invalidates them so every request hits the database)')
+        parser.add_argument('--database', default='default', help='Database alias to reconfigure')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        base_settings = copy.deepcopy(connection.settings_dict)
+        paths = options['paths'] or [
+            reverse('medical_inventory:list_medications'),
+            reverse('medical_inventory:inventory_dashboard'),
+        ]
+        cookie = self.session_cookie(options['user'])
+
+        handler = WSGIHandler()
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count_connection)
+        report = {
+            'vendor': connection.vendor,
+            'host': base_settings.get('HOST') or base_settings.get('NAME'),
+            'requests_per_path': options['requests'],
+            'strategies': {},
+        }
+        try:
+            for strategy in options['strategies'] or STRATEGIES:
+                reason = pool_unavailable(connection) if strategy == 'pool' else None
+                if reason:
+                    report['strategies'][strategy] = {'skipped': reason}
+                    continue
+
+                apply_strategy(connection, strategy, base_settings, options['max_age'])
+                report['strategies'][strategy] = self.run(
+                    handler, connection, paths, options['requests'], cookie, options['warm_cache'], opened
+                )
+        finally:
+            connection_created.disconnect(count_connection)
+            apply_strategy(connection, 'none', base_settings, 0)
+            connection.settings_dict.clear()
+            connection.settings_dict.update(base_settings)
+
+        baseline = report['strategies'].get('none', {}).get('latency_ms', {}).get('mean')
+        for result in report['strategies'].values():
+            if baseline is not None and 'latency_ms' in result:
+                result['saved_ms_per_request'] = round(baseline - result['latency_ms']['mean'], 2)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            for strategy, result in report['strategies'].items():
+                if 'skipped' in result:
+                    self.stdout.write(f"  {strategy:<22} skipped: {result['skipped']}")
+                else:
+                    self.stdout.write(
+                        f"  {strategy:<22} p50 {result['latency_ms']['p50']} ms, "
+                        f"{result['connections_opened']} connections"
+                    )
+            self.stdout.write(self.style.SUCCESS(f"✓ Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def session_cookie(self, username):
+        """Session cookie for a real login so login-required views do their normal work"""
+        users = User.objects.filter(username=username) if username else User.objects.filter(is_staff=True)
+        user = users.order_by('id').first()
+        if user is None:
+            if username:
+                raise CommandError(f'User {username} not found')
+            return ''
+        client = Client()
+        client.force_login(user)
+        return '; '.join(f'{key}={morsel.value}' for key, morsel in client.cookies.items())
+
+    def run(self, handler, connection, paths, count, cookie, warm_cache, opened):
+        # Fresh-connection cost on its own: handshake, auth, session setup
+        connect_times = []
+        for _ in range(min(count, 10)):
+            connection.close()
+            start = time.perf_counter()
+            connection.ensure_connection()
+            connect_times.append((time.perf_counter() - start) * 1000)
+        connection.close()
+
+        del opened[:]
+        latencies = []
+        per_path = {}
+        for path in paths:
+            timings = []
+            for _ in range(count):
+                if not warm_cache:
+                    # A new inventory version misses every cached payload; never
+                    # cache.clear(), which would flush a shared Redis cache
+                    bump_inventory_version()
+                environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'HTTP_COOKIE': cookie}
+                setup_testing_defaults(environ)
+                environ['wsgi.input'] = io.BytesIO()
+                statuses = []
+
+                start = time.perf_counter()
+                # The handler fires request_started/request_finished, which is where
+                # Django decides whether to keep or close the connection
+                response = handler(environ, lambda status, headers, *args: statuses.append(status))
+                for _chunk in response:
+                    pass
+                response.close()
+                elapsed = (time.perf_counter() - start) * 1000
+
+                if not statuses[0].startswith('2'):
+                    # A login redirect would only measure the redirect
+                    raise CommandError(f'{path} returned {statuses[0]} (pass --user for login-only pages)')
+                timings.append(elapsed)
+            per_path[path] = percentile_summary(timings)
+            latencies.extend(timings)
+
+        return {
+            'connect_ms': percentile_summary(connect_times),
+            'latency_ms': percentile_summary(latencies),
+            'paths': per_path,
+            'connections_opened': len(opened),
+        }
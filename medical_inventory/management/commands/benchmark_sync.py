@@ -0,0 +1,125 @@
+from django.core.management.base import BaseCommand, CommandError
+from medical_inventory.sync import CODECS, MAX_CHANGE_BATCH_SIZE, changes_since, decode_payload, encode_payload, latest_sequence
+import json
+import random
+import time
+
+# Request line, headers and TLS record overhead per round trip, roughly
+REQUEST_OVERHEAD_BYTES = 600
+
+
+class Link:
+    """A simulated link: bandwidth, round-trip latency and a chance of losing any transfer"""
+
+    def __init__(self, kbps, latency_ms, loss, seed):
+        self.bytes_per_second = kbps * 1000 / 8
+        self.latency = latency_ms / 1000
+        self.loss = loss
+        self.random = random.Random(seed)
+
+    def transfer(self, size):
+        """Seconds to get `size` bytes across, retrying lost attempts; returns (seconds, attempts)"""
+        full = self.latency + (size + REQUEST_OVERHEAD_BYTES) / self.bytes_per_second
+        seconds, attempts = 0.0, 1
+        while self.random.random() < self.loss:
+            # Dropped part-way through: that much is wasted, then the same batch is asked for again
+            seconds += self.latency + self.random.random() * (full - self.latency)
+            attempts += 1
+        return seconds + full, attempts
+
+
+class Command(BaseCommand):
+    help = 'Measure delta sync throughput per encoding and batch size over a simulated slow, high-latency link'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=0,
+                            help='Start from this change sequence number (default 0: a full initial sync)')
+        parser.add_argument('--batch-size', type=int, action='append', dest='batch_sizes',
+                            help='Changes per batch (repeatable; default 100, 500 and 2000)')
+        parser.add_argument('--encoding', action='append', dest='encodings', choices=sorted(CODECS),
+                            help='Payload encoding (repeatable; default: all)')
+        parser.add_argument('--bandwidth-kbps', type=float, default=64, help='Link bandwidth in kbit/s')
+        parser.add_argument('--latency-ms', type=float, default=600, help='Round-trip time in ms')
+        parser.add_argument('--loss', type=float, default=0.0, help='Probability that a transfer is dropped (0-1)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        batch_sizes = options['batch_sizes'] or [100, 500, 2000]
+        if any(size < 1 or size > MAX_CHANGE_BATCH_SIZE for size in batch_sizes):
+            raise CommandError(f'Batch sizes must be between 1 and {MAX_CHANGE_BATCH_SIZE}')
+        if not 0 <= options['loss'] < 1:
+            raise CommandError('--loss must be in [0, 1)')
+        latest = latest_sequence()
+        if options['since'] >= latest:
+            raise CommandError(f'Nothing to sync after change {options["since"]} (latest is {latest})')
+
+        report = {
+            'link': {
+                'bandwidth_kbps': options['bandwidth_kbps'],
+                'latency_ms': options['latency_ms'],
+                'loss': options['loss'],
+            },
+            'since': options['since'],
+            'latest': latest,
+            'runs': [],
+        }
+        for codec in options['encodings'] or sorted(CODECS):
+            for batch_size in batch_sizes:
+                link = Link(options['bandwidth_kbps'], options['latency_ms'], options['loss'], options['seed'])
+                report['runs'].append(self.run(link, codec, batch_size, options['since']))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            for run in report['runs']:
+                self.stdout.write(
+                    f"  {run['encoding']:<5} x{run['batch_size']:<5} {run['bytes']:>10} B  "
+                    f"{run['simulated_seconds']:>8.1f} s  {run['changes_per_second']:>8.1f} changes/s"
+                )
+            self.stdout.write(self.style.SUCCESS(f"✓ Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def run(self, link, codec, batch_size, since):
+        cursor = since
+        batches = changes = rows = size = attempts = 0
+        server = client = simulated = 0.0
+        while True:
+            start = time.perf_counter()
+            payload = changes_since(cursor, batch_size)
+            body = encode_payload(payload, codec)
+            server += time.perf_counter() - start
+
+            seconds, tries = link.transfer(len(body))
+            simulated += seconds
+            attempts += tries
+
+            start = time.perf_counter()
+            decode_payload(body, codec)
+            client += time.perf_counter() - start
+
+            batches += 1
+            changes += payload['count']
+            rows += sum(len(block['rows']) for block in payload['models'].values())
+            size += len(body)
+            cursor = payload['cursor']
+            if not payload['more']:
+                break
+
+        total = simulated + server + client
+        return {
+            'encoding': codec,
+            'batch_size': batch_size,
+            'batches': batches,
+            'attempts': attempts,
+            'changes': changes,
+            'rows': rows,
+            'bytes': size,
+            'bytes_per_change': round(size / changes, 1) if changes else 0,
+            'server_ms': round(server * 1000, 1),
+            'client_decode_ms': round(client * 1000, 1),
+            'simulated_seconds': round(total, 2),
+            'changes_per_second': round(changes / total, 1) if total else 0,
+        }
@@ -0,0 +1,154 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import transaction
+from medical_inventory.models import Astronaut
+from medical_inventory.caching import bump_face_index_version
+from medical_inventory.faces import IMAGE_EXTENSIONS, encode_face_files
+from medical_inventory.photos import set_astronaut_photo
+from medical_inventory.sync import record_changes
+from collections import Counter
+import csv
+import os
+import pickle
+import time
+
+
+class Command(BaseCommand):
+    help = 'Enroll faces for many astronauts at once from a photo directory or CSV manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help=(
+            'Directory of <astronaut_id>.jpg photos, or a CSV manifest with columns '
+            'astronaut_id,image[,name,password] (image paths relative to the CSV; '
+            'astronauts created without a password can only log in by face)'
+        ))
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Encoding processes (default: one per CPU core)')
+        parser.add_argument('--create', action='store_true',
+                            help='Create astronauts (and logins) that do not exist yet')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Encode and report without writing anything')
+
+    def handle(self, *args, **options):
+        entries = self.load_entries(options['source'])
+        if not entries:
+            raise CommandError(f'No images found in {options["source"]}')
+
+        failures = []
+        existing = {
+            a.astronaut_id: a
+            for a in Astronaut.objects.filter(astronaut_id__in=[e['astronaut_id'] for e in entries])
+        }
+        todo = []
+        for entry in entries:
+            if not os.path.isfile(entry['image']):
+                failures.append((entry, 'image file not found'))
+            elif entry['astronaut_id'] not in existing and not options['create']:
+                failures.append((entry, 'unknown astronaut (use --create)'))
+            else:
+                todo.append(entry)
+
+        workers = max(1, min(options['workers'] or os.cpu_count() or 1, len(todo)))
+        self.stdout.write(f'Encoding {len(todo)} images on {workers} worker processes...')
+        start = time.perf_counter()
+        encoded = []
+        for entry, result in zip(todo, encode_face_files([e['image'] for e in todo], workers)):
+            if result['error']:
+                failures.append((entry, result['error']))
+            else:
+                encoded.append((entry, result['encoding']))
+        self.stdout.write(f'Encoded in {time.perf_counter() - start:.1f}s')
+
+        created = 0
+        if encoded and not options['dry_run']:
+            # All or nothing: a half-enrolled crew is worse than re-running the command
+            written = []
+            try:
+                with transaction.atomic():
+                    updated = []
+                    for entry, encoding in encoded:
+                        astronaut = existing.get(entry['astronaut_id'])
+                        if astronaut is None:
+                            user = User.objects.create_user(
+                                username=entry['astronaut_id'],
+                                # No password in the manifest: face login only (unusable password)
+                                password=entry['password'] or None,
+                                first_name=entry['name'].split()[0] if entry['name'] else '',
+                                last_name=' '.join(entry['name'].split()[1:]),
+                            )
+                            astronaut = Astronaut.objects.create(
+                                user=user,
+                                astronaut_id=entry['astronaut_id'],
+                                name=entry['name'] or entry['astronaut_id'],
+                            )
+                            existing[astronaut.astronaut_id] = astronaut
+                            created += 1
+
+                        astronaut.face_encoding = pickle.dumps(encoding)
+                        astronaut.enrollment_status = 'READY'
+                        astronaut.enrollment_error = ''
+                        with open(entry['image'], 'rb') as f:
+                            set_astronaut_photo(astronaut, f.read(), save=False)
+                        written += [astronaut.photo.name, astronaut.photo_thumbnail.name]
+                        updated.append(astronaut)
+
+                    Astronaut.objects.bulk_update(updated, [
+                        'face_encoding', 'enrollment_status', 'enrollment_error', 'photo', 'photo_thumbnail',
+                    ])
+                    # bulk_update sends no signals
+                    transaction.on_commit(bump_face_index_version)
+                    record_changes(Astronaut, [astronaut.pk for astronaut in updated])
+            except BaseException:
+                # Files aren't rolled back with the rows; remove the ones nothing points at now
+                storage = Astronaut._meta.get_field('photo').storage
+                for name in written:
+                    storage.delete(name)
+                raise
+
+        self.print_summary(encoded, created, failures, options['dry_run'])
+
+    def load_entries(self, source):
+        if os.path.isdir(source):
+            return [
+                {
+                    'astronaut_id': os.path.splitext(name)[0],
+                    'image': os.path.join(source, name),
+                    'name': '',
+                    'password': '',
+                }
+                for name in sorted(os.listdir(source))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            ]
+
+        if not os.path.isfile(source):
+            raise CommandError(f'{source} is not a directory or CSV file')
+        base_dir = os.path.dirname(os.path.abspath(source))
+        entries = []
+        with open(source, newline='', encoding='utf-8-sig') as f:
+            reader = csv.DictReader(f)
+            if not {'astronaut_id', 'image'} <= set(reader.fieldnames or []):
+                raise CommandError('Manifest needs astronaut_id and image columns')
+            for row in reader:
+                if not (row.get('astronaut_id') or '').strip():
+                    continue
+                entries.append({
+                    'astronaut_id': row['astronaut_id'].strip(),
+                    'image': os.path.join(base_dir, row['image'].strip()),
+                    'name': (row.get('name') or '').strip(),
+                    'password': (row.get('password') or '').strip(),
+                })
+        return entries
+
+    def print_summary(self, encoded, created, failures, dry_run):
+        prefix = 'Would enroll' if dry_run else '✓ Enrolled'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {len(encoded)} astronauts ({created} new)'
+        ))
+        if not failures:
+            return
+
+        self.stdout.write(self.style.WARNING(f'{len(failures)} images failed:'))
+        for entry, reason in failures:
+            self.stdout.write(f'  {entry["astronaut_id"]:<15} {os.path.basename(entry["image"]):<30} {reason}')
+        by_reason = Counter(reason.split(' (')[0] for _entry, reason in failures)
+        self.stdout.write('  ' + ', '.join(f'{reason}: {count}' for reason, count in by_reason.most_common()))
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from medical_inventory.planning import DEFAULT_HORIZON_DAYS, PlanningError, SolverError, parse_cabinets, plan_resupply
+import json
+
+
+class Command(BaseCommand):
+    help = ('Build a resupply manifest: the restock quantities that best cover forecast demand '
+            'within a flight\'s mass/volume budget and each cabinet\'s free space')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mass-g', type=float, help='Upmass budget for medications, in grams')
+        parser.add_argument('--volume-ml', type=float, help='Volume budget for medications, in ml')
+        parser.add_argument('--cabinet', action='append', default=[], metavar='LOCATION=ML',
+                            help='Capacity of one cabinet (container_location) in ml (repeatable)')
+        parser.add_argument('--horizon-days', type=int, default=DEFAULT_HORIZON_DAYS,
+                            help='Days of demand the resupply should cover')
+        parser.add_argument('--json', action='store_true', help='Print the plan as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            plan = plan_resupply(
+                mass_budget_g=options['mass_g'],
+                volume_budget_ml=options['volume_ml'],
+                cabinet_capacity_ml=parse_cabinets(options['cabinet']),
+                horizon_days=options['horizon_days'],
+            )
+        except (PlanningError, SolverError) as e:
+            raise CommandError(str(e))
+
+        if options['json']:
+            self.stdout.write(json.dumps(plan, indent=2))
+            return
+
+        for row in plan['manifest']:
+            before = f"{row['days_of_supply']:.0f}" if row['days_of_supply'] is not None else '-'
+            after = f"{row['days_of_supply_after']:.0f}" if row['days_of_supply_after'] is not None else '-'
+            self.stdout.write(
+                f"  {row['name']:<30} {row['cabinet']:<8} {row['quantity']:>6} units  "
+                f"{row['mass_g']:>8.1f} g {row['volume_ml']:>8.1f} ml  days of supply {before} -> {after}"
+            )
+        for location, cabinet in plan['cabinets'].items():
+            self.stdout.write(f"  cabinet {location}: {cabinet['used_ml']:.0f} of {cabinet['free_ml']:.0f} ml free space used")
+        if plan['unmeasured']:
+            self.stdout.write(self.style.WARNING(
+                f"No unit mass/volume recorded (planned as weightless): {', '.join(plan['unmeasured'])}"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {len(plan['manifest'])} medications, {plan['total_mass_g']:.0f} g, {plan['total_volume_ml']:.0f} ml "
+            f"({plan['status']}, {plan['solve_ms']:.0f} ms); {plan['uncovered_units']} units of demand left uncovered"
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from medical_inventory.enrollment import process_pending_enrollments
+
+
+class Command(BaseCommand):
+    help = 'Run face enrollments still PENDING (e.g. queued before a server restart)'
+
+    def handle(self, *args, **options):
+        count = process_pending_enrollments()
+        self.stdout.write(self.style.SUCCESS(f'✓ Processed {count} pending enrollments'))
@@ -40,6 +40,8 @@ class Command(BaseCommand):
             # Save encoding
             encoding = encodings[0]
             astronaut.face_encoding = pickle.dumps(encoding)
+            astronaut.enrollment_status = 'READY'
+            astronaut.enrollment_error = ''
             astronaut.save()
             
             self.stdout.write(self.style.SUCCESS(f'✓ Face encoding registered for {astronaut.name}'))
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from medical_inventory.ledger import check_consistency, repair_projection, stock_levels, take_snapshots
+from medical_inventory.models import Medication
+import json
+
+
+class Command(BaseCommand):
+    help = ('Stock ledger maintenance: take snapshots (run from cron, e.g. hourly), check the ledger, '
+            'projection, lots and snapshots against each other, or show stock at a point in time')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--snapshot', action='store_true',
+                            help='Checkpoint every medication with ledger entries since its last snapshot')
+        parser.add_argument('--min-tail', type=int, default=1,
+                            help='Only snapshot medications with at least this many new entries')
+        parser.add_argument('--check', action='store_true', help='Run the bulk consistency check (the default)')
+        parser.add_argument('--repair', action='store_true',
+                            help='Reset Medication.current_quantity to the ledger where they differ')
+        parser.add_argument('--at', help='Print every medication\'s stock at this ISO datetime')
+        parser.add_argument('--json', action='store_true', help='Print check findings as JSON')
+
+    def handle(self, *args, **options):
+        if options['snapshot']:
+            written = take_snapshots(min_tail=options['min_tail'])
+            self.stdout.write(self.style.SUCCESS(f'✓ Wrote {written} stock snapshots'))
+
+        if options['at']:
+            when = parse_datetime(options['at'])
+            if when is None:
+                raise CommandError('--at must be an ISO datetime, e.g. 2026-03-01T12:00')
+            if timezone.is_naive(when):
+                when = timezone.make_aware(when)
+            names = dict(Medication.objects.values_list('id', 'name'))
+            for pk, quantity in sorted(stock_levels(when).items()):
+                self.stdout.write(f'  {names.get(pk, pk):<30} {quantity:>6}')
+
+        if options['repair']:
+            fixed = repair_projection()
+            for medication in fixed:
+                self.stdout.write(f'  {medication.name}: current_quantity reset to {medication.current_quantity}')
+            self.stdout.write(self.style.SUCCESS(f'✓ Repaired {len(fixed)} medications'))
+
+        if options['check'] or not (options['snapshot'] or options['at'] or options['repair']):
+            self.check_ledger(options['json'])
+
+    def check_ledger(self, as_json):
+        findings = check_consistency()
+        if as_json:
+            self.stdout.write(json.dumps(findings, indent=2))
+        else:
+            for row in findings['projection']:
+                self.stdout.write(
+                    f"  projection  {row['name']}: current_quantity {row['current_quantity']}, ledger {row['ledger']}"
+                )
+            for row in findings['snapshots']:
+                self.stdout.write(
+                    f"  snapshot    #{row['snapshot_id']} medication {row['medication_id']} at {row['as_of']}: "
+                    f"{row['quantity']}, ledger {row['ledger']}"
+                )
+            for row in findings['chain']:
+                self.stdout.write(
+                    f"  chain       log #{row['id']}: {row['previous_quantity']} + {row['quantity_change']} "
+                    f"!= {row['new_quantity']}"
+                )
+            for row in findings['lots']:
+                self.stdout.write(
+                    f"  lots        {row['name']}: current_quantity {row['current_quantity']}, "
+                    f"lots hold {row['in_lots']}"
+                )
+
+        problems = sum(len(rows) for rows in findings.values())
+        if problems:
+            raise CommandError(f'{problems} ledger inconsistencies (--repair fixes projection drift)')
+        self.stdout.write(self.style.SUCCESS('✓ Ledger, projection, lots and snapshots agree'))
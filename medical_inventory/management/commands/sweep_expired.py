@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import Error
+from django.utils import timezone
+from medical_inventory.edge import edge_enabled
+from medical_inventory.expiry import expired_lots, expiring_soon, sweep_expired, warning_days
+from datetime import datetime
+import time
+
+
+class Command(BaseCommand):
+    help = ('Write off expired stock (EXPIRED inventory logs) and refresh the expiring-soon list; '
+            'run daily from cron, or keep it running with --loop')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Sweep as if today were this date (YYYY-MM-DD)')
+        parser.add_argument('--days', type=int, help='Expiring-soon window in days (default EXPIRY_WARNING_DAYS)')
+        parser.add_argument('--dry-run', action='store_true', help='List expired lots without writing them off')
+        parser.add_argument('--loop', type=int, metavar='SECONDS',
+                            help='Sweep again every SECONDS (in-process scheduler)')
+
+    def handle(self, *args, **options):
+        if edge_enabled():
+            # Written off once, centrally; edge nodes get the result through sync
+            raise CommandError('Run the expiry sweep on the central server, not on an edge node')
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--date must be YYYY-MM-DD')
+
+        while True:
+            try:
+                self.sweep_once(today, options)
+            except Error as e:
+                if not options['loop']:
+                    raise CommandError(f'Expiry sweep failed: {e}')
+                self.stdout.write(self.style.WARNING(f'Expiry sweep failed, retrying: {e}'))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def sweep_once(self, today, options):
+        if options['dry_run']:
+            for lot in expired_lots(today).select_related('medication').order_by('expiration_date'):
+                self.stdout.write(f'  would expire  {lot}: {lot.quantity} units')
+        else:
+            logs = sweep_expired(today)
+            for log in logs:
+                self.stdout.write(f'  expired  {log.medication.name}: {-log.quantity_change} units ({log.notes})')
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {timezone.now():%Y-%m-%d %H:%M}: wrote off {len(logs)} expired lots'
+            ))
+
+        # Also warms the cached list the dashboard reads
+        days = warning_days() if options['days'] is None else options['days']
+        soon = expiring_soon(days)
+        self.stdout.write(f'{len(soon)} lots expire within {days} days')
+        for row in soon:
+            self.stdout.write(f"  {row['expiration_date']:%Y-%m-%d}  {row['name']:<30} {row['quantity']:>6}")
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, Error, connections
+from medical_inventory.edge import (
+    CENTRAL_ALIAS, PUSH_BATCH_SIZE, default_transport, edge_enabled, pending_entries, pull_changes,
+    push_journal, reserve_local_ids,
+)
+from medical_inventory.models import SyncCursor, SyncJournal
+from medical_inventory.sync import CHANGE_BATCH_SIZE
+import requests
+import time
+
+
+class Command(BaseCommand):
+    help = ('Edge mode: push the local write journal upstream and pull central changes since the last sync '
+            '(over the sync API when SYNC_CENTRAL_URL is set, else the central database)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--init', action='store_true',
+                            help='First run on a new kiosk: reserve local id range before the first full pull')
+        parser.add_argument('--push-only', action='store_true', help='Only push the journal')
+        parser.add_argument('--pull-only', action='store_true', help='Only pull central changes')
+        parser.add_argument('--batch-size', type=int, default=PUSH_BATCH_SIZE,
+                            help='Journal entries per central transaction')
+        parser.add_argument('--pull-batch-size', type=int, default=CHANGE_BATCH_SIZE,
+                            help='Changes per pulled batch (smaller batches lose less on a flaky link)')
+        parser.add_argument('--loop', type=int, metavar='SECONDS',
+                            help='Keep syncing every SECONDS; link failures are retried on the next round')
+        parser.add_argument('--status', action='store_true', help='Show journal backlog and exit')
+
+    def handle(self, *args, **options):
+        if not edge_enabled():
+            raise CommandError('EDGE_MODE is off; set EDGE_MODE=True on the kiosk')
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError('Edge mode expects the local database to be SQLite')
+
+        if options['status']:
+            self.print_status()
+            return
+
+        transport = default_transport()
+        if options['init']:
+            try:
+                # A rebuilt kiosk must not reuse journal ids the central server already applied
+                reserve_local_ids(transport.checkpoint())
+            except (Error, requests.RequestException) as e:
+                raise CommandError(f'Central unreachable, cannot initialise: {e}')
+            self.stdout.write(f'Reserved local ids from {settings.EDGE_NODE_ID << 40}')
+
+        while True:
+            try:
+                self.sync_once(transport, options)
+            except (Error, requests.RequestException) as e:
+                # Pulled batches already applied stay applied; the next run resumes from the cursor
+                transport.close()
+                if not options['loop']:
+                    raise CommandError(f'Sync failed, journal kept for next run: {e}')
+                self.stdout.write(self.style.WARNING(f'Central unreachable, retrying: {e}'))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
+
+    def sync_once(self, transport, options):
+        start = time.perf_counter()
+        pushed = pulled = 0
+        if not options['pull_only']:
+            pushed = push_journal(transport, batch_size=options['batch_size'])
+        if not options['push_only']:
+            pulled = pull_changes(transport, batch_size=options['pull_batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Synced in {time.perf_counter() - start:.1f}s: pushed {pushed} journal entries, pulled {pulled} changed rows'
+        ))
+
+    def print_status(self):
+        pending = pending_entries()
+        oldest = pending.order_by('id').first()
+        last = SyncJournal.objects.filter(synced_at__isnull=False).order_by('-synced_at').first()
+        self.stdout.write(f'Node {settings.EDGE_NODE_ID}: {pending.count()} journal entries waiting')
+        if oldest:
+            self.stdout.write(f'  oldest unsynced: {oldest} at {oldest.created_at:%Y-%m-%d %H:%M:%S}')
+        self.stdout.write(f'  last sync: {last.synced_at:%Y-%m-%d %H:%M:%S}' if last else '  never synced')
+        cursor = SyncCursor.objects.filter(source=CENTRAL_ALIAS).first()
+        self.stdout.write(f'  pulled up to change {cursor.seq}' if cursor else '  nothing pulled yet')
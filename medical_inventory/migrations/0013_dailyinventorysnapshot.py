@@ -0,0 +1,34 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0012_accesslog_accesslogitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyInventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('opening_quantity', models.IntegerField()),
+                ('closing_quantity', models.IntegerField()),
+                ('dispensed', models.IntegerField(default=0)),
+                ('restocked', models.IntegerField(default=0)),
+                ('checkouts', models.IntegerField(default=0)),
+                ('first_log_at', models.DateTimeField()),
+                ('last_log_at', models.DateTimeField()),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_snapshots', to='medical_inventory.medication')),
+            ],
+            options={
+                'ordering': ['medication', 'date'],
+                'indexes': [models.Index(fields=['date'], name='medical_inv_date_e49efb_idx')],
+                'constraints': [models.UniqueConstraint(fields=('medication', 'date'), name='unique_medication_snapshot_date')],
+            },
+        ),
+    ]
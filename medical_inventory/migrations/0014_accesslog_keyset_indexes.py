@@ -0,0 +1,25 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0013_dailyinventorysnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['-timestamp', '-id'], name='medical_inv_timesta_187884_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['astronaut', '-timestamp', '-id'], name='medical_inv_astrona_a0de3e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accesslog',
+            index=models.Index(fields=['event_type', '-timestamp', '-id'], name='medical_inv_event_t_fbb70a_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+import base64
+import binascii
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+from PIL import Image, ImageOps
+
+# Frozen copy of photos.render_photo as it was when this migration was
+# written, so later changes to the app module can't change what it does
+PHOTO_MAX_SIZE = (1280, 1280)
+THUMBNAIL_SIZE = (160, 160)
+JPEG_QUALITY = 85
+
+
+def _jpeg(img, size):
+    img = img.copy()
+    img.thumbnail(size)
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def render_photo(data):
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert('RGB')
+    return _jpeg(img, PHOTO_MAX_SIZE), _jpeg(img, THUMBNAIL_SIZE)
+
+
+def photos_to_files(apps, schema_editor):
+    """Decode the old base64 photo column into photo + thumbnail files"""
+    Astronaut = apps.get_model('medical_inventory', 'Astronaut')
+    converted = failed = 0
+    for astronaut in Astronaut.objects.exclude(photo_base64__isnull=True).exclude(photo_base64='').iterator():
+        try:
+            data = astronaut.photo_base64
+            if data.startswith('data:'):
+                data = data.split(',', 1)[1]
+            photo, thumbnail = render_photo(base64.b64decode(data))
+        except (binascii.Error, ValueError, OSError) as e:
+            print(f"  Could not convert photo for {astronaut.astronaut_id}: {e}")
+            failed += 1
+            continue
+
+        filename = f'{astronaut.astronaut_id}-{hashlib.sha1(photo).hexdigest()[:12]}.jpg'
+        astronaut.photo.save(filename, ContentFile(photo), save=False)
+        astronaut.photo_thumbnail.save(filename, ContentFile(thumbnail), save=False)
+        astronaut.save(update_fields=['photo', 'photo_thumbnail'])
+        converted += 1
+
+    if converted or failed:
+        print(f"  Converted {converted} astronaut photos to files ({failed} failed)")
+
+
+def files_to_photos(apps, schema_editor):
+    Astronaut = apps.get_model('medical_inventory', 'Astronaut')
+    for astronaut in Astronaut.objects.exclude(photo='').exclude(photo__isnull=True).iterator():
+        with astronaut.photo.open('rb') as f:
+            astronaut.photo_base64 = base64.b64encode(f.read()).decode('utf-8')
+        astronaut.save(update_fields=['photo_base64'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0014_accesslog_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='astronaut',
+            old_name='photo',
+            new_name='photo_base64',
+        ),
+        migrations.AddField(
+            model_name='astronaut',
+            name='photo',
+            field=models.ImageField(blank=True, null=True, upload_to='astronaut_photos/'),
+        ),
+        migrations.AddField(
+            model_name='astronaut',
+            name='photo_thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='astronaut_photos/thumbs/'),
+        ),
+        migrations.RunPython(photos_to_files, files_to_photos),
+        migrations.RemoveField(
+            model_name='astronaut',
+            name='photo_base64',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0015_astronaut_photo_files'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='astronaut',
+            options={'base_manager_name': 'objects'},
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:17
+
+from django.db import migrations, models
+
+
+def mark_existing_enrollments(apps, schema_editor):
+    Astronaut = apps.get_model('medical_inventory', 'Astronaut')
+    Astronaut.objects.filter(face_encoding__isnull=False).update(enrollment_status='READY')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0016_astronaut_base_manager'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='astronaut',
+            name='enrollment_error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='astronaut',
+            name='enrollment_status',
+            field=models.CharField(choices=[('NONE', 'Not Enrolled'), ('PENDING', 'Pending'), ('READY', 'Enrolled'), ('FAILED', 'Failed')], default='NONE', max_length=10),
+        ),
+        migrations.RunPython(mark_existing_enrollments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:20
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+
+def seed_counters(apps, schema_editor):
+    """Start the rolling windows from the last day of checkouts"""
+    MedicationCheckout = apps.get_model('medical_inventory', 'MedicationCheckout')
+    WithdrawalCounter = apps.get_model('medical_inventory', 'WithdrawalCounter')
+    rows = MedicationCheckout.objects.filter(
+        checkout_time__gte=timezone.now() - timedelta(hours=25)
+    ).annotate(bucket=TruncHour('checkout_time')).values(
+        'astronaut_id', 'medication_id', 'bucket'
+    ).annotate(total=Sum('quantity')).order_by()
+    WithdrawalCounter.objects.bulk_create([
+        WithdrawalCounter(
+            astronaut_id=row['astronaut_id'],
+            medication_id=row['medication_id'],
+            bucket_start=row['bucket'],
+            quantity=row['total'],
+        )
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0017_astronaut_enrollment_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WithdrawalCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('astronaut', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='withdrawal_counters', to='medical_inventory.astronaut')),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='withdrawal_counters', to='medical_inventory.medication')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('astronaut', 'medication', 'bucket_start'), name='unique_withdrawal_bucket')],
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
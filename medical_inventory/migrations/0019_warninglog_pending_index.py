@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0018_withdrawalcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='warninglog',
+            index=models.Index(condition=models.Q(('acknowledged', False)), fields=['-timestamp', '-id'], name='warninglog_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Same order as sync.FEED_MODELS: parents first
+FEED_MODELS = [
+    ('auth', 'User'), ('medical_inventory', 'Astronaut'), ('medical_inventory', 'Medication'),
+    ('medical_inventory', 'MedicationThreshold'), ('medical_inventory', 'Prescription'),
+    ('medical_inventory', 'InventoryLog'), ('medical_inventory', 'AccessLog'),
+    ('medical_inventory', 'AccessLogItem'),
+]
+
+
+def seed_change_feed(apps, schema_editor):
+    """Every existing row becomes one change, so a new site's first pull is a full copy"""
+    db = schema_editor.connection.alias
+    SyncChange = apps.get_model('medical_inventory', 'SyncChange')
+    SyncSequence = apps.get_model('medical_inventory', 'SyncSequence')
+    seq = 0
+    for app_label, model_name in FEED_MODELS:
+        model = apps.get_model(app_label, model_name)
+        label = f'{app_label}.{model_name.lower()}'
+        batch = []
+        for pk in model.objects.using(db).order_by('pk').values_list('pk', flat=True).iterator(chunk_size=2000):
+            seq += 1
+            batch.append(SyncChange(model=label, object_id=pk, seq=seq))
+            if len(batch) == 2000:
+                SyncChange.objects.using(db).bulk_create(batch)
+                batch = []
+        SyncChange.objects.using(db).bulk_create(batch)
+    SyncSequence.objects.using(db).create(pk=1, value=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0020_edge_sync_journal'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, unique=True)),
+                ('seq', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SyncChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('seq', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['seq'], name='medical_inv_seq_037f48_idx')],
+                'constraints': [models.UniqueConstraint(fields=('model', 'object_id'), name='unique_sync_change')],
+            },
+        ),
+        migrations.RunPython(seed_change_feed, migrations.RunPython.noop),
+    ]
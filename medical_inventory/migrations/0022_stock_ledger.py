@@ -0,0 +1,94 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:49
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Min, Sum
+from django.utils import timezone
+
+
+def book_opening_balances(apps, schema_editor):
+    """
+    Make the ledger add up: stock that was never logged (initial quantities,
+    unlogged edits) becomes one ADJUSTMENT just before each medication's
+    first log, so current_quantity == sum(quantity_change) from here on.
+    """
+    if getattr(settings, 'EDGE_MODE', False):
+        # Edge nodes receive the central server's balances through sync
+        return
+    db = schema_editor.connection.alias
+    Medication = apps.get_model('medical_inventory', 'Medication')
+    InventoryLog = apps.get_model('medical_inventory', 'InventoryLog')
+    SyncChange = apps.get_model('medical_inventory', 'SyncChange')
+    SyncSequence = apps.get_model('medical_inventory', 'SyncSequence')
+
+    ledger = {
+        row['medication_id']: row
+        for row in InventoryLog.objects.using(db).order_by().values('medication_id').annotate(
+            total=Sum('quantity_change'), first=Min('timestamp')
+        )
+    }
+    now = timezone.now()
+    balances = []
+    for medication_id, current in Medication.objects.using(db).values_list('id', 'current_quantity'):
+        row = ledger.get(medication_id, {'total': 0, 'first': None})
+        drift = current - row['total']
+        if drift:
+            balances.append(InventoryLog(
+                medication_id=medication_id,
+                log_type='ADJUSTMENT',
+                quantity_change=drift,
+                previous_quantity=0,
+                new_quantity=drift,
+                timestamp=row['first'] - timedelta(seconds=1) if row['first'] else now,
+                notes='Opening balance (stock ledger introduced)',
+            ))
+    created = InventoryLog.objects.using(db).bulk_create(balances)
+
+    # Publish them to the sync change feed like any other new log
+    if created:
+        sequence, _ = SyncSequence.objects.using(db).get_or_create(pk=1)
+        SyncSequence.objects.using(db).filter(pk=1).update(value=F('value') + len(created))
+        SyncChange.objects.using(db).bulk_create([
+            SyncChange(model='medical_inventory.inventorylog', object_id=log.pk, seq=sequence.value + i + 1)
+            for i, log in enumerate(created)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0021_sync_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('quantity', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='inventorylog',
+            name='log_type',
+            field=models.CharField(choices=[('CHECKOUT', 'Medication Checkout'), ('RESTOCK', 'Inventory Restock'), ('EXPIRED', 'Expired Medication Removed'), ('ADJUSTMENT', 'Manual Adjustment'), ('INTAKE', 'Bottle Scan Intake')], max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='inventorylog',
+            index=models.Index(fields=['medication', 'timestamp'], name='medical_inv_medicat_1b8425_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='medication',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='medical_inventory.medication'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('medication', 'as_of'), name='unique_stock_snapshot'),
+        ),
+        migrations.RunPython(book_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:54
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def open_lots(apps, schema_editor):
+    """Existing stock becomes one lot per medication, under the medication's expiration date"""
+    if getattr(settings, 'EDGE_MODE', False):
+        # Edge nodes receive the central server's lots through sync
+        return
+    db = schema_editor.connection.alias
+    Medication = apps.get_model('medical_inventory', 'Medication')
+    MedicationLot = apps.get_model('medical_inventory', 'MedicationLot')
+    SyncChange = apps.get_model('medical_inventory', 'SyncChange')
+    SyncSequence = apps.get_model('medical_inventory', 'SyncSequence')
+
+    created = MedicationLot.objects.using(db).bulk_create([
+        MedicationLot(medication_id=pk, quantity=quantity, expiration_date=expiration_date)
+        for pk, quantity, expiration_date in Medication.objects.using(db).filter(
+            current_quantity__gt=0
+        ).values_list('id', 'current_quantity', 'expiration_date')
+    ])
+
+    # Publish them to the sync change feed
+    if created:
+        sequence, _ = SyncSequence.objects.using(db).get_or_create(pk=1)
+        SyncSequence.objects.using(db).filter(pk=1).update(value=F('value') + len(created))
+        SyncChange.objects.using(db).bulk_create([
+            SyncChange(model='medical_inventory.medicationlot', object_id=lot.pk, seq=sequence.value + i + 1)
+            for i, lot in enumerate(created)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0022_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicationLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot_number', models.CharField(blank=True, max_length=50)),
+                ('expiration_date', models.DateField(blank=True, null=True)),
+                ('quantity', models.IntegerField(default=0)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('medication', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='medical_inventory.medication')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='inventorylog',
+            name='lot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='logs', to='medical_inventory.medicationlot'),
+        ),
+        migrations.AddIndex(
+            model_name='medicationlot',
+            index=models.Index(fields=['medication', 'expiration_date'], name='medical_inv_medicat_d57e30_idx'),
+        ),
+        migrations.RunPython(open_lots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-19 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0023_medication_lots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='medicationlot',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['expiration_date'], name='lot_in_stock_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.11 on 2026-10-19 18:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0024_lot_expiry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumptionForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('daily_rate', models.FloatField(default=0)),
+                ('through_date', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medication', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast', to='medical_inventory.medication')),
+            ],
+        ),
+    ]
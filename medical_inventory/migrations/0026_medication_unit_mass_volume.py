@@ -0,0 +1,23 @@
+# Generated by Django 5.2.11 on 2026-10-19 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_inventory', '0025_consumption_forecast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medication',
+            name='unit_mass_g',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='medication',
+            name='unit_volume_ml',
+            field=models.FloatField(default=0),
+        ),
+    ]
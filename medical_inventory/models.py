@@ -1,23 +1,65 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+class SyncTrackedModel(models.Model):
+    """Remembers the values loaded from the database so edge sync can journal only what changed"""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class AstronautQuerySet(models.QuerySet):
+    def with_face_encoding(self):
+        """Opt back in to the deferred heavy columns (face matching, enrollment)"""
+        return self.defer(None)
+
+
+class AstronautManager(models.Manager.from_queryset(AstronautQuerySet)):
+    # face_encoding is a pickled array nobody outside face matching reads
+    HEAVY_FIELDS = ('face_encoding',)
+
+    def get_queryset(self):
+        return super().get_queryset().defer(*self.HEAVY_FIELDS)
+
+
 class Astronaut(models.Model):
+    ENROLLMENT_STATUS = [
+        ('NONE', 'Not Enrolled'),
+        ('PENDING', 'Pending'),
+        ('READY', 'Enrolled'),
+        ('FAILED', 'Failed'),
+    ]
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     astronaut_id = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=200)
     face_encoding = models.BinaryField(null=True, blank=True)  # Store face encoding
-    # Add this to your Astronaut model:
-    # photo = models.ImageField(upload_to='astronaut_photos/', null=True, blank=True)
-    # photo = models.ImageField(upload_to='astronaut_photos/', null=True, blank=True)
-    photo = models.TextField(null=True, blank=True)
+    # Face encoding runs in the background (enrollment.py); clients poll this
+    enrollment_status = models.CharField(max_length=10, choices=ENROLLMENT_STATUS, default='NONE')
+    enrollment_error = models.CharField(max_length=255, blank=True)
+    # Files are named <astronaut_id>-<content hash>.jpg (see photos.py)
+    photo = models.ImageField(upload_to='astronaut_photos/', null=True, blank=True)
+    photo_thumbnail = models.ImageField(upload_to='astronaut_photos/thumbs/', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = AstronautManager()
+
+    class Meta:
+        # Related lookups (checkout.astronaut, user.astronaut) defer heavy columns too
+        base_manager_name = 'objects'
     
     def __str__(self):
         return f"{self.name} ({self.astronaut_id})"
 
 
-class Medication(models.Model):
+class Medication(SyncTrackedModel):
     pill_shape = models.CharField(
         max_length=20,
         choices=[
@@ -94,6 +136,9 @@ class Medication(models.Model):
     description = models.TextField(blank=True)
     container_location = models.CharField(max_length=50, default='A1')
     pill_image = models.ImageField(upload_to='pill_images/', null=True, blank=True)
+    # Per unit, packaging included, for resupply planning (planning.py); 0 = not measured yet
+    unit_mass_g = models.FloatField(default=0)
+    unit_volume_ml = models.FloatField(default=0)
     
     def __str__(self):
         return f"{self.name}"
@@ -118,6 +163,31 @@ class Medication(models.Model):
         super().save(*args, **kwargs)
 
 
+class MedicationLot(SyncTrackedModel):
+    """One received batch of a medication; stock is the sum of its lots (see ledger.py)"""
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='lots')
+    lot_number = models.CharField(max_length=50, blank=True)
+    expiration_date = models.DateField(null=True, blank=True)  # None: no expiry recorded, dispensed last
+    quantity = models.IntegerField(default=0)
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # FEFO picking: a medication's lots in expiry order
+            models.Index(fields=['medication', 'expiration_date']),
+            # Expiry sweep / expiring-soon list: date range over lots that still hold stock
+            models.Index(
+                fields=['expiration_date'],
+                condition=models.Q(quantity__gt=0),
+                name='lot_in_stock_expiry_idx'
+            ),
+        ]
+
+    def __str__(self):
+        expiry = self.expiration_date.isoformat() if self.expiration_date else 'no expiry'
+        return f"{self.medication.name} lot {self.lot_number or self.pk} ({expiry})"
+
+
 class Prescription(models.Model):
     astronaut = models.ForeignKey(Astronaut, on_delete=models.CASCADE, related_name='prescriptions')
     medication = models.ForeignKey(Medication, on_delete=models.CASCADE)
@@ -144,10 +214,17 @@ class MedicationCheckout(models.Model):
         return f"{self.astronaut.name} - {self.medication.name} - {self.checkout_time}"
     
     def save(self, *args, **kwargs):
-        # Update medication inventory when checkout is saved
         if self.pk is None:  # Only on creation
-            self.medication.current_quantity -= self.quantity
-            self.medication.save()
+            from .ledger import record_movement  # ledger.py imports this module
+            with transaction.atomic():
+                record_movement(
+                    self.medication, -self.quantity, 'CHECKOUT',
+                    performed_by=self.astronaut,
+                    notes='Prescription checkout' if self.is_prescription else 'Checkout',
+                    timestamp=self.checkout_time,
+                )
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
 
@@ -157,6 +234,7 @@ class InventoryLog(models.Model):
         ('RESTOCK', 'Inventory Restock'),
         ('EXPIRED', 'Expired Medication Removed'),
         ('ADJUSTMENT', 'Manual Adjustment'),
+        ('INTAKE', 'Bottle Scan Intake'),
     ]
     
     medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='logs')
@@ -167,12 +245,69 @@ class InventoryLog(models.Model):
     timestamp = models.DateTimeField(default=timezone.now)
     performed_by = models.ForeignKey(Astronaut, on_delete=models.SET_NULL, null=True, blank=True)
     notes = models.TextField(blank=True)
+    lot = models.ForeignKey(MedicationLot, on_delete=models.SET_NULL, null=True, blank=True, related_name='logs')
     
     def __str__(self):
         return f"{self.medication.name} - {self.log_type} - {self.timestamp}"
     
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Ledger tails and point-in-time sums per medication (ledger.py)
+            models.Index(fields=['medication', 'timestamp']),
+        ]
+
+
+class StockSnapshot(models.Model):
+    """Ledger checkpoint: a medication's stock as of a moment; stock later = quantity + log tail"""
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='stock_snapshots')
+    as_of = models.DateTimeField()
+    quantity = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medication', 'as_of'], name='unique_stock_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.medication.name} @ {self.as_of}: {self.quantity}"
+
+
+class DailyInventorySnapshot(models.Model):
+    """Per-medication daily rollup of InventoryLog, maintained as logs are written"""
+    medication = models.ForeignKey(Medication, on_delete=models.CASCADE, related_name='daily_snapshots')
+    date = models.DateField()
+    opening_quantity = models.IntegerField()
+    closing_quantity = models.IntegerField()
+    dispensed = models.IntegerField(default=0)
+    restocked = models.IntegerField(default=0)
+    checkouts = models.IntegerField(default=0)
+    first_log_at = models.DateTimeField()
+    last_log_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['medication', 'date']
+        constraints = [
+            models.UniqueConstraint(fields=['medication', 'date'], name='unique_medication_snapshot_date'),
+        ]
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.medication.name} - {self.date} - {self.closing_quantity}"
+
+
+class ConsumptionForecast(models.Model):
+    """Smoothed daily consumption per medication, carried forward a day at a time (forecasting.py)"""
+    medication = models.OneToOneField(Medication, on_delete=models.CASCADE, related_name='forecast')
+    daily_rate = models.FloatField(default=0)
+    through_date = models.DateField()  # Last complete day folded into daily_rate
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.medication.name} - {self.daily_rate:.2f}/day through {self.through_date}"
 
 
 class SystemLog(models.Model):
@@ -196,7 +331,7 @@ class SystemLog(models.Model):
     class Meta:
         ordering = ['-timestamp']
         
-class WarningLog(models.Model):
+class WarningLog(SyncTrackedModel):
     """Track warnings for excessive medication withdrawals"""
     SEVERITY_CHOICES = [
         ('LOW', 'Low'),
@@ -220,6 +355,12 @@ class WarningLog(models.Model):
         indexes = [
             models.Index(fields=['-timestamp']),
             models.Index(fields=['astronaut', '-timestamp']),
+            # Review queue: only unacknowledged rows are indexed, so it stays small as history grows
+            models.Index(
+                fields=['-timestamp', '-id'],
+                condition=models.Q(acknowledged=False),
+                name='warninglog_pending_idx'
+            ),
         ]
     
     def __str__(self):
@@ -237,6 +378,25 @@ class MedicationThreshold(models.Model):
         return f"Threshold for {self.medication.name}"
 
 
+class WithdrawalCounter(models.Model):
+    """Units withdrawn per astronaut/medication per hour; summed over 25 buckets for daily limits (limits.py)"""
+    astronaut = models.ForeignKey('Astronaut', on_delete=models.CASCADE, related_name='withdrawal_counters')
+    medication = models.ForeignKey('Medication', on_delete=models.CASCADE, related_name='withdrawal_counters')
+    bucket_start = models.DateTimeField()
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['astronaut', 'medication', 'bucket_start'],
+                name='unique_withdrawal_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.astronaut_id}/{self.medication_id} @ {self.bucket_start}: {self.quantity}"
+
+
 class EmergencyAccess(models.Model):
     """Log emergency access to the medication system"""
     accessed_at = models.DateTimeField(auto_now_add=True)
@@ -266,6 +426,12 @@ class AccessLog(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # Keyset pagination on (timestamp, id), optionally narrowed by astronaut or type
+            models.Index(fields=['-timestamp', '-id']),
+            models.Index(fields=['astronaut', '-timestamp', '-id']),
+            models.Index(fields=['event_type', '-timestamp', '-id']),
+        ]
 
     def __str__(self):
         return f"{self.event_type} - {self.timestamp}"
@@ -277,4 +443,78 @@ class AccessLogItem(models.Model):
     quantity   = models.IntegerField()
 
     def __str__(self):
-        return f"{self.medication.name} x{self.quantity}"
\ No newline at end of file
+        return f"{self.medication.name} x{self.quantity}"
+
+
+class SyncJournal(models.Model):
+    """Edge mode: a local write waiting to be pushed to the central database (see edge.py)"""
+    OPERATIONS = [
+        ('INSERT', 'Insert'),
+        ('UPDATE', 'Update'),
+        ('DELETE', 'Delete'),
+    ]
+    model = models.CharField(max_length=100)  # app_label.modelname
+    object_id = models.BigIntegerField()
+    operation = models.CharField(max_length=10, choices=OPERATIONS)
+    # Field values by attname; for updates only the fields that changed
+    payload = models.JSONField(default=dict, blank=True)
+    # Medication stock moves are merged upstream as deltas, not overwritten
+    quantity_delta = models.IntegerField(default=0)
+    created_at = models.DateTimeField(default=timezone.now)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(synced_at__isnull=True), name='syncjournal_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.operation} {self.model}#{self.object_id}"
+
+
+class SyncCheckpoint(models.Model):
+    """Central side: last journal entry applied from each edge node, so a retried push is never applied twice"""
+    node_id = models.PositiveIntegerField(unique=True)
+    last_journal_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Node {self.node_id} @ {self.last_journal_id}"
+
+
+class SyncSequence(models.Model):
+    """Single-row counter behind SyncChange.seq; its row lock orders feed writes by commit"""
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Sync sequence @ {self.value}"
+
+
+class SyncChange(models.Model):
+    """Change feed for the sync API: the latest change per synced row (see sync.py)"""
+    model = models.CharField(max_length=100)  # app_label.modelname
+    object_id = models.BigIntegerField()
+    seq = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id'], name='unique_sync_change'),
+        ]
+        indexes = [
+            models.Index(fields=['seq']),
+        ]
+
+    def __str__(self):
+        return f"{self.model}#{self.object_id} @ {self.seq}"
+
+
+class SyncCursor(models.Model):
+    """Edge side: how far this node has pulled from a sync source"""
+    source = models.CharField(max_length=50, unique=True)
+    seq = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} @ {self.seq}"
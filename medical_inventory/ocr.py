@@ -0,0 +1,133 @@
+# ocr.py - Swappable OCR backends for the bottle reader
+import logging
+import os
+import re
+import threading
+
+import numpy as np
+from PIL import Image
+from django.conf import settings
+
+# Persistent tesseract engine (optional, needs libtesseract + tesserocr)
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+import pytesseract
+if os.name == 'nt':
+    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+
+logger = logging.getLogger(__name__)
+
+_OEM_PATTERN = re.compile(r'--oem\s+(\d+)')
+_PSM_PATTERN = re.compile(r'--psm\s+(\d+)')
+
+
+def parse_tesseract_config(config):
+    """Split a tesseract CLI config string into (oem, psm), defaulting to 3/6"""
+    oem = _OEM_PATTERN.search(config or '')
+    psm = _PSM_PATTERN.search(config or '')
+    return (int(oem.group(1)) if oem else 3, int(psm.group(1)) if psm else 6)
+
+
+def _to_pil(image):
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    return image
+
+
+class PytesseractBackend:
+    """Fallback backend: one tesseract subprocess per call"""
+    name = 'pytesseract'
+
+    def __init__(self, lang='eng'):
+        self.lang = lang
+
+    def image_to_string(self, image, config='--oem 3 --psm 6'):
+        return pytesseract.image_to_string(image, lang=self.lang, config=config)
+
+
+class TesserocrBackend:
+    """
+    Persistent backend: keeps one initialised TessBaseAPI per OCR engine mode,
+    so the traineddata model is loaded once and images never touch disk.
+    Engines are per-thread because TessBaseAPI is not thread-safe.
+    """
+    name = 'tesserocr'
+
+    def __init__(self, lang='eng', tessdata_path=None):
+        self.lang = lang
+        self.tessdata_path = tessdata_path
+        self._local = threading.local()
+
+    def _engine(self, oem):
+        engines = getattr(self._local, 'engines', None)
+        if engines is None:
+            engines = self._local.engines = {}
+        api = engines.get(oem)
+        if api is None:
+            kwargs = {'lang': self.lang, 'oem': oem}
+            if self.tessdata_path:
+                kwargs['path'] = self.tessdata_path
+            api = engines[oem] = tesserocr.PyTessBaseAPI(**kwargs)
+        return api
+
+    def image_to_string(self, image, config='--oem 3 --psm 6'):
+        oem, psm = parse_tesseract_config(config)
+        api = self._engine(oem)
+        api.SetPageSegMode(psm)
+        api.SetImage(_to_pil(image))
+        try:
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+    def close(self):
+        for api in getattr(self._local, 'engines', {}).values():
+            api.End()
+        self._local.engines = {}
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_ocr_backend():
+    """
+    Return the process-wide OCR backend selected by settings.OCR_BACKEND
+    ('auto', 'tesserocr' or 'pytesseract'). 'auto' prefers the persistent
+    engine and falls back to pytesseract if tesserocr cannot load.
+    """
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    with _backend_lock:
+        if _backend is None:
+            choice = getattr(settings, 'OCR_BACKEND', 'auto')
+            lang = getattr(settings, 'OCR_LANGUAGE', 'eng')
+            tessdata = getattr(settings, 'TESSDATA_PATH', None)
+            backend = None
+
+            if choice in ('auto', 'tesserocr') and TESSEROCR_AVAILABLE:
+                try:
+                    backend = TesserocrBackend(lang=lang, tessdata_path=tessdata)
+                    backend._engine(3)  # fail fast if the model can't load
+                except Exception as e:
+                    logger.warning('tesserocr unavailable (%s) - falling back to pytesseract', e)
+                    backend = None
+            elif choice == 'tesserocr':
+                logger.warning('tesserocr not installed - falling back to pytesseract')
+
+            _backend = backend or PytesseractBackend(lang=lang)
+    return _backend
+
+
+def set_ocr_backend(backend):
+    """Swap the process-wide OCR backend (used by benchmarks and tests)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
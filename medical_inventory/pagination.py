@@ -0,0 +1,54 @@
+# pagination.py - Keyset (cursor) pagination on (timestamp, id), newest first
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(obj, field='timestamp'):
+    raw = f'{getattr(obj, field).isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from an opaque cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(queryset, after=None, before=None, page_size=50, field='timestamp'):
+    """
+    One page of queryset ordered by (-field, -id), seeking from a cursor
+    instead of OFFSET so every page costs the same. Returns
+    (rows, next_cursor, prev_cursor); cursors are None at either end.
+    """
+    after_key = decode_cursor(after)
+    before_key = decode_cursor(before)
+
+    if before_key:
+        ts, pk = before_key
+        rows = list(
+            queryset.filter(Q(**{f'{field}__gt': ts}) | Q(**{field: ts, 'pk__gt': pk}))
+            .order_by(field, 'pk')[:page_size + 1]
+        )
+        has_prev = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+    else:
+        if after_key:
+            ts, pk = after_key
+            queryset = queryset.filter(Q(**{f'{field}__lt': ts}) | Q(**{field: ts, 'pk__lt': pk}))
+        rows = list(queryset.order_by(f'-{field}', '-pk')[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_prev = after_key is not None
+
+    next_cursor = encode_cursor(rows[-1], field) if rows and has_next else None
+    prev_cursor = encode_cursor(rows[0], field) if rows and has_prev else None
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,58 @@
+# photos.py - Astronaut photos on file storage with generated thumbnails
+import hashlib
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+PHOTO_MAX_SIZE = (1280, 1280)
+THUMBNAIL_SIZE = (160, 160)
+JPEG_QUALITY = 85
+
+
+def _jpeg(img, size):
+    img = img.copy()
+    img.thumbnail(size)
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def render_photo(data):
+    """(photo, thumbnail) JPEG bytes from uploaded image bytes"""
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(data))).convert('RGB')
+    return _jpeg(img, PHOTO_MAX_SIZE), _jpeg(img, THUMBNAIL_SIZE)
+
+
+def photo_version(astronaut):
+    """Content hash baked into the stored file name, used for ETags and cache-busting URLs"""
+    if not astronaut.photo_thumbnail:
+        return None
+    return os.path.splitext(os.path.basename(astronaut.photo_thumbnail.name))[0].rsplit('-', 1)[-1]
+
+
+def set_astronaut_photo(astronaut, data, save=True):
+    """Store a new photo + thumbnail for astronaut and remove the files it replaces"""
+    photo, thumbnail = render_photo(data)
+    digest = hashlib.sha1(photo).hexdigest()[:12]
+    old_files = [f.name for f in (astronaut.photo, astronaut.photo_thumbnail) if f]
+
+    filename = f'{astronaut.astronaut_id}-{digest}.jpg'
+    astronaut.photo.save(filename, ContentFile(photo), save=False)
+    astronaut.photo_thumbnail.save(filename, ContentFile(thumbnail), save=False)
+    if save:
+        astronaut.save(update_fields=['photo', 'photo_thumbnail'])
+
+    # Only drop the old files once the new names are committed
+    storage = astronaut.photo.storage
+    stale = [name for name in old_files if name not in (astronaut.photo.name, astronaut.photo_thumbnail.name)]
+    if stale:
+        transaction.on_commit(lambda: [storage.delete(name) for name in stale])
+
+
+def delete_astronaut_photo(astronaut):
+    for field in (astronaut.photo, astronaut.photo_thumbnail):
+        if field:
+            field.delete(save=False)
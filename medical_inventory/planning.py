@@ -0,0 +1,202 @@
+# planning.py - Resupply manifest: what to fly up within a flight's mass and volume budget
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.utils import timezone
+from scipy.optimize import linprog
+from scipy.sparse import csr_matrix, hstack
+
+from .forecasting import forecast
+from .ledger import FEFO_ORDER
+from .models import Medication, MedicationLot
+
+DEFAULT_HORIZON_DAYS = 90
+# The first units of each medication - up to its minimum plus this many days
+# of demand - are worth ESSENTIAL_WEIGHT times more than the rest, so a tight
+# budget keeps every medication going before topping any one of them up
+ESSENTIAL_DAYS = 30
+ESSENTIAL_WEIGHT = 10
+# The solver stops after this long and the best manifest found so far is returned
+SOLVE_TIME_LIMIT = 1.0
+
+
+class PlanningError(ValueError):
+    """Bad limits or cabinets"""
+
+
+class SolverError(RuntimeError):
+    """The solver returned no manifest for valid limits (time limit, numerical trouble)"""
+
+
+def expiring_waste(rates, today, horizon_end):
+    """
+    {medication_id: units that will expire before they are used}. Lots are
+    drawn first-expiring-first at the forecast daily rate; whatever is left
+    in a lot on its expiration date (within the horizon) is waste.
+    """
+    waste = defaultdict(float)
+    consumed = defaultdict(float)  # Demand already met by earlier lots
+    lots = MedicationLot.objects.filter(quantity__gt=0).order_by('medication_id', *FEFO_ORDER)
+    for med_id, expiry, quantity in lots.values_list('medication_id', 'expiration_date', 'quantity'):
+        if expiry is None or expiry >= horizon_end:
+            used = quantity
+        else:
+            demand = rates.get(med_id, 0.0) * max((expiry - today).days, 0)
+            used = min(quantity, max(demand - consumed[med_id], 0.0))
+            waste[med_id] += quantity - used
+        consumed[med_id] += used
+    return waste
+
+
+def _solve(usage, limits, priority, essential, shortfall):
+    """
+    Knapsack over all medications at once: each has two variables, essential
+    units and the rest, with the same cost per unit. The LP relaxation (HiGHS)
+    has at most one fractional variable per limit, so rounding down loses
+    less than a unit per limit; those units are then added back where they
+    still fit. Returns (quantities, status).
+    """
+    n = len(priority)
+    result = linprog(
+        -np.concatenate([ESSENTIAL_WEIGHT * priority, priority]),
+        A_ub=hstack([usage, usage]).tocsr(), b_ub=limits,
+        bounds=np.column_stack([np.zeros(2 * n), np.concatenate([essential, shortfall - essential])]),
+        method='highs', options={'time_limit': SOLVE_TIME_LIMIT},
+    )
+    if result.x is None:
+        raise SolverError(f'No manifest found: {result.message}')
+    fractional = result.x[:n] + result.x[n:]
+    quantities = np.floor(fractional + 1e-9)
+
+    spare = limits - usage @ quantities
+    value = np.where(quantities < essential, ESSENTIAL_WEIGHT, 1) * priority
+    for i in sorted(np.flatnonzero(fractional - quantities > 1e-9), key=lambda i: -value[i]):
+        column = usage[:, i].toarray().ravel()
+        if (column <= spare).all():
+            quantities[i] += 1
+            spare -= column
+    return quantities, 'optimal' if result.status == 0 else 'time_limit'
+
+
+def plan_resupply(mass_budget_g=None, volume_budget_ml=None, cabinet_capacity_ml=None,
+                  horizon_days=DEFAULT_HORIZON_DAYS):
+    """
+    Pick how many units of each medication to send so that as little as
+    possible of the next `horizon_days` of forecast demand (plus each
+    minimum_quantity, kept as safety stock) goes uncovered, favouring what
+    runs out first and essential cover over top-ups. Stock that will expire
+    unused doesn't count as supply.
+
+    Limits (None = unlimited): the flight's total mass and volume, and the
+    free volume of each cabinet, keyed by container_location. Solved as one
+    knapsack over the whole formulary with SciPy's HiGHS solver.
+    Raises PlanningError for bad limits, SolverError if the solver fails.
+    """
+    cabinet_capacity_ml = cabinet_capacity_ml or {}
+    if horizon_days < 1:
+        raise PlanningError('horizon_days must be at least 1')
+    limits = [mass_budget_g, volume_budget_ml, *cabinet_capacity_ml.values()]
+    if any(limit is not None and limit < 0 for limit in limits):
+        raise PlanningError('Budgets and cabinet capacities cannot be negative')
+
+    start = time.perf_counter()
+    today = timezone.localdate()
+    supply = forecast()
+    medications = list(Medication.objects.order_by('id').values(
+        'id', 'name', 'container_location', 'current_quantity', 'minimum_quantity', 'unit_mass_g', 'unit_volume_ml',
+    ))
+    rates = {pk: row['daily_rate'] for pk, row in supply.items()}
+    waste = expiring_waste(rates, today, today + timedelta(days=horizon_days))
+
+    rate = np.array([rates.get(m['id'], 0.0) for m in medications])
+    usable = np.array([m['current_quantity'] - waste.get(m['id'], 0.0) for m in medications])
+    minimum = np.array([m['minimum_quantity'] for m in medications], dtype=float)
+    mass = np.array([m['unit_mass_g'] for m in medications])
+    volume = np.array([m['unit_volume_ml'] for m in medications])
+
+    shortfall = np.ceil(np.maximum(rate * horizon_days + minimum - usable, 0))
+    essential = np.minimum(np.ceil(np.maximum(rate * min(ESSENTIAL_DAYS, horizon_days) + minimum - usable, 0)), shortfall)
+    running = rate > 0
+    days_left = np.divide(np.maximum(usable, 0), rate, out=np.full(len(medications), np.inf), where=running)
+    # Value of one unit: the sooner a medication runs out, the more it is worth
+    priority = 1 / (1 + np.minimum(days_left, horizon_days))
+
+    rows, cols, data, upper = [], [], [], []
+    for coefficients, budget in ((mass, mass_budget_g), (volume, volume_budget_ml)):
+        if budget is not None:
+            nonzero = np.flatnonzero(coefficients)
+            rows.extend([len(upper)] * len(nonzero))
+            cols.extend(nonzero)
+            data.extend(coefficients[nonzero])
+            upper.append(budget)
+    cabinets = {}
+    for location, capacity in cabinet_capacity_ml.items():
+        members = [i for i, m in enumerate(medications) if m['container_location'] == location]
+        occupied = float(sum(volume[i] * max(medications[i]['current_quantity'], 0) for i in members))
+        cabinets[location] = {'capacity_ml': capacity, 'free_ml': max(capacity - occupied, 0.0), 'used_ml': 0.0}
+        rows.extend([len(upper)] * len(members))
+        cols.extend(members)
+        data.extend(volume[members])
+        upper.append(cabinets[location]['free_ml'])
+
+    status = 'unconstrained'
+    quantities = shortfall
+    if upper and shortfall.any():
+        quantities, status = _solve(
+            csr_matrix((data, (rows, cols)), shape=(len(upper), len(medications))),
+            np.array(upper, dtype=float), priority, essential, shortfall,
+        )
+
+    manifest = []
+    for i in np.flatnonzero(quantities):
+        m = medications[i]
+        quantity = int(quantities[i])
+        if m['container_location'] in cabinets:
+            cabinets[m['container_location']]['used_ml'] += quantity * volume[i]
+        manifest.append({
+            'medication_id': m['id'],
+            'name': m['name'],
+            'cabinet': m['container_location'],
+            'quantity': quantity,
+            'mass_g': round(float(quantity * mass[i]), 1),
+            'volume_ml': round(float(quantity * volume[i]), 1),
+            'daily_rate': float(rate[i]),
+            'days_of_supply': round(float(days_left[i]), 1) if running[i] else None,
+            'days_of_supply_after': round(float((usable[i] + quantity) / rate[i]), 1) if running[i] else None,
+            'shortfall': int(shortfall[i]),
+        })
+    manifest.sort(key=lambda row: (row['days_of_supply'] is None, row['days_of_supply'] or 0, row['name']))
+
+    return {
+        'status': status,
+        'horizon_days': horizon_days,
+        'manifest': manifest,
+        'total_mass_g': round(float(quantities @ mass), 1),
+        'total_volume_ml': round(float(quantities @ volume), 1),
+        'mass_budget_g': mass_budget_g,
+        'volume_budget_ml': volume_budget_ml,
+        'cabinets': {
+            location: {key: round(float(value), 1) for key, value in cabinet.items()}
+            for location, cabinet in cabinets.items()
+        },
+        'uncovered_units': int((shortfall - quantities).sum()),
+        # Weightless in the plan until measured
+        'unmeasured': [m['name'] for i, m in enumerate(medications) if shortfall[i] and not mass[i] and not volume[i]],
+        'solve_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+def parse_cabinets(values):
+    """['A1=2500', 'B2:1200', ...] -> {location: capacity in ml}; raises PlanningError"""
+    capacities = {}
+    for value in values:
+        split = max(value.rfind('='), value.rfind(':'))
+        try:
+            if split < 1:
+                raise ValueError
+            capacities[value[:split]] = float(value[split + 1:])
+        except ValueError:
+            raise PlanningError(f'Cabinet capacity must look like LOCATION=ML, got {value!r}')
+    return capacities
@@ -0,0 +1,134 @@
+# routers.py - Send read-only report/analytics views to the read replica
+import contextvars
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_reading_from_replica = contextvars.ContextVar('reading_from_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def replica_lag_seconds():
+    """How far the replica may trail the primary; also how long a writer stays pinned"""
+    return getattr(settings, 'DB_REPLICA_LAG_SECONDS', 5)
+
+
+def reading_from_replica():
+    """True while the current view's reads are routed to the replica"""
+    return _reading_from_replica.get() and replica_configured()
+
+
+class ReplicaRouter:
+    """
+    Reads go to the replica only inside views marked with @use_replica; every
+    write, migration and anything inside a transaction stays on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not reading_from_replica():
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads in a transaction must see that transaction's writes
+            return None
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == REPLICA_ALIAS:
+            # Saving something that was read from the replica
+            return DEFAULT_DB_ALIAS
+        # Otherwise the instance's own alias (or default)
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
+
+
+def _pinned(request):
+    """Did this client write recently enough that the replica may not have its changes yet?"""
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def _stream_from_replica(content):
+    # Streaming responses run their queries after the view returns
+    iterator = iter(content)
+    while True:
+        token = _reading_from_replica.set(True)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _reading_from_replica.reset(token)
+        yield chunk
+
+
+async def _astream_from_replica(content):
+    # Same for async streams; each chunk's sync_to_async call copies this context
+    iterator = aiter(content)
+    while True:
+        token = _reading_from_replica.set(True)
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        finally:
+            _reading_from_replica.reset(token)
+        yield chunk
+
+
+def use_replica(view_func):
+    """
+    Route a read-only view's queries to the replica, unless this client has
+    written within the last DB_REPLICA_LAG_SECONDS (read-your-writes).
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not replica_configured() or request.method not in SAFE_METHODS or _pinned(request):
+            return view_func(request, *args, **kwargs)
+
+        token = _reading_from_replica.set(True)
+        try:
+            response = view_func(request, *args, **kwargs)
+        finally:
+            _reading_from_replica.reset(token)
+
+        if getattr(response, 'streaming', False):
+            stream = _astream_from_replica if response.is_async else _stream_from_replica
+            response.streaming_content = stream(response.streaming_content)
+        response['X-Database'] = REPLICA_ALIAS
+        return response
+    return wrapper
+
+
+class ReplicaPinMiddleware:
+    """Pin a client to the primary for a while after any request that may have written"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if replica_configured() and request.method not in SAFE_METHODS and response.status_code < 400:
+            lag = replica_lag_seconds()
+            response.set_cookie(
+                PIN_COOKIE, str(time.time() + lag), max_age=lag, httponly=True, samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .caching import bump_face_index_version, bump_inventory_version, bump_warnings_version
+from .models import Astronaut, Medication, InventoryLog, StockSnapshot, WarningLog
+from .snapshots import apply_log_to_snapshot
+
+
+@receiver([post_save, post_delete], sender=Medication)
+@receiver([post_save, post_delete], sender=InventoryLog)
+def invalidate_inventory_cache(sender, **kwargs):
+    """Any stock or catalogue write invalidates cached dashboard/list/history payloads"""
+    bump_inventory_version()
+
+
+@receiver(post_delete, sender=InventoryLog)
+def invalidate_stock_snapshots(sender, instance, using, **kwargs):
+    """Ledger rows are append-only in the app; a deletion (admin, cascade) voids later checkpoints"""
+    StockSnapshot.objects.using(using).filter(
+        medication_id=instance.medication_id, as_of__gte=instance.timestamp
+    ).delete()
+
+
+@receiver(post_save, sender=InventoryLog)
+def update_daily_snapshot(sender, instance, created, using, **kwargs):
+    """Keep DailyInventorySnapshot current as logs are written"""
+    if created and not kwargs.get('raw'):
+        apply_log_to_snapshot(instance, using=using)
+
+
+@receiver([post_save, post_delete], sender=Astronaut)
+def invalidate_face_index(sender, **kwargs):
+    """Saves and deletes can change who is enrolled; queryset .update() calls bump explicitly"""
+    bump_face_index_version()
+
+
+@receiver([post_save, post_delete], sender=WarningLog)
+def invalidate_warning_counts(sender, **kwargs):
+    """bulk_create / bulk acknowledge bypass this and bump explicitly"""
+    bump_warnings_version()
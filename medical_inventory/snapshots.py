@@ -0,0 +1,149 @@
+# snapshots.py - Daily inventory rollups maintained from InventoryLog
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Window
+from django.db.models.functions import FirstValue, TruncDate
+from django.utils import timezone
+
+from .models import ConsumptionForecast, DailyInventorySnapshot, InventoryLog, StockSnapshot
+
+RESTOCK_LOG_TYPES = ('RESTOCK', 'INTAKE')
+
+
+def log_deltas(log_type, quantity_change):
+    """(dispensed, restocked, checkouts) contributed by a single log row"""
+    if log_type == 'CHECKOUT':
+        return max(-quantity_change, 0), 0, 1
+    if log_type in RESTOCK_LOG_TYPES:
+        return 0, max(quantity_change, 0), 0
+    return 0, 0, 0
+
+
+def apply_log_to_snapshot(log, using=DEFAULT_DB_ALIAS):
+    """Fold one newly written InventoryLog row into its medication's daily snapshot"""
+    # A backdated or late-synced log lands behind existing stock checkpoints
+    StockSnapshot.objects.using(using).filter(medication_id=log.medication_id, as_of__gte=log.timestamp).delete()
+    day = timezone.localtime(log.timestamp).date()
+    dispensed, restocked, checkouts = log_deltas(log.log_type, log.quantity_change)
+    if checkouts and InventoryLog.objects.using(using).filter(
+        medication_id=log.medication_id, timestamp=log.timestamp, log_type='CHECKOUT', id__lt=log.id
+    ).exists():
+        # A checkout drawn from several lots is one log row per lot; count it once
+        checkouts = 0
+    if dispensed:
+        forget_forecasts({log.medication_id: day}, using=using)
+
+    with transaction.atomic(using=using):
+        snapshot, created = DailyInventorySnapshot.objects.using(using).select_for_update().get_or_create(
+            medication_id=log.medication_id,
+            date=day,
+            defaults={
+                'opening_quantity': log.previous_quantity,
+                'closing_quantity': log.new_quantity,
+                'dispensed': dispensed,
+                'restocked': restocked,
+                'checkouts': checkouts,
+                'first_log_at': log.timestamp,
+                'last_log_at': log.timestamp,
+            }
+        )
+        if created:
+            return snapshot
+
+        snapshot.dispensed += dispensed
+        snapshot.restocked += restocked
+        snapshot.checkouts += checkouts
+        # Logs can arrive out of order (backdated entries); keep the day's bounds right
+        if log.timestamp >= snapshot.last_log_at:
+            snapshot.closing_quantity = log.new_quantity
+            snapshot.last_log_at = log.timestamp
+        if log.timestamp < snapshot.first_log_at:
+            snapshot.opening_quantity = log.previous_quantity
+            snapshot.first_log_at = log.timestamp
+        snapshot.save()
+    return snapshot
+
+
+def build_snapshots(since=None, medication_ids=None):
+    """
+    Recompute snapshot rows from the raw log with two grouped queries.
+    Returns unsaved DailyInventorySnapshot instances.
+    """
+    logs = InventoryLog.objects.order_by()
+    if since:
+        logs = logs.filter(timestamp__gte=since)
+    if medication_ids is not None:
+        logs = logs.filter(medication_id__in=medication_ids)
+
+    day = TruncDate('timestamp')
+    totals = logs.annotate(day=day).values('medication_id', 'day').annotate(
+        dispensed=-Sum('quantity_change', filter=Q(log_type='CHECKOUT', quantity_change__lt=0), default=0),
+        restocked=Sum('quantity_change', filter=Q(log_type__in=RESTOCK_LOG_TYPES, quantity_change__gt=0), default=0),
+        checkouts=Count('timestamp', filter=Q(log_type='CHECKOUT'), distinct=True),  # one per checkout, not per lot
+        first_log_at=Min('timestamp'),
+        last_log_at=Max('timestamp'),
+    )
+    bounds = logs.annotate(
+        day=day,
+        opening=Window(
+            FirstValue('previous_quantity'),
+            partition_by=[F('medication_id'), day],
+            order_by=[F('timestamp').asc(), F('id').asc()],
+        ),
+        closing=Window(
+            FirstValue('new_quantity'),
+            partition_by=[F('medication_id'), day],
+            order_by=[F('timestamp').desc(), F('id').desc()],
+        ),
+    ).values_list('medication_id', 'day', 'opening', 'closing').distinct()
+    bounds = {(med_id, d): (opening, closing) for med_id, d, opening, closing in bounds}
+
+    snapshots = []
+    for row in totals:
+        opening, closing = bounds[(row['medication_id'], row['day'])]
+        snapshots.append(DailyInventorySnapshot(
+            medication_id=row['medication_id'],
+            date=row['day'],
+            opening_quantity=opening,
+            closing_quantity=closing,
+            dispensed=row['dispensed'],
+            restocked=row['restocked'],
+            checkouts=row['checkouts'],
+            first_log_at=row['first_log_at'],
+            last_log_at=row['last_log_at'],
+        ))
+    return snapshots
+
+
+def forget_forecasts(earliest, using=DEFAULT_DB_ALIAS):
+    """
+    {medication_id: date} of rollups just (re)written: drop consumption
+    forecasts that had already folded that day in (a late-synced or
+    backdated checkout), so forecasting.py re-seeds them from the window.
+    """
+    stale = [
+        pk for pk, medication_id, through_date in ConsumptionForecast.objects.using(using).filter(
+            medication_id__in=list(earliest)
+        ).values_list('pk', 'medication_id', 'through_date')
+        if through_date >= earliest[medication_id]
+    ]
+    if stale:
+        ConsumptionForecast.objects.using(using).filter(pk__in=stale).delete()
+
+
+def save_snapshots(snapshots, batch_size=1000):
+    """Upsert snapshot rows on (medication, date)"""
+    earliest = {}
+    for snapshot in snapshots:
+        if snapshot.medication_id not in earliest or snapshot.date < earliest[snapshot.medication_id]:
+            earliest[snapshot.medication_id] = snapshot.date
+    forget_forecasts(earliest)
+    return DailyInventorySnapshot.objects.bulk_create(
+        snapshots,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['medication', 'date'],
+        update_fields=[
+            'opening_quantity', 'closing_quantity', 'dispensed', 'restocked',
+            'checkouts', 'first_log_at', 'last_log_at',
+        ],
+    )
@@ -0,0 +1,234 @@
+# sync.py - Change feed and compact wire format for delta sync between sites
+import base64
+import datetime
+import gzip
+import json
+import lzma
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_save
+
+from .models import (
+    AccessLog, AccessLogItem, Astronaut, InventoryLog, Medication, MedicationLot, MedicationThreshold,
+    Prescription, SyncChange, SyncSequence,
+)
+
+PROTOCOL_VERSION = 1
+CHANGE_BATCH_SIZE = 500
+MAX_CHANGE_BATCH_SIZE = 5000
+
+# Everything a remote site needs to run on its own, parents before children
+FEED_MODELS = [
+    User, Astronaut, Medication, MedicationLot, MedicationThreshold, Prescription,
+    InventoryLog, AccessLog, AccessLogItem,
+]
+FEED_LABELS = {model._meta.label_lower: model for model in FEED_MODELS}
+
+# Payload codecs: (encode, decode). gzip is the default; lzma is ~20-30% smaller
+# on log-heavy batches for a lot more CPU, worth it on the slowest links.
+CODECS = {
+    'json': (lambda data: data, lambda data: data),
+    'gzip': (lambda data: gzip.compress(data, compresslevel=6), gzip.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+
+# ============================================================================
+# CHANGE FEED
+# ============================================================================
+
+def _advance_sequence(count, using):
+    """Claim `count` sequence numbers; returns the last. Holds the counter's row lock until commit."""
+    counter = SyncSequence.objects.using(using)
+    if not counter.filter(pk=1).update(value=F('value') + count):
+        SyncSequence.objects.using(using).get_or_create(pk=1)
+        counter.filter(pk=1).update(value=F('value') + count)
+    return counter.values_list('value', flat=True).get(pk=1)
+
+
+def _write_changes(changes, using):
+    """Stamp {(label, pk): deleted} with fresh sequence numbers, one row per object"""
+    with transaction.atomic(using=using):
+        last = _advance_sequence(len(changes), using)
+        first = last - len(changes) + 1
+        SyncChange.objects.using(using).bulk_create(
+            [
+                SyncChange(model=label, object_id=pk, deleted=deleted, seq=first + i)
+                for i, ((label, pk), deleted) in enumerate(changes.items())
+            ],
+            update_conflicts=True, unique_fields=['model', 'object_id'], update_fields=['seq', 'deleted'],
+        )
+
+
+def _flush_changes(using):
+    connection = connections[using]
+    changes = getattr(connection, 'sync_changes', None)
+    if changes:
+        connection.sync_changes = {}
+        _write_changes(changes, using)
+
+
+def record_changes(model, pks, deleted=False, using=DEFAULT_DB_ALIAS):
+    """
+    Queue feed entries for rows of a synced model; they are written in one
+    go after the surrounding transaction commits. Numbering at commit time,
+    under the counter's row lock, is what guarantees a reader never sees
+    seq N+1 before N - so a client cursor can never skip a change.
+    """
+    if not pks or (using == DEFAULT_DB_ALIAS and getattr(settings, 'EDGE_MODE', False)):
+        # An edge node's own writes travel upstream through its journal instead
+        return
+    connection = connections[using]
+    changes = getattr(connection, 'sync_changes', None)
+    if changes is None:
+        changes = connection.sync_changes = {}
+    label = model._meta.label_lower
+    for pk in pks:
+        changes[(label, pk)] = deleted
+    transaction.on_commit(lambda: _flush_changes(using), using=using)
+
+
+def feed_save(sender, instance, using=None, **kwargs):
+    """post_save receiver (raw saves included: they are real changes too)"""
+    record_changes(sender, [instance.pk], using=using)
+
+
+def feed_delete(sender, instance, using=None, **kwargs):
+    """post_delete receiver: leaves a tombstone so remote copies drop the row"""
+    record_changes(sender, [instance.pk], deleted=True, using=using)
+
+
+def connect_change_feed():
+    """Hook the feed into every synced model (called from AppConfig.ready on the central server)"""
+    for model in FEED_MODELS:
+        label = model._meta.label_lower
+        post_save.connect(feed_save, sender=model, dispatch_uid=f'sync_feed_save:{label}')
+        post_delete.connect(feed_delete, sender=model, dispatch_uid=f'sync_feed_delete:{label}')
+
+
+def latest_sequence(using=DEFAULT_DB_ALIAS):
+    return SyncSequence.objects.using(using).filter(pk=1).values_list('value', flat=True).first() or 0
+
+
+# ============================================================================
+# BATCHES
+# ============================================================================
+
+def _to_wire(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, FieldFile):
+        return value.name or ''
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def from_wire(field, value):
+    return None if value is None else field.to_python(value)
+
+
+def _rows(model, pks, using):
+    queryset = model._base_manager.using(using).filter(pk__in=pks).order_by('pk')
+    if model is Astronaut:
+        queryset = Astronaut.objects.using(using).with_face_encoding().filter(pk__in=pks).order_by('pk')
+    fields = model._meta.concrete_fields
+    return [[_to_wire(f.value_from_object(obj)) for f in fields] for obj in queryset]
+
+
+def _late_parents(pending, cursor, using):
+    """
+    A child in this batch may reference a parent whose latest change sorts
+    after the batch (it was edited since). Ship those parents now as well,
+    otherwise the receiving side would hit a foreign key violation.
+    """
+    for model in reversed(FEED_MODELS):
+        ids = pending.get(model._meta.label_lower)
+        if not ids:
+            continue
+        for field in model._meta.concrete_fields:
+            parent = field.related_model if field.is_relation else None
+            if parent is None or parent._meta.label_lower not in FEED_LABELS:
+                continue
+            label = parent._meta.label_lower
+            refs = set(
+                model._base_manager.using(using).filter(pk__in=ids, **{f'{field.attname}__isnull': False})
+                .values_list(field.attname, flat=True)
+            ) - pending[label]
+            if refs:
+                pending[label] |= set(
+                    SyncChange.objects.using(using)
+                    .filter(model=label, object_id__in=refs, seq__gt=cursor, deleted=False)
+                    .values_list('object_id', flat=True)
+                )
+
+
+def changes_since(since, limit=CHANGE_BATCH_SIZE, using=DEFAULT_DB_ALIAS):
+    """
+    The next batch of changes after sequence number `since`, as a plain dict:
+
+        {'v': 1, 'since': 0, 'cursor': 812, 'more': True,
+         'models': {'medical_inventory.medication': {'fields': [...], 'rows': [[...], ...]}},
+         'deleted': {'medical_inventory.prescription': [17, 18]}}
+
+    Field names are sent once per model and rows as positional lists. Each
+    row is the object's current state, so a row changed ten times since the
+    client's cursor costs one row. Pass `cursor` back as `since` for the next
+    batch; a batch that never arrived is simply asked for again.
+    """
+    changes = list(
+        SyncChange.objects.using(using).filter(seq__gt=since).order_by('seq')
+        .values_list('seq', 'model', 'object_id', 'deleted')[:limit]
+    )
+    cursor = changes[-1][0] if changes else since
+    pending = defaultdict(set)
+    deleted = defaultdict(list)
+    for _seq, label, object_id, is_deleted in changes:
+        if label not in FEED_LABELS:
+            continue
+        if is_deleted:
+            deleted[label].append(object_id)
+        else:
+            pending[label].add(object_id)
+    _late_parents(pending, cursor, using)
+
+    models = {}
+    for label, model in FEED_LABELS.items():
+        if pending.get(label):
+            rows = _rows(model, pending[label], using)
+            if rows:
+                models[label] = {'fields': [f.attname for f in model._meta.concrete_fields], 'rows': rows}
+            # Gone since the change was recorded; its tombstone may not be numbered yet
+            pk_index = model._meta.concrete_fields.index(model._meta.pk)
+            deleted[label].extend(sorted(pending[label] - {row[pk_index] for row in rows}))
+    return {
+        'v': PROTOCOL_VERSION,
+        'since': since,
+        'cursor': cursor,
+        'more': len(changes) == limit,
+        'count': len(changes),
+        'models': models,
+        'deleted': {label: ids for label, ids in deleted.items() if ids},
+    }
+
+
+def encode_payload(payload, codec='gzip'):
+    data = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return CODECS[codec][0](data)
+
+
+def decode_payload(data, codec='gzip'):
+    """Raises ValueError for an unknown codec or a corrupt payload"""
+    if codec not in CODECS:
+        raise ValueError(f'Unknown sync encoding: {codec}')
+    try:
+        return json.loads(CODECS[codec][1](data))
+    except (OSError, EOFError, lzma.LZMAError) as e:
+        raise ValueError(f'Corrupt {codec} payload: {e}') from e
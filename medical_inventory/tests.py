@@ -1 +1,628 @@
-from django.test import TestCase
+import gzip
+import pickle
+import re
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import AsyncClient, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .caching import bump_face_index_version
+from .checks import shared_cache_check
+from .edge import apply_changes, apply_pushed_batch
+from .enrollment import get_face_index
+from .expiry import sweep_expired
+from .forecasting import HISTORY_DAYS, MAX_DAYS_OF_SUPPLY, SMOOTHING_ALPHA, forecast, update_rates
+from .ledger import (
+    InsufficientStock, check_consistency, pick_lots, record_movement, repair_projection, set_quantity, stock_at,
+    stock_levels, take_snapshots,
+)
+from .limits import apply_checkout_limits, bucket_start, rolling_totals
+from .models import (
+    AccessLog, Astronaut, ConsumptionForecast, DailyInventorySnapshot, InventoryLog, Medication, MedicationCheckout,
+    MedicationLot, MedicationThreshold, StockSnapshot, SyncChange, SyncCheckpoint, SyncJournal, WarningLog,
+    WithdrawalCounter,
+)
+from .planning import plan_resupply
+from .sync import CODECS, changes_since, decode_payload, encode_payload
+
+# face_encoding selected as a column (not just tested with IS NULL / IS NOT NULL)
+SELECTS_FACE_ENCODING = re.compile(r'"face_encoding"(?!\s+IS\b)')
+
+
+class AstronautHeavyColumnTests(TestCase):
+    """Hot queries must not pull face_encoding off the database link"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        user = User.objects.create_user('A1', password='pw')
+        cls.astronaut = Astronaut.objects.create(
+            user=user, astronaut_id='A1', name='Ann',
+            face_encoding=pickle.dumps(np.zeros(128)),
+        )
+        medication = Medication.objects.create(name='Ibuprofen', current_quantity=50)
+        MedicationCheckout.objects.create(astronaut=cls.astronaut, medication=medication, quantity=1)
+        AccessLog.objects.create(event_type='UNLOCK', astronaut=cls.astronaut)
+
+    def assertNoHeavyColumns(self, queries):
+        for query in queries:
+            self.assertIsNone(SELECTS_FACE_ENCODING.search(query['sql']), query['sql'])
+
+    def test_default_manager_defers_face_encoding(self):
+        with CaptureQueriesContext(connection) as ctx:
+            astronaut = Astronaut.objects.get(pk=self.astronaut.pk)
+            self.assertEqual(astronaut.name, 'Ann')
+        self.assertNoHeavyColumns(ctx.captured_queries)
+
+    def test_related_access_defers_face_encoding(self):
+        checkout = MedicationCheckout.objects.get()
+        user = User.objects.get(username='A1')
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(checkout.astronaut.name, 'Ann')
+            self.assertEqual(user.astronaut.astronaut_id, 'A1')
+        self.assertNoHeavyColumns(ctx.captured_queries)
+
+    def test_with_face_encoding_opts_in(self):
+        with self.assertNumQueries(1):
+            astronaut = Astronaut.objects.with_face_encoding().get(pk=self.astronaut.pk)
+            self.assertEqual(pickle.loads(astronaut.face_encoding).shape, (128,))
+
+    def test_views_do_not_select_face_encoding(self):
+        self.client.force_login(self.admin)
+        for url in ['/access-log/', '/access-log/export/', '/api/astronauts/list/']:
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertNoHeavyColumns(ctx.captured_queries)
+
+
+class LedgerTests(TestCase):
+    """Stock read back from InventoryLog (snapshot + tail) and the consistency check"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.medication = Medication.objects.create(name='Ibuprofen', current_quantity=0, minimum_quantity=5)
+        record_movement(self.medication, 100, 'RESTOCK', timestamp=self.now - timedelta(days=3))
+        record_movement(self.medication, -10, 'CHECKOUT', timestamp=self.now - timedelta(days=2))
+        record_movement(self.medication, -5, 'CHECKOUT', timestamp=self.now - timedelta(days=1))
+
+    def test_snapshot_plus_tail_matches_full_replay(self):
+        self.assertEqual(take_snapshots(when=self.now - timedelta(hours=36)), 1)
+        record_movement(self.medication, -7, 'CHECKOUT')
+        for when in (self.now - timedelta(days=2), self.now - timedelta(hours=12), None):
+            self.assertEqual(stock_levels(when), stock_levels(when, use_snapshots=False))
+        self.assertEqual(stock_levels()[self.medication.pk], 78)
+        self.assertEqual(self.medication.current_quantity, 78)
+
+    def test_backdated_log_invalidates_later_snapshots(self):
+        as_of = self.now - timedelta(hours=36)
+        take_snapshots(when=as_of)
+        record_movement(self.medication, -20, 'CHECKOUT', timestamp=self.now - timedelta(days=2, hours=1))
+        self.assertFalse(StockSnapshot.objects.filter(medication=self.medication, as_of=as_of).exists())
+        self.assertEqual(stock_at(self.medication, as_of), 70)
+        self.assertEqual(stock_levels()[self.medication.pk], self.medication.current_quantity)
+
+    def test_consistency_check_is_clean(self):
+        take_snapshots(when=self.now - timedelta(hours=36))
+        self.assertEqual(check_consistency(), {'projection': [], 'snapshots': [], 'chain': [], 'lots': []})
+
+    def test_drift_is_detected_and_repaired(self):
+        take_snapshots(when=self.now - timedelta(hours=36))
+        Medication.objects.filter(pk=self.medication.pk).update(current_quantity=90)
+        StockSnapshot.objects.update(quantity=1)
+        findings = check_consistency()
+        self.assertEqual(findings['projection'], [
+            {'medication_id': self.medication.pk, 'name': 'Ibuprofen', 'current_quantity': 90, 'ledger': 85},
+        ])
+        self.assertEqual([f['ledger'] for f in findings['snapshots']], [90])
+
+        self.assertEqual([m.pk for m in repair_projection()], [self.medication.pk])
+        self.medication.refresh_from_db()
+        self.assertEqual(self.medication.current_quantity, 85)
+        self.assertEqual(check_consistency()['projection'], [])
+        self.assertEqual(repair_projection(), [])
+
+
+class LotTests(TestCase):
+    """Lot-level stock: first-expiring-first-out dispensing keeps the lots summing to current_quantity"""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.medication = Medication.objects.create(name='Amoxicillin', current_quantity=0, minimum_quantity=5)
+        for days, quantity, lot_number in ((200, 30, 'C'), (20, 10, 'A'), (90, 15, 'B')):
+            record_movement(self.medication, quantity, 'RESTOCK', lot_number=lot_number,
+                            expiration_date=self.today + timedelta(days=days))
+
+    def lots(self):
+        return dict(MedicationLot.objects.filter(medication=self.medication).values_list('lot_number', 'quantity'))
+
+    def assertLotsMatchStock(self):
+        self.medication.refresh_from_db()
+        self.assertEqual(sum(self.lots().values()), self.medication.current_quantity)
+        self.assertEqual(check_consistency()['lots'], [])
+
+    def test_checkout_spans_lots_in_expiry_order(self):
+        picks, uncovered = pick_lots(self.medication.pk, 20)
+        self.assertEqual([(lot.lot_number, units) for lot, units in picks], [('A', 10), ('B', 10)])
+        self.assertEqual(uncovered, 0)
+
+        logs = record_movement(self.medication, -20, 'CHECKOUT')
+        self.assertEqual([(log.lot.lot_number, log.quantity_change) for log in logs], [('A', -10), ('B', -10)])
+        self.assertEqual([(log.previous_quantity, log.new_quantity) for log in logs], [(55, 45), (45, 35)])
+        self.assertEqual(self.lots(), {'A': 0, 'B': 5, 'C': 30})
+        # The date shown for the medication moves on to the next lot
+        self.assertEqual(self.medication.expiration_date, self.today + timedelta(days=90))
+        self.assertLotsMatchStock()
+
+    def test_insufficient_stock_changes_nothing(self):
+        with self.assertRaises(InsufficientStock):
+            record_movement(self.medication, -56, 'CHECKOUT')
+        with self.assertRaises(InsufficientStock):
+            record_movement(self.medication, -11, 'CHECKOUT', lot=MedicationLot.objects.get(lot_number='A'))
+        self.assertEqual(self.lots(), {'A': 10, 'B': 15, 'C': 30})
+        self.assertEqual(InventoryLog.objects.filter(log_type='CHECKOUT').count(), 0)
+        self.assertLotsMatchStock()
+
+    def test_restock_into_existing_and_new_lots(self):
+        record_movement(self.medication, 5, 'RESTOCK', lot_number='B', expiration_date=self.today + timedelta(days=90))
+        self.assertEqual(self.lots()['B'], 20)
+        record_movement(self.medication, 8, 'RESTOCK', lot_number='D', expiration_date=self.today + timedelta(days=5))
+        self.assertEqual(MedicationLot.objects.filter(medication=self.medication).count(), 4)
+        self.assertEqual(self.lots()['D'], 8)
+        self.assertEqual(self.medication.expiration_date, self.today + timedelta(days=5))
+        self.assertLotsMatchStock()
+
+    def test_count_correction_draws_first_expiring(self):
+        set_quantity(self.medication, 50)
+        self.assertEqual(self.lots(), {'A': 5, 'B': 15, 'C': 30})
+        self.assertLotsMatchStock()
+
+    def test_restock_view_rejects_bad_input(self):
+        self.client.force_login(User.objects.create_user('admin', password='pw', is_staff=True))
+        url = '/api/medications/restock/'
+        for quantity in (0, -5):
+            response = self.client.post(url, {'medication_id': self.medication.pk, 'quantity': quantity},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'medication_id': self.medication.pk, 'quantity': 4, 'lot_number': None},
+                                    content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(self.lots()[''], 4)
+        self.assertLotsMatchStock()
+
+
+class ExpirySweepTests(TestCase):
+    """The bulk expiry sweep does what a per-lot write-off would, signals included"""
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ibuprofen = Medication.objects.create(name='Ibuprofen', current_quantity=0, minimum_quantity=5)
+            self.insulin = Medication.objects.create(name='Insulin', current_quantity=0, minimum_quantity=10)
+            for medication, days, quantity, lot_number in (
+                (self.ibuprofen, -1, 20, 'I1'), (self.ibuprofen, 60, 8, 'I2'), (self.insulin, -3, 5, 'N1'),
+            ):
+                record_movement(medication, quantity, 'RESTOCK', lot_number=lot_number,
+                                expiration_date=self.today + timedelta(days=days))
+
+    def test_expired_lots_are_written_off(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            logs = sweep_expired(self.today)
+        self.assertEqual(sorted((log.lot.lot_number, log.quantity_change) for log in logs), [('I1', -20), ('N1', -5)])
+        self.assertEqual(InventoryLog.objects.filter(log_type='EXPIRED').count(), 2)
+        self.assertEqual(
+            dict(MedicationLot.objects.values_list('lot_number', 'quantity')), {'I1': 0, 'I2': 8, 'N1': 0},
+        )
+
+        self.ibuprofen.refresh_from_db()
+        self.insulin.refresh_from_db()
+        self.assertEqual((self.ibuprofen.current_quantity, self.ibuprofen.status), (8, 'NORMAL'))
+        self.assertEqual(self.ibuprofen.expiration_date, self.today + timedelta(days=60))
+        self.assertEqual((self.insulin.current_quantity, self.insulin.status), (0, 'OUT'))
+        self.assertEqual(check_consistency()['lots'], [])
+        self.assertEqual(check_consistency()['projection'], [])
+
+        snapshot = DailyInventorySnapshot.objects.get(medication=self.ibuprofen, date=self.today)
+        self.assertEqual((snapshot.opening_quantity, snapshot.closing_quantity, snapshot.restocked), (0, 8, 28))
+
+    def test_sweep_feeds_the_change_log(self):
+        cursor = SyncChange.objects.order_by('-seq').values_list('seq', flat=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            logs = sweep_expired(self.today)
+        payload = changes_since(cursor)
+        rows = {
+            label: {row[model['fields'].index('id')] for row in model['rows']}
+            for label, model in payload['models'].items()
+        }
+        self.assertEqual(rows['medical_inventory.inventorylog'], {log.pk for log in logs})
+        self.assertEqual(rows['medical_inventory.medicationlot'], {log.lot_id for log in logs})
+        self.assertEqual(rows['medical_inventory.medication'], {self.ibuprofen.pk, self.insulin.pk})
+
+    def test_nothing_expired_writes_nothing(self):
+        sweep_expired(self.today)
+        with self.assertNumQueries(1):
+            self.assertEqual(sweep_expired(self.today), [])
+        self.assertEqual(InventoryLog.objects.filter(log_type='EXPIRED').count(), 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ForecastTests(TestCase):
+    """Smoothed consumption rates move forward a day at a time from the daily rollups"""
+
+    def setUp(self):
+        cache.clear()  # forecast() is cached per inventory version
+        self.today = timezone.localdate()
+        self.medication = Medication.objects.create(name='Ibuprofen', current_quantity=0, minimum_quantity=5)
+
+    def dispensed(self, day, units):
+        at = timezone.make_aware(datetime.combine(day, time.min))
+        DailyInventorySnapshot.objects.update_or_create(
+            medication=self.medication, date=day,
+            defaults={'opening_quantity': 0, 'closing_quantity': 0, 'dispensed': units,
+                      'first_log_at': at, 'last_log_at': at},
+        )
+
+    def test_rate_is_seeded_then_smoothed_a_day_at_a_time(self):
+        for days_ago in range(1, HISTORY_DAYS + 1):
+            self.dispensed(self.today - timedelta(days=days_ago), 9)
+        self.assertAlmostEqual(update_rates(self.today)[self.medication.pk], 9.0)
+        # Nothing new to fold in until a day completes
+        with self.assertNumQueries(2):
+            update_rates(self.today)
+
+        self.dispensed(self.today, 19)
+        self.assertAlmostEqual(update_rates(self.today + timedelta(days=1))[self.medication.pk], 10.0)
+        self.assertEqual(ConsumptionForecast.objects.get().through_date, self.today)
+
+    def test_backdated_checkout_reseeds_the_rate(self):
+        update_rates(self.today)
+        self.assertEqual(ConsumptionForecast.objects.get().daily_rate, 0)
+
+        record_movement(self.medication, 90, 'RESTOCK')
+        record_movement(self.medication, -90, 'CHECKOUT', timestamp=timezone.now() - timedelta(days=3))
+        # The stored rate had already folded that day in as zero
+        self.assertFalse(ConsumptionForecast.objects.exists())
+        # Re-seeded from the window average (1/day), then the 90 units smoothed in two days before the end
+        decay = 1 - SMOOTHING_ALPHA
+        expected = decay ** HISTORY_DAYS * 1.0 + SMOOTHING_ALPHA * decay ** 2 * 90
+        self.assertAlmostEqual(update_rates(self.today)[self.medication.pk], expected)
+
+    def test_days_of_supply_and_runout(self):
+        slow = Medication.objects.create(name='Slow', current_quantity=1000)
+        unused = Medication.objects.create(name='Unused', current_quantity=10)
+        Medication.objects.filter(pk=self.medication.pk).update(current_quantity=45)
+        yesterday = self.today - timedelta(days=1)
+        ConsumptionForecast.objects.bulk_create([
+            ConsumptionForecast(medication=self.medication, daily_rate=9, through_date=yesterday),
+            ConsumptionForecast(medication=slow, daily_rate=0.02, through_date=yesterday),
+            ConsumptionForecast(medication=unused, daily_rate=0.001, through_date=yesterday),
+        ])
+
+        supply = forecast()
+        self.assertEqual(supply[self.medication.pk]['days_of_supply'], 5.0)
+        self.assertEqual(supply[self.medication.pk]['runout_date'], self.today + timedelta(days=5))
+        # 50000 days is capped rather than reported
+        self.assertEqual(supply[slow.pk]['days_of_supply'], MAX_DAYS_OF_SUPPLY)
+        self.assertEqual(supply[slow.pk]['runout_date'], self.today + timedelta(days=MAX_DAYS_OF_SUPPLY))
+        self.assertEqual(supply[unused.pk], {'daily_rate': 0.0, 'days_of_supply': None, 'runout_date': None})
+
+
+class SyncTests(TestCase):
+    """Edge sync: stock merged as deltas, retried pushes applied once, payload codecs"""
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.medication = Medication.objects.create(name='Paracetamol', current_quantity=0, minimum_quantity=10)
+            record_movement(self.medication, 50, 'RESTOCK', lot_number='P1')
+        self.lot = MedicationLot.objects.get(medication=self.medication)
+
+    def stock_move(self, entry_id, delta):
+        return [
+            SyncJournal(id=entry_id, model='medical_inventory.medication', object_id=self.medication.pk,
+                        operation='UPDATE', quantity_delta=delta),
+            SyncJournal(id=entry_id + 1, model='medical_inventory.medicationlot', object_id=self.lot.pk,
+                        operation='UPDATE', quantity_delta=delta),
+        ]
+
+    def assertStock(self, quantity):
+        self.medication.refresh_from_db()
+        self.lot.refresh_from_db()
+        self.assertEqual((self.medication.current_quantity, self.lot.quantity), (quantity, quantity))
+
+    def test_pushed_quantity_deltas_add_up(self):
+        # Two nodes dispensing while the ground restocks: nobody's move is overwritten
+        apply_pushed_batch(1, self.stock_move(1, -3))
+        record_movement(self.medication, 10, 'RESTOCK', lot_number='P1')
+        apply_pushed_batch(2, self.stock_move(1, -4))
+        self.assertStock(53)
+
+        apply_pushed_batch(1, self.stock_move(3, -48))
+        self.assertStock(5)
+        self.assertEqual(self.medication.status, 'CRITICAL')  # recomputed after the merge
+
+    def test_repushed_batch_is_applied_once(self):
+        batch = self.stock_move(1, -3) + [SyncJournal(
+            id=3, model='medical_inventory.medicationlot', object_id=(1 << 40) + 1, operation='INSERT',
+            payload={'medication_id': str(self.medication.pk), 'lot_number': 'E1', 'quantity': '0'},
+        )]
+        self.assertEqual(apply_pushed_batch(1, batch), 3)
+        # The node never got the acknowledgement and sends the batch again, plus what came after
+        self.assertEqual(apply_pushed_batch(1, batch), 3)
+        self.assertEqual(apply_pushed_batch(1, batch[1:] + self.stock_move(4, -2)), 5)
+        self.assertStock(45)
+        self.assertEqual(MedicationLot.objects.filter(lot_number='E1').count(), 1)
+        self.assertEqual(SyncCheckpoint.objects.get(node_id=1).last_journal_id, 5)
+
+    def test_pull_keeps_unpushed_local_moves(self):
+        payload = changes_since(0)
+        self.assertIn('medical_inventory.medication', payload['models'])
+        # Dispensed here and not pushed yet: 50 upstream, 44 locally
+        apply_changes(payload, {Medication: {self.medication.pk: -6}, MedicationLot: {self.lot.pk: -6}})
+        self.assertStock(44)
+
+    def test_codecs_round_trip(self):
+        payload = changes_since(0)
+        for codec in CODECS:
+            self.assertEqual(decode_payload(encode_payload(payload, codec), codec), payload, codec)
+        self.assertLess(len(encode_payload(payload, 'lzma')), len(encode_payload(payload, 'json')))
+        with self.assertRaises(ValueError):
+            decode_payload(b'not compressed', 'gzip')
+        with self.assertRaises(ValueError):
+            decode_payload(encode_payload(payload, 'lzma'), 'zstd')
+
+
+class WarningAcknowledgeTests(TestCase):
+    """Bulk acknowledge changes data for the logged-in user, so it needs the CSRF token"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('admin', password='pw', is_staff=True)
+        astronaut = Astronaut.objects.create(
+            user=User.objects.create_user('A1', password='pw'), astronaut_id='A1', name='Ann',
+        )
+        medication = Medication.objects.create(name='Ibuprofen', current_quantity=50)
+        self.warning = WarningLog.objects.create(
+            astronaut=astronaut, medication=medication, quantity_taken=5, severity='HIGH', warning_message='Large checkout',
+        )
+
+    def test_cross_site_post_is_rejected(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post('/api/warnings/acknowledge/', {'ids': [self.warning.pk]},
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+        self.warning.refresh_from_db()
+        self.assertFalse(self.warning.acknowledged)
+
+    def test_page_token_is_accepted(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        page = client.get('/warnings/')
+        response = client.post('/api/warnings/acknowledge/', {'ids': [self.warning.pk]},
+                               content_type='application/json', HTTP_X_CSRFTOKEN=str(page.context['csrf_token']))
+        self.assertTrue(response.json()['success'])
+        self.warning.refresh_from_db()
+        self.assertTrue(self.warning.acknowledged)
+
+
+class SharedCacheCheckTests(TestCase):
+    """Version counters must be visible to every process that bumps them"""
+
+    def test_process_local_cache_is_an_error(self):
+        locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=locmem):
+            self.assertEqual([e.id for e in shared_cache_check(None)], ['medical_inventory.E001'])
+
+    def test_default_cache_is_shared(self):
+        self.assertEqual(shared_cache_check(None), [])
+
+
+class FaceIndexTests(TestCase):
+    """The in-memory face index follows the shared version, whichever process bumped it"""
+
+    def test_rebuilt_when_version_moves(self):
+        user = User.objects.create_user('A1', password='pw')
+        Astronaut.objects.create(user=user, astronaut_id='A1', name='Ann', face_encoding=pickle.dumps(np.zeros(128)))
+        other = Astronaut.objects.create(user=User.objects.create_user('A2'), astronaut_id='A2', name='Bo')
+        self.assertEqual(get_face_index().ids, [Astronaut.objects.get(astronaut_id='A1').pk])
+
+        # A queryset update (as a command in another process does) sends no signal ...
+        Astronaut.objects.filter(pk=other.pk).update(face_encoding=pickle.dumps(np.ones(128)))
+        self.assertEqual(len(get_face_index()), 1)
+        # ... its explicit bump is what reaches this process
+        bump_face_index_version()
+        index = get_face_index()
+        self.assertEqual(sorted(index.names), ['Ann', 'Bo'])
+        self.assertEqual(index.matrix.shape, (2, 128))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class InventoryResponseCacheTests(TestCase):
+    """Version-cached JSON responses revalidate against the body they actually served"""
+
+    def setUp(self):
+        self.medication = Medication.objects.create(name='Ibuprofen', current_quantity=50)
+        self.url = '/api/medications/list/'
+
+    def test_unchanged_body_revalidates_with_304(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_rebuilt_body_gets_a_new_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        # A body read from a lagging replica expires without the version moving;
+        # once rebuilt from caught-up data the old tag must stop matching
+        Medication.objects.filter(pk=self.medication.pk).update(current_quantity=40)
+        cache.clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['medications'][0]['current_quantity'], 40)
+
+
+class CsvExportTests(TestCase):
+    """CSV exports stream chunk by chunk under both WSGI and ASGI"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        Medication.objects.bulk_create([Medication(name=f'Med {i:04d}', current_quantity=i) for i in range(3000)])
+
+    def test_wsgi_export_streams_sync_chunks(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/inventory/export/')
+        self.assertFalse(response.is_async)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks).decode().count('\n'), 3001)
+
+    async def test_asgi_export_streams_async_chunks(self):
+        client = AsyncClient()
+        await client.aforce_login(self.admin)
+        response = await client.get('/inventory/export/', {'gzip': '1'})
+        # An async iterator, so the ASGI handler sends chunks as they are made instead of buffering
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(gzip.decompress(b''.join(chunks)).decode().count('\n'), 3001)
+
+
+class CheckoutLimitTests(TestCase):
+    """Daily limits sum hourly WithdrawalCounter buckets over a rolling 24h window"""
+
+    def setUp(self):
+        self.astronaut = Astronaut.objects.create(
+            user=User.objects.create_user('A1', password='pw'), astronaut_id='A1', name='Ann',
+        )
+        self.medication = Medication.objects.create(name='Ibuprofen', current_quantity=100)
+        MedicationThreshold.objects.create(
+            medication=self.medication, daily_limit=10, single_dose_limit=8, warning_percentage=80,
+        )
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+
+    def checkout(self, quantity, at):
+        return apply_checkout_limits(self.astronaut, [(self.medication, quantity)], now=at)
+
+    def test_limit_boundary(self):
+        self.assertEqual([w.severity for w in self.checkout(7, self.now)], [])
+        # 8 of 10 reaches the warning percentage; exactly 10 is still within the limit
+        self.assertEqual([w.severity for w in self.checkout(1, self.now)], ['MEDIUM'])
+        self.assertEqual([w.severity for w in self.checkout(2, self.now)], ['MEDIUM'])
+        warnings = self.checkout(1, self.now)
+        self.assertEqual([w.severity for w in warnings], ['CRITICAL'])
+        self.assertIn('11 units in 24h', warnings[0].warning_message)
+        self.assertEqual(WarningLog.objects.count(), 3)
+
+    def test_bucket_rollover(self):
+        self.checkout(6, self.now)
+        # 23h50m later the first checkout's bucket is the oldest one still counted
+        later = self.now + timedelta(hours=23, minutes=50)
+        self.assertEqual(rolling_totals(self.astronaut, [self.medication.id], later), {self.medication.id: 6})
+        self.assertEqual([w.severity for w in self.checkout(5, later)], ['CRITICAL'])
+
+        # Once its whole hour is more than 24h old it drops out and is pruned
+        next_day = self.now + timedelta(hours=25)
+        self.assertEqual(rolling_totals(self.astronaut, [self.medication.id], next_day), {self.medication.id: 5})
+        self.checkout(1, next_day)
+        self.assertEqual(
+            sorted(WithdrawalCounter.objects.values_list('quantity', flat=True)), [1, 5],
+        )
+
+    def test_concurrent_checkout_shares_the_hour_bucket(self):
+        update = QuerySet.update
+        raced = []
+
+        def racing_update(queryset, **kwargs):
+            if queryset.model is WithdrawalCounter and not raced:
+                # Our update finds no bucket, then another terminal inserts it before our create
+                raced.append(True)
+                WithdrawalCounter.objects.create(
+                    astronaut=self.astronaut, medication=self.medication,
+                    bucket_start=bucket_start(self.now), quantity=3,
+                )
+                return 0
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=racing_update):
+            self.checkout(4, self.now)
+        bucket = WithdrawalCounter.objects.get()
+        self.assertEqual(bucket.quantity, 7)
+        self.assertEqual(rolling_totals(self.astronaut, [self.medication.id], self.now), {self.medication.id: 7})
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResupplyPlanTests(TestCase):
+    """The resupply manifest fills the flight's budgets with what runs out first"""
+
+    def setUp(self):
+        cache.clear()  # forecast() is cached per inventory version
+        self.admin = User.objects.create_user('admin', password='pw', is_staff=True)
+        yesterday = timezone.localdate() - timedelta(days=1)
+        # Both used once a day: Short runs out in 5 days, Long in 60
+        self.short = Medication.objects.create(
+            name='Short', current_quantity=5, minimum_quantity=0, unit_mass_g=10, unit_volume_ml=4,
+        )
+        self.long = Medication.objects.create(
+            name='Long', current_quantity=60, minimum_quantity=0, unit_mass_g=10, unit_volume_ml=4, container_location='B2',
+        )
+        ConsumptionForecast.objects.bulk_create([
+            ConsumptionForecast(medication=self.short, daily_rate=1.0, through_date=yesterday),
+            ConsumptionForecast(medication=self.long, daily_rate=1.0, through_date=yesterday),
+        ])
+
+    def quantities(self, plan):
+        return {row['name']: row['quantity'] for row in plan['manifest']}
+
+    def test_unconstrained_plan_covers_the_horizon(self):
+        plan = plan_resupply(horizon_days=90)
+        self.assertEqual(plan['status'], 'unconstrained')
+        self.assertEqual(self.quantities(plan), {'Short': 85, 'Long': 30})
+        self.assertEqual(plan['uncovered_units'], 0)
+
+    def test_mass_budget_goes_to_what_runs_out_first(self):
+        plan = plan_resupply(mass_budget_g=300, horizon_days=90)
+        self.assertEqual(plan['status'], 'optimal')
+        self.assertEqual(self.quantities(plan), {'Short': 30})
+        self.assertEqual(plan['total_mass_g'], 300)
+        self.assertEqual(plan['uncovered_units'], 85)
+
+    def test_volume_and_cabinet_limits_both_hold(self):
+        # B2 already holds 60 x 4 ml, leaving room for 10 more units of Long
+        plan = plan_resupply(volume_budget_ml=1000, cabinet_capacity_ml={'B2': 280}, horizon_days=90)
+        self.assertEqual(self.quantities(plan), {'Short': 85, 'Long': 10})
+        self.assertEqual(plan['cabinets']['B2'], {'capacity_ml': 280, 'free_ml': 40, 'used_ml': 40})
+
+        plan = plan_resupply(volume_budget_ml=360, cabinet_capacity_ml={'B2': 280}, horizon_days=90)
+        self.assertEqual(self.quantities(plan), {'Short': 85, 'Long': 5})
+        self.assertEqual(plan['total_volume_ml'], 360)
+
+    def test_weightless_units_are_sent_and_reported(self):
+        Medication.objects.create(name='Unmeasured', current_quantity=0, minimum_quantity=7)
+        plan = plan_resupply(mass_budget_g=0, volume_budget_ml=0, horizon_days=90)
+        self.assertEqual(self.quantities(plan), {'Unmeasured': 7})
+        self.assertEqual(plan['unmeasured'], ['Unmeasured'])
+        self.assertEqual(plan['total_mass_g'], 0)
+
+    def test_solver_failure_is_503(self):
+        self.client.force_login(self.admin)
+        failed = SimpleNamespace(x=None, message='Time limit reached', status=1)
+        with mock.patch('medical_inventory.planning.linprog', return_value=failed):
+            response = self.client.get('/api/resupply/plan/', {'mass_g': 100})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json()['success'])
+        self.assertIn('Time limit reached', response.json()['message'])
+
+    def test_bad_limits_are_400(self):
+        self.client.force_login(self.admin)
+        for params in ({'mass_g': -1}, {'cabinet': 'B2'}, {'horizon_days': 0}):
+            response = self.client.get('/api/resupply/plan/', params)
+            self.assertEqual(response.status_code, 400, params)
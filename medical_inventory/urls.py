@@ -24,6 +24,7 @@ urlpatterns = [
     path('add/', views.add_medication, name='add_medication'),
     path('api/medications/delete/<int:medication_id>/', views.delete_medication, name='delete_medication'),
     path('inventory/export/', views.export_inventory_csv, name='export_inventory_csv'),
+    path('inventory/events/', views.inventory_events, name='inventory_events'),
     # path('inventory/<int:medication_id>/', views.medication_detail, name='medication_detail'),
     # path('<int:id>/', views.medication_detail, name='medication_detail'),
     # path('inventory/add/', views.add_medication, name='add_medication'),
@@ -38,8 +39,10 @@ urlpatterns = [
     path('manage/medications/', views.manage_medications, name='manage_medications'),
     
     # Warning System
-    # path('warnings/', views.warning_log_view, name='warning_log'),
-    # path('warnings/<int:warning_id>/acknowledge/', views.acknowledge_warning, name='acknowledge_warning'),
+    path('warnings/', views.warning_log_view, name='warning_log'),
+    path('warnings/<int:warning_id>/acknowledge/', views.acknowledge_warning, name='acknowledge_warning'),
+    path('api/warnings/', views.warnings_api, name='warnings_api'),
+    path('api/warnings/acknowledge/', views.acknowledge_warnings_api, name='acknowledge_warnings_api'),
     
     # API endpoints - Face Authentication
     path('api/authenticate/', views.authenticate_face, name='authenticate_face'),
@@ -50,7 +53,9 @@ urlpatterns = [
     path('api/astronauts/add/', views.add_astronaut, name='add_astronaut'),
     path('api/astronauts/list/', views.list_astronauts, name='list_astronauts'),
     path('api/astronauts/update-face/', views.update_astronaut_face, name='update_astronaut_face'),
+    path('api/astronauts/<int:astronaut_id>/enrollment/', views.astronaut_enrollment_status, name='astronaut_enrollment_status'),
     path('api/astronauts/delete/<int:astronaut_id>/', views.delete_astronaut, name='delete_astronaut'),
+    path('astronauts/<int:astronaut_id>/photo/<str:variant>/', views.astronaut_photo, name='astronaut_photo'),
     
     # API endpoints - Medication Management
     path('api/medications/add/', views.add_medication, name='add_medication'),
@@ -63,7 +68,16 @@ urlpatterns = [
     # Logging and History
     path('access-log/', views.access_log_view, name='access_log'),
     path('access-log/export/', views.export_access_log_csv, name='export_access_log_csv'),
+    path('logs/export/columnar/', views.export_logs_columnar, name='export_logs_columnar'),
     
     path('inventory/graph/', views.medication_inventory_graph, name='inventory_graph'),
     path('api/medications/history/', views.medication_history_api, name='medication_history_api'),
+    path('api/medications/stock/', views.stock_levels_api, name='stock_levels_api'),
+    path('api/medications/forecast/', views.forecast_api, name='forecast_api'),
+    path('api/resupply/plan/', views.resupply_plan_api, name='resupply_plan_api'),
+
+    # Delta sync between sites (token auth, see SYNC_TOKEN)
+    path('api/sync/changes/', views.sync_changes_api, name='sync_changes_api'),
+    path('api/sync/push/', views.sync_push_api, name='sync_push_api'),
+    path('api/sync/checkpoint/<int:node_id>/', views.sync_checkpoint_api, name='sync_checkpoint_api'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
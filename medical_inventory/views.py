@@ -1,13 +1,17 @@
 # views.py - Updated with Authentication, Camera Capture, Transaction Log
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
+from django.urls import reverse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils import timezone
-from django.db.models import Sum, Count, Q
-from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.db.models import Count, Avg, Q, F, Exists, OuterRef, Prefetch, BooleanField, ExpressionWrapper
 from django.core.files.storage import default_storage
 from django.conf import settings
+from django.db import transaction
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
@@ -20,20 +24,25 @@ from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
 import face_recognition
-import pickle
 import requests
 import json
+import hmac
 import numpy as np
 import cv2
-import csv
 import hashlib
 import io
 import base64
 import os
-from datetime import timedelta
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from collections import Counter
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
 import serial
 import serial.tools.list_ports
-from .models import Astronaut, Medication, Prescription, MedicationCheckout, InventoryLog, SystemLog, AccessLog, AccessLogItem
+from .models import Astronaut, Medication, Prescription, MedicationCheckout, InventoryLog, SystemLog, AccessLog, AccessLogItem, DailyInventorySnapshot, WarningLog, SyncCheckpoint
 
 # Import for deep learning model (TensorFlow/Keras)
 try:
@@ -46,10 +55,31 @@ except ImportError:
 
 # Import for color/shape analysis
 from sklearn.cluster import KMeans
-import pytesseract
-if os.name == 'nt':
-    pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 from .forms import MedicationForm
+from .ocr import get_ocr_backend
+from .caching import (
+    bump_warnings_version, cache_inventory_response, get_cached_payload, inventory_etag, stamp_inventory_response
+)
+from .analytics import forward_fill_series
+from .photos import delete_astronaut_photo, photo_version, set_astronaut_photo
+from .enrollment import get_face_index, queue_enrollment
+from .limits import apply_checkout_limits
+from .events import event_stream, async_event_stream, warning_stats
+from .pagination import decode_cursor, keyset_page
+from .routers import use_replica
+from .ledger import InsufficientStock, lot_summaries, record_movement, set_quantity, stock_levels
+from .expiry import expiring_soon, warning_days
+from .forecasting import forecast
+from .planning import DEFAULT_HORIZON_DAYS, SolverError, parse_cabinets, plan_resupply
+from .edge import apply_pushed_batch, journal_bulk_create, journal_from_wire, update_journaled
+from .sync import (
+    CHANGE_BATCH_SIZE, CODECS as SYNC_CODECS, MAX_CHANGE_BATCH_SIZE, changes_since, decode_payload,
+    encode_payload, record_changes,
+)
+from .exports import EXPORT_CHUNK_SIZE, streaming_csv_response
+from .columnar import (
+    TABLES as COLUMNAR_TABLES, export_tables as export_columnar_tables, resolve_format as resolve_columnar_format
+)
 from sklearn.cluster import KMeans
 
 ESP32_IP = getattr(settings, 'ESP32_IP_ADDRESS', '')
@@ -131,24 +161,23 @@ def authenticate_face(request):
                     'success': False,
                     'message': 'Could not process face. Please try again.'
                 })
-            astronauts = list(Astronaut.objects.exclude(face_encoding__isnull=True))
+            # Cached per process; only rebuilt after an enrollment changes
+            face_index = get_face_index()
 
-            if not astronauts:
+            if not len(face_index):
                 return JsonResponse({
                     'success': False,
                     'message': 'No registered users found in the system.'
                 })
 
-            known_encodings = [pickle.loads(a.face_encoding) for a in astronauts]
-
             for face_encoding in face_encodings:
-                distances = face_recognition.face_distance(known_encodings, face_encoding)
+                distances = face_recognition.face_distance(face_index.matrix, face_encoding)
 
                 best_index = int(distances.argmin())
                 best_distance = distances[best_index]
 
-                print(f"Best match: {astronauts[best_index].name}, distance: {best_distance:.4f}")
-                print(f"All distances: {[(astronauts[i].name, round(d, 4)) for i, d in enumerate(distances)]}")
+                print(f"Best match: {face_index.names[best_index]}, distance: {best_distance:.4f}")
+                print(f"All distances: {[(face_index.names[i], round(d, 4)) for i, d in enumerate(distances)]}")
                 THRESHOLD = 0.45
 
                 if best_distance > THRESHOLD:
@@ -177,7 +206,7 @@ def authenticate_face(request):
                         })
 
                 # Success
-                astronaut = astronauts[best_index]
+                astronaut = Astronaut.objects.only('id', 'name').get(pk=face_index.ids[best_index])
                 confidence = round((1 - best_distance) * 100, 1)
 
                 SystemLog.objects.create(
@@ -221,7 +250,12 @@ def medication_selection(request, astronaut_id):
         astronaut=astronaut,
         is_active=True
     ).select_related('medication')
-    all_medications = Medication.objects.filter(current_quantity__gt=0)
+    all_medications = list(Medication.objects.filter(current_quantity__gt=0))
+
+    # The lot the next checkout draws from (first expiring first out)
+    lots = lot_summaries()
+    for medication in all_medications + [p.medication for p in prescriptions]:
+        medication.next_lot = lots.get(medication.id)
     
     context = {
         'astronaut': astronaut,
@@ -263,31 +297,38 @@ def checkout_medication(request):
                     'previous_quantity': medication.current_quantity
                 })
             
-              # Create AccessLog entry for this unlock
-            access_log = AccessLog.objects.create(
-                event_type='UNLOCK',
-                astronaut=astronaut,
-                door_open_seconds=data.get('door_open_seconds'),  # passed from frontend
-            )
-            for med_data in medications:
-                AccessLogItem.objects.create(
-                    access_log=access_log,
-                    medication=Medication.objects.get(id=med_data['medication_id']),
-                    quantity=med_data['quantity'],
+            with transaction.atomic():
+                # Each checkout decrements stock and writes its CHECKOUT inventory log
+                for item in medication_list:
+                    MedicationCheckout.objects.create(
+                        astronaut=astronaut,
+                        medication=item['medication'],
+                        quantity=item['quantity'],
+                        is_prescription=item['is_prescription'],
+                    )
+                checkouts_created = len(medication_list)
+
+                # Rolling 24h / single-dose limits: counted atomically with the checkout, warnings don't block
+                warnings = apply_checkout_limits(
+                    astronaut, [(item['medication'], item['quantity']) for item in medication_list]
                 )
 
-            # Create AccessLog entry for this unlock
-            access_log = AccessLog.objects.create(
-                event_type='UNLOCK',
-                astronaut=astronaut,
-                door_open_seconds=data.get('door_open_seconds'),
-            )
-            for med_data in medications:
-                AccessLogItem.objects.create(
-                    access_log=access_log,
-                    medication=Medication.objects.get(id=med_data['medication_id']),
-                    quantity=med_data['quantity'],
+                # Create AccessLog entry for this unlock
+                access_log = AccessLog.objects.create(
+                    event_type='UNLOCK',
+                    astronaut=astronaut,
+                    door_open_seconds=data.get('door_open_seconds'),  # passed from frontend
                 )
+                items = AccessLogItem.objects.bulk_create([
+                    AccessLogItem(
+                        access_log=access_log,
+                        medication=item['medication'],
+                        quantity=item['quantity'],
+                    )
+                    for item in medication_list
+                ])
+                journal_bulk_create(items)
+                record_changes(AccessLogItem, [item.pk for item in items])
 
             unlock_success = send_esp32_unlock(astronaut)
 
@@ -302,8 +343,19 @@ def checkout_medication(request):
                 'success': True,
                 'checkouts': checkouts_created,
                 'unlock_status': unlock_success,
+                'warnings': [
+                    {
+                        'medication': warning.medication.name,
+                        'severity': warning.severity,
+                        'message': warning.warning_message,
+                    }
+                    for warning in warnings
+                ],
             })
             
+        except InsufficientStock as e:
+            # Another terminal took the last units after the check above
+            return JsonResponse({'success': False, 'message': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({
                 'success': False,
@@ -313,52 +365,6 @@ def checkout_medication(request):
     return JsonResponse({'error': 'POST required'}, status=400)
 
 
-def check_medication_threshold(astronaut, medication, quantity):
-    """Check if medication withdrawal exceeds thresholds"""
-    try:
-        threshold = medication.threshold
-    except:
-        return False, None
-    
-    # warning_created = False
-    max_severity = None
-    
-    # Check single dose limit
-    # if quantity > threshold.single_dose_limit:
-    #     severity = 'CRITICAL' if quantity > threshold.single_dose_limit * 1.5 else 'HIGH'
-    #     WarningLog.objects.create(
-    #         astronaut=astronaut,
-    #         medication=medication,
-    #         quantity_taken=quantity,
-    #         warning_message=f"Single dose limit exceeded: {quantity} units (limit: {threshold.single_dose_limit})",
-    #         severity=severity
-    #     )
-    #     warning_created = True
-    #     max_severity = severity
-    
-    # Check daily limit
-    # today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    # today_total = MedicationCheckout.objects.filter(
-    #     astronaut=astronaut,
-    #     medication=medication,
-    #     checkout_time__gte=today_start
-    # ).aggregate(total=Sum('quantity'))['total'] or 0
-    # today_total += quantity
-    
-    # if today_total > threshold.daily_limit:
-    #     WarningLog.objects.create(
-    #         astronaut=astronaut,
-    #         medication=medication,
-    #         quantity_taken=quantity,
-    #         warning_message=f"Daily limit exceeded: {today_total} units today (limit: {threshold.daily_limit})",
-    #         severity='CRITICAL'
-    #     )
-    #     warning_created = True
-    #     max_severity = 'CRITICAL'
-    
-    # return warning_created, max_severity
-
-
 # ============================================================================
 # ESP32 COMMUNICATION - USB SERIAL & WIFI
 # ============================================================================
@@ -482,6 +488,12 @@ def delete_medication(request, medication_id):
    
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
+DASHBOARD_MEDICATION_FIELDS = (
+    'id', 'name', 'medication_type', 'dosage',
+    'current_quantity', 'minimum_quantity', 'container_location',
+)
+
+
 @login_required
 def inventory_dashboard(request):
     """Inventory dashboard"""
@@ -489,23 +501,64 @@ def inventory_dashboard(request):
     if not request.user.is_authenticated:
         return redirect('/?alert=login_required')
     
-    medications = Medication.objects.all().order_by('name')
-    total_medications = medications.count()
-    low_stock_count = sum(1 for med in medications if med.is_low_stock)
+    # The rendered page embeds this user's CSRF token, so only the data is shared
+    etag, not_modified = inventory_etag(
+        request, 'dashboard', request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    )
+    if not_modified:
+        return not_modified
+    
+    context = get_cached_payload('dashboard', _build_dashboard_context)
+    
+    return stamp_inventory_response(render(request, 'inventory_dashboard.html', context), etag)
+
+
+def _build_dashboard_context():
+    # Only the columns the table renders, evaluated once
+    medications = list(
+        Medication.objects.only(*DASHBOARD_MEDICATION_FIELDS).order_by('name')
+    )
+    stats = Medication.objects.aggregate(
+        total_medications=Count('id'),
+        low_stock_count=Count('id', filter=Q(current_quantity__lte=F('minimum_quantity'))),
+    )
+    today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
     total_checkouts_today = MedicationCheckout.objects.filter(
-        checkout_time__date=timezone.now().date()
+        checkout_time__gte=today_start
     ).count()
+    supply = forecast()
+    for medication in medications:
+        medication.supply = supply.get(medication.id)
     
-    context = {
+    return {
         'medications': medications,
-        'total_medications': total_medications,
-        'low_stock_count': low_stock_count,
-        'total_checkouts_today': total_checkouts_today
+        'total_medications': stats['total_medications'],
+        'low_stock_count': stats['low_stock_count'],
+        'total_checkouts_today': total_checkouts_today,
+        'expiring': expiring_soon(),
+        'expiry_warning_days': warning_days(),
     }
+
+
+@login_required
+def inventory_events(request):
+    """Server-sent event stream of inventory deltas (quantity/status per medication)"""
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    cursor = int(cursor) if cursor and cursor.isdigit() else None
     
-    return render(request, 'inventory_dashboard.html', context)
+    if isinstance(request, ASGIRequest):
+        stream = async_event_stream(cursor)
+    else:
+        stream = event_stream(cursor)
+    
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # don't let a reverse proxy hold events back
+    return response
+
 
 @login_required
+@use_replica
 def medication_detail(request, medication_id):
     """Medication detail view with transaction log"""
     medication = get_object_or_404(Medication, id=medication_id)
@@ -514,29 +567,32 @@ def medication_detail(request, medication_id):
     checkouts = MedicationCheckout.objects.filter(
         medication=medication,
         checkout_time__gte=thirty_days_ago
-    ).order_by('-checkout_time')
+    ).select_related('astronaut').defer('astronaut__face_encoding').order_by('-checkout_time')
     
     # Get transaction log (inventory logs)
     inventory_logs = InventoryLog.objects.filter(
         medication=medication
-    ).order_by('-timestamp')[:50]
+    ).select_related('performed_by').defer('performed_by__face_encoding').order_by('-timestamp')[:50]
     
-    daily_usage = MedicationCheckout.objects.filter(
-        medication=medication,
-        checkout_time__gte=thirty_days_ago
-    ).annotate(
-        date=TruncDate('checkout_time')
-    ).values('date').annotate(
-        total_quantity=Sum('quantity'),
-        checkout_count=Count('id')
-    ).order_by('date')
+    daily_usage = [
+        {
+            'date': snapshot['date'].strftime('%Y-%m-%d'),
+            'total_quantity': snapshot['dispensed'],
+            'checkout_count': snapshot['checkouts'],
+        }
+        for snapshot in DailyInventorySnapshot.objects.filter(
+            medication=medication,
+            date__gte=thirty_days_ago.date(),
+            checkouts__gt=0
+        ).order_by('date').values('date', 'dispensed', 'checkouts')
+    ]
     
     total_dispensed_30d = sum(item['total_quantity'] for item in daily_usage)
     
     context = {
         'medication': medication,
         'checkouts': checkouts,
-        'daily_usage': list(daily_usage),
+        'daily_usage': daily_usage,
         'inventory_logs': inventory_logs,
         'total_dispensed_30d': total_dispensed_30d
     }
@@ -544,22 +600,21 @@ def medication_detail(request, medication_id):
     return render(request, 'medication_detail.html', context)
 
 @login_required
+@use_replica
 def export_inventory_csv(request):
-    """Export full inventory to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = (
-        f'attachment; filename="inventory_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-    )
-
-    writer = csv.writer(response)
-    writer.writerow([
+    """Export full inventory to CSV (add ?gzip=1 for a compressed download)"""
+    header = [
         'ID', 'Name', 'Generic Name', 'Type', 'Dosage',
         'Current Quantity', 'Minimum Quantity', 'Status',
         'Location', 'Expiration Date', 'Has Image'
-    ])
-
-    for med in Medication.objects.all().order_by('name'):
-        writer.writerow([
+    ]
+    medications = Medication.objects.only(
+        'id', 'name', 'generic_name', 'medication_type', 'dosage', 'current_quantity',
+        'minimum_quantity', 'status', 'container_location', 'expiration_date', 'pill_image',
+    ).order_by('name').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    rows = (
+        [
             med.id,
             med.name,
             med.generic_name,
@@ -571,9 +626,14 @@ def export_inventory_csv(request):
             med.container_location,
             med.expiration_date.strftime('%Y-%m-%d') if med.expiration_date else '',
             'Yes' if med.pill_image else 'No',
-        ])
+        ]
+        for med in medications
+    )
 
-    return response
+    return streaming_csv_response(
+        request, f'inventory_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        header, rows, compress=request.GET.get('gzip') == '1'
+    )
 
 # ============================================================================
 # ASTRONAUT MANAGEMENT (PROTECTED)
@@ -587,13 +647,17 @@ def manage_astronauts(request):
 @login_required
 @csrf_exempt
 def add_astronaut(request):
-    """Add new astronaut with face encoding"""
+    """
+    Add new astronaut. Returns 202 straight away; the face encoding runs in
+    the background and clients poll enrollment_status_url for the result.
+    """
     if request.method == 'POST':
         try:
             astronaut_id = request.POST.get('astronaut_id')
             name = request.POST.get('name')
             photo = request.FILES.get('photo')
-            password = request.POST.get('password', astronaut_id)
+            # No password given: face login only (an unusable password, not a guessable default)
+            password = request.POST.get('password') or None
             
             if not all([astronaut_id, name, photo]):
                 return JsonResponse({
@@ -601,46 +665,40 @@ def add_astronaut(request):
                     'message': 'All fields are required'
                 })
             
-            # Create user account
-            from django.contrib.auth.models import User
-            user = User.objects.create_user(
-                username=astronaut_id,
-                password=password,
-                first_name=name.split()[0] if name else '',
-                last_name=' '.join(name.split()[1:]) if len(name.split()) > 1 else ''
-            )
-            
-            # Create astronaut with base64 encoded photo
             photo.seek(0)  # Reset file pointer
-            photo_base64 = base64.b64encode(photo.read()).decode('utf-8')
-            
-            astronaut = Astronaut.objects.create(
-                user=user,
-                astronaut_id=astronaut_id,
-                name=name,
-                photo=photo_base64
-            )
-            
-            # Process face encoding
-            image = face_recognition.load_image_file(photo)
-            face_encodings = face_recognition.face_encodings(image)
+            photo_data = photo.read()
             
-            if face_encodings:
-                astronaut.face_encoding = pickle.dumps(face_encodings[0])
-                astronaut.save()
+            with transaction.atomic():
+                # A failed enrollment keeps its record, so re-adding the same ID retries it
+                astronaut = Astronaut.objects.filter(
+                    astronaut_id=astronaut_id, enrollment_status='FAILED'
+                ).select_for_update().first()
                 
-                return JsonResponse({
-                    'success': True,
-                    'message': 'Astronaut added successfully',
-                    'astronaut_id': astronaut.id
-                })
-            else:
-                astronaut.delete()
-                user.delete()
-                return JsonResponse({
-                    'success': False,
-                    'message': 'No face detected in photo. Please use a clear, front-facing photo.'
-                })
+                if astronaut is None:
+                    # Create user account; inactive until the face enrolls (enrollment.py)
+                    from django.contrib.auth.models import User
+                    user = User.objects.create_user(
+                        username=astronaut_id,
+                        password=password,
+                        is_active=False,
+                        first_name=name.split()[0] if name else '',
+                        last_name=' '.join(name.split()[1:]) if len(name.split()) > 1 else ''
+                    )
+                    astronaut = Astronaut(user=user, astronaut_id=astronaut_id)
+                astronaut.name = name
+                
+                # Photo + thumbnail go to file storage; an unreadable image fails here, synchronously
+                set_astronaut_photo(astronaut, photo_data, save=False)
+                queue_enrollment(astronaut)
+                astronaut.save()
+            
+            return JsonResponse({
+                'success': True,
+                'message': 'Astronaut added. Face enrollment in progress.',
+                'astronaut_id': astronaut.id,
+                'enrollment_status': astronaut.enrollment_status,
+                'enrollment_status_url': reverse('medical_inventory:astronaut_enrollment_status', args=[astronaut.id]),
+            }, status=202)
                 
         except Exception as e:
             return JsonResponse({
@@ -653,20 +711,81 @@ def add_astronaut(request):
 
 @csrf_exempt
 def list_astronauts(request):
-    """List all astronauts with photo URLs"""
-    astronauts = Astronaut.objects.all()
+    """List all astronauts with thumbnail URLs (face encodings stay in the database)"""
+    astronauts = Astronaut.objects.only(
+        'id', 'name', 'astronaut_id', 'photo_thumbnail', 'enrollment_status', 'enrollment_error'
+    ).annotate(
+        has_face_encoding=ExpressionWrapper(Q(face_encoding__isnull=False), output_field=BooleanField())
+    ).order_by('name')
     
     data = [{
         'id': a.id,
         'name': a.name,
         'astronaut_id': a.astronaut_id,
-        'has_face_encoding': a.face_encoding is not None,
-        'photo_url': f'data:image/jpeg;base64,{a.photo}' if a.photo else None
+        'has_face_encoding': a.has_face_encoding,
+        'enrollment_status': a.enrollment_status,
+        'enrollment_error': a.enrollment_error,
+        'photo_url': astronaut_photo_url(a),
+        'photo_full_url': astronaut_photo_url(a, 'full'),
     } for a in astronauts]
     
     return JsonResponse({'astronauts': data})
 
 
+@login_required
+def astronaut_enrollment_status(request, astronaut_id):
+    """Poll target for background face enrollment"""
+    astronaut = get_object_or_404(
+        Astronaut.objects.only('id', 'name', 'astronaut_id', 'photo_thumbnail', 'enrollment_status', 'enrollment_error'),
+        id=astronaut_id
+    )
+    return JsonResponse({
+        'success': True,
+        'astronaut_id': astronaut.id,
+        'name': astronaut.name,
+        'enrollment_status': astronaut.enrollment_status,
+        'enrollment_error': astronaut.enrollment_error,
+        'photo_url': astronaut_photo_url(astronaut),
+    })
+
+
+def astronaut_photo_url(astronaut, variant='thumb'):
+    version = photo_version(astronaut)
+    if not version:
+        return None
+    url = reverse('medical_inventory:astronaut_photo', args=[astronaut.id, variant])
+    return f'{url}?v={version}'
+
+
+@login_required
+def astronaut_photo(request, astronaut_id, variant='thumb'):
+    """
+    Serve an astronaut photo or thumbnail from file storage. URLs carry the
+    content hash (?v=), so matching requests can be cached indefinitely.
+    """
+    astronaut = get_object_or_404(
+        Astronaut.objects.only('id', 'astronaut_id', 'photo', 'photo_thumbnail'), id=astronaut_id
+    )
+    if variant not in ('thumb', 'full'):
+        return HttpResponse(status=404)
+    field = astronaut.photo if variant == 'full' else astronaut.photo_thumbnail
+    version = photo_version(astronaut)
+    if not field or not version:
+        return HttpResponse(status=404)
+
+    etag = f'"{version}-{variant}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+    else:
+        response = FileResponse(field.open('rb'), content_type='image/jpeg')
+    response['ETag'] = etag
+    if request.GET.get('v') == version:
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @csrf_exempt
 def update_astronaut_face(request):
     """Update astronaut face encoding with camera capture option"""
@@ -683,29 +802,21 @@ def update_astronaut_face(request):
             
             astronaut = get_object_or_404(Astronaut, id=astronaut_id)
             
-            # Update photo as base64
             photo.seek(0)  # Reset file pointer
-            photo_base64 = base64.b64encode(photo.read()).decode('utf-8')
-            astronaut.photo = photo_base64
+            photo_data = photo.read()
             
-            # Process face encoding
-            photo.seek(0)  # Reset file pointer again for face_recognition
-            image = face_recognition.load_image_file(photo)
-            face_encodings = face_recognition.face_encodings(image)
-            
-            if face_encodings:
-                astronaut.face_encoding = pickle.dumps(face_encodings[0])
+            # The current encoding keeps working until the new one is ready
+            with transaction.atomic():
+                set_astronaut_photo(astronaut, photo_data, save=False)
+                queue_enrollment(astronaut)
                 astronaut.save()
-                
-                return JsonResponse({
-                    'success': True,
-                    'message': 'Face encoding updated successfully'
-                })
-            else:
-                return JsonResponse({
-                    'success': False,
-                    'message': 'No face detected in photo'
-                })
+            
+            return JsonResponse({
+                'success': True,
+                'message': 'Face enrollment in progress',
+                'enrollment_status': astronaut.enrollment_status,
+                'enrollment_status_url': reverse('medical_inventory:astronaut_enrollment_status', args=[astronaut.id]),
+            }, status=202)
                 
         except Exception as e:
             return JsonResponse({
@@ -723,6 +834,7 @@ def delete_astronaut(request, astronaut_id):
         try:
             astronaut = get_object_or_404(Astronaut, id=astronaut_id)
             user = astronaut.user
+            delete_astronaut_photo(astronaut)
             astronaut.delete()
             user.delete()
             
@@ -760,12 +872,17 @@ def add_medication(request):
                 medication_type=request.POST.get('medication_type'),
                 dosage=request.POST.get('dosage'),
                 description=request.POST.get('description', ''),
-                current_quantity=int(request.POST.get('current_quantity', 0)),
                 minimum_quantity=int(request.POST.get('minimum_quantity', 0)),
                 container_location=request.POST.get('container_location'),
                 expiration_date=request.POST.get('expiration_date') or None,
-                pill_image=request.FILES.get('pill_image')
+                pill_image=request.FILES.get('pill_image'),
+                unit_mass_g=float(request.POST.get('unit_mass_g') or 0),
+                unit_volume_ml=float(request.POST.get('unit_volume_ml') or 0),
             )
+            opening_stock = int(request.POST.get('current_quantity', 0))
+            if opening_stock:
+                record_movement(medication, opening_stock, 'ADJUSTMENT', notes='Opening stock',
+                                expiration_date=medication.expiration_date)
             
             return JsonResponse({
                 'success': True,
@@ -793,35 +910,22 @@ def update_medication_quantity(request):
             reason = data.get('reason', 'Manual adjustment')
             
             medication = get_object_or_404(Medication, id=medication_id)
-            previous_quantity = medication.current_quantity
-            quantity_change = new_quantity - previous_quantity
-            
-            medication.current_quantity = new_quantity
-            medication.save()
-            
-            if quantity_change > 0:
-                access_log = AccessLog.objects.create(
-                    event_type='RESTOCK',
-                    astronaut=astronaut,
-                    notes=reason,
-                )
-                AccessLogItem.objects.create(
-                    access_log=access_log,
-                    medication=medication,
-                    quantity=quantity_change,
-                )
-                
-            # Log the change
             astronaut = request.user.astronaut if hasattr(request.user, 'astronaut') else None
-            InventoryLog.objects.create(
-                medication=medication,
-                log_type='ADJUSTMENT',
-                quantity_change=quantity_change,
-                previous_quantity=previous_quantity,
-                new_quantity=new_quantity,
-                performed_by=astronaut,
-                notes=reason
-            )
+            
+            with transaction.atomic():
+                logs = set_quantity(medication, new_quantity, performed_by=astronaut, notes=reason)
+                added = sum(log.quantity_change for log in logs)
+                if added > 0:
+                    access_log = AccessLog.objects.create(
+                        event_type='RESTOCK',
+                        astronaut=astronaut,
+                        notes=reason,
+                    )
+                    AccessLogItem.objects.create(
+                        access_log=access_log,
+                        medication=medication,
+                        quantity=added,
+                    )
             
             return JsonResponse({
                 'success': True,
@@ -846,26 +950,19 @@ def restock_medication(request):
             data = json.loads(request.body)
             medication_id = data.get('medication_id')
             quantity = int(data.get('quantity', 0))
-            expiration_date = data.get('expiration_date')
-            notes = data.get('notes', 'Restock')
+            expiration_date = parse_date(data.get('expiration_date') or '')
+            notes = data.get('notes') or 'Restock'
+            if quantity <= 0:
+                return JsonResponse({
+                    'success': False,
+                    'message': 'Restock quantity must be a positive number'
+                }, status=400)
             
             medication = get_object_or_404(Medication, id=medication_id)
-            previous_quantity = medication.current_quantity
-            
-            medication.current_quantity += quantity
-            medication.save()
-            
-            # Log the change
             astronaut = request.user.astronaut if hasattr(request.user, 'astronaut') else None
-            InventoryLog.objects.create(
-                medication=medication,
-                log_type='RESTOCK',
-                quantity_change=quantity,
-                previous_quantity=previous_quantity,
-                new_quantity=medication.current_quantity,
-                performed_by=astronaut,
-                notes=notes
-            )
+            # Goes into its own lot, so the older stock's earlier expiry isn't lost
+            record_movement(medication, quantity, 'RESTOCK', performed_by=astronaut, notes=notes,
+                            expiration_date=expiration_date, lot_number=data.get('lot_number') or '')
             
             return JsonResponse({
                 'success': True,
@@ -883,6 +980,7 @@ def restock_medication(request):
 
 
 @csrf_exempt  
+@cache_inventory_response('medications')
 def list_medications(request):
     """List all medications"""
     medications = Medication.objects.all()
@@ -922,7 +1020,8 @@ def update_medication_image(request):
             
             medication = get_object_or_404(Medication, id=medication_id)
             medication.pill_image = image
-            medication.save()
+            # Only the image: a full save would write back a stock level read before any concurrent checkout
+            medication.save(update_fields=['pill_image'])
             
             return JsonResponse({
                 'success': True,
@@ -942,13 +1041,34 @@ def update_medication_image(request):
 # BOTTLE READING (OCR-based medication scanning)
 # ============================================================================
 class PillBottleReader:
+    OCR_CONFIGS = [
+        '--oem 3 --psm 6',
+        '--oem 3 --psm 11',
+        '--oem 1 --psm 6',
+    ]
+    ORIGINAL_CONFIG = '--oem 3 --psm 6'
     
-    def __init__(self):
+    def __init__(self, ocr_backend=None):
         self.dosage_pattern = re.compile(r'(\d+\.?\d*)\s*(mg|mcg|g|ml|units?)', re.IGNORECASE)
+        self.ocr = ocr_backend or get_ocr_backend()
+    
+    @staticmethod
+    @contextmanager
+    def _stage(timings, name):
+        """Accumulate wall time (ms) for a pipeline stage when timings is a dict"""
+        if timings is None:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings[name] = timings.get(name, 0.0) + (time.perf_counter() - start) * 1000
     
-    def preprocess_image(self, image_path):
+    def preprocess_image(self, image_path, img=None):
         """Enhanced preprocessing for maximum OCR accuracy"""
-        img = cv2.imread(image_path)
+        if img is None:
+            img = cv2.imread(image_path)
         
         # Resize if too large
         height, width = img.shape[:2]
@@ -985,23 +1105,25 @@ class PillBottleReader:
         
         return scaled
     
-    def extract_text_from_bottle(self, image_path):
+    def extract_text_from_bottle(self, image_path, timings=None):
         """Extract text using multiple OCR methods"""
         try:
-            processed_img = self.preprocess_image(image_path)
-            pil_img = Image.fromarray(processed_img)
+            with self._stage(timings, 'decode'):
+                original = cv2.imread(image_path)
+            if original is None:
+                print(f"Could not decode image: {image_path}")
+                return ""
             
-            # Try multiple configs
-            configs = [
-                '--oem 3 --psm 6',
-                '--oem 3 --psm 11',
-                '--oem 1 --psm 6',
-            ]
+            with self._stage(timings, 'preprocess'):
+                processed_img = self.preprocess_image(image_path, img=original)
+                pil_img = Image.fromarray(processed_img)
             
+            # Try multiple configs
             results = []
-            for config in configs:
+            for config in self.OCR_CONFIGS:
                 try:
-                    text = pytesseract.image_to_string(pil_img, config=config)
+                    with self._stage(timings, f'ocr[{config}]'):
+                        text = self.ocr.image_to_string(pil_img, config=config)
                     if text and len(text.strip()) > 0:
                         results.append(text.strip())
                 except:
@@ -1009,9 +1131,9 @@ class PillBottleReader:
             
             # Also try original image
             try:
-                original = cv2.imread(image_path)
-                gray_simple = cv2.cvtColor(original, cv2.COLOR_BGR2GRAY)
-                text_simple = pytesseract.image_to_string(gray_simple, config='--oem 3 --psm 6')
+                with self._stage(timings, f'ocr[original {self.ORIGINAL_CONFIG}]'):
+                    gray_simple = cv2.cvtColor(original, cv2.COLOR_BGR2GRAY)
+                    text_simple = self.ocr.image_to_string(gray_simple, config=self.ORIGINAL_CONFIG)
                 if text_simple:
                     results.append(text_simple.strip())
             except:
@@ -1129,10 +1251,13 @@ class PillBottleReader:
             return f"{dosage_match.group(1)} {dosage_match.group(2)}"
         return None
     
-    def process_bottle_image(self, image_path):
-        """Complete pipeline: OCR -> Search for known medications"""
+    def process_bottle_image(self, image_path, timings=None):
+        """
+        Complete pipeline: OCR -> Search for known medications.
+        Pass a dict as timings to collect per-stage wall time in ms.
+        """
         # Extract text
-        raw_text = self.extract_text_from_bottle(image_path)
+        raw_text = self.extract_text_from_bottle(image_path, timings=timings)
         
         if not raw_text or len(raw_text) < 3:
             return {
@@ -1148,7 +1273,8 @@ class PillBottleReader:
             }
         
         # Search for medications in the extracted text
-        matches = self.search_for_medications_in_text(raw_text)
+        with self._stage(timings, 'matching'):
+            matches = self.search_for_medications_in_text(raw_text)
         
         if not matches:
             return {
@@ -1287,22 +1413,9 @@ def add_bottle_to_inventory(request):
             quantity_to_add = int(request.POST.get('quantity', 0))
             
             medication = get_object_or_404(Medication, id=medication_id)
-            previous_quantity = medication.current_quantity
-            
-            medication.current_quantity += quantity_to_add
-            medication.save()
-            
-            # Log the transaction
             astronaut = request.user.astronaut if hasattr(request.user, 'astronaut') else None
-            InventoryLog.objects.create(
-                medication=medication,
-                log_type='INTAKE',
-                quantity_change=quantity_to_add,
-                previous_quantity=previous_quantity,
-                new_quantity=medication.current_quantity,
-                performed_by=astronaut,
-                notes='Added via bottle scanning'
-            )
+            record_movement(medication, quantity_to_add, 'INTAKE', performed_by=astronaut,
+                            notes='Added via bottle scanning')
             
             return JsonResponse({
                 'success': True,
@@ -1366,65 +1479,134 @@ def medication_inventory_graph(request):
     return render(request, 'medication_line_graph.html')
 
 
+@login_required
+@use_replica
+def stock_levels_api(request):
+    """Stock per medication at ?at=<ISO datetime> (default now), from the ledger"""
+    at = request.GET.get('at')
+    when = None
+    if at:
+        when = parse_datetime(at)
+        if when is None:
+            return JsonResponse({'success': False, 'message': 'at must be an ISO datetime'}, status=400)
+        if timezone.is_naive(when):
+            when = timezone.make_aware(when)
+    when = when or timezone.now()
+    levels = stock_levels(when)
+    names = dict(Medication.objects.filter(pk__in=list(levels)).values_list('id', 'name'))
+    return JsonResponse({
+        'success': True,
+        'at': when.isoformat(),
+        'medications': [
+            {'id': pk, 'name': names.get(pk, ''), 'quantity': quantity}
+            for pk, quantity in sorted(levels.items())
+        ],
+    })
+
+
+@login_required
+def forecast_api(request):
+    """Consumption rate, days of supply and run-out date per medication, soonest run-out first"""
+    supply = forecast()
+    medications = Medication.objects.filter(pk__in=list(supply)).values('id', 'name', 'current_quantity')
+    rows = [dict(m, **supply[m['id']]) for m in medications]
+    rows.sort(key=lambda row: (row['days_of_supply'] is None, row['days_of_supply'] or 0, row['name']))
+    return JsonResponse({
+        'success': True,
+        'medications': [
+            dict(row, runout_date=row['runout_date'].isoformat() if row['runout_date'] else None)
+            for row in rows
+        ],
+    })
+
+
+@login_required
+def resupply_plan_api(request):
+    """
+    Resupply manifest for ?mass_g=&volume_ml=&horizon_days=&cabinet=A1:2500
+    (cabinet repeatable; any limit left out is unlimited)
+    """
+    try:
+        plan = plan_resupply(
+            mass_budget_g=float(request.GET['mass_g']) if request.GET.get('mass_g') else None,
+            volume_budget_ml=float(request.GET['volume_ml']) if request.GET.get('volume_ml') else None,
+            cabinet_capacity_ml=parse_cabinets(request.GET.getlist('cabinet')),
+            horizon_days=int(request.GET.get('horizon_days', DEFAULT_HORIZON_DAYS)),
+        )
+    except ValueError as e:  # PlanningError included
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    except SolverError as e:
+        # Not the request's fault; asking again (or with a looser budget) may work
+        return JsonResponse({'success': False, 'message': str(e)}, status=503)
+    return JsonResponse({'success': True, **plan})
+
+
 @csrf_exempt
+@use_replica
+@cache_inventory_response('history')
 def medication_history_api(request):
     "Get medication history for graph"
     days = int(request.GET.get('days', 30))
     since = timezone.now() - timedelta(days=days) if days > 0 else None
 
-    # Build list of every date in the range
+    medications = list(
+        Medication.objects.order_by('id').values_list(
+            'id', 'name', 'medication_type', 'current_quantity', 'status'
+        )
+    )
+
+    # Daily rollups: closing quantity per medication per day, in date order
+    snapshots = DailyInventorySnapshot.objects.order_by('date')
+    if since:
+        snapshots = snapshots.filter(date__gte=since.date())
+    rows = list(snapshots.values_list(
+        'medication_id', 'date', 'closing_quantity', 'opening_quantity'
+    ))
+
     today = timezone.now().date()
     if since:
         start_date = since.date()
     else:
-        first_log = InventoryLog.objects.order_by('timestamp').first()
-        start_date = first_log.timestamp.date() if first_log else today
-
-    all_dates = []
-    current = start_date
-    while current <= today:
-        all_dates.append(current)
-        current += timedelta(days=1)
-
-    data = {}
-    for med in Medication.objects.all():
-        logs = InventoryLog.objects.filter(medication=med)
-        if since:
-            logs = logs.filter(timestamp__gte=since)
-        logs = list(logs.order_by('timestamp'))
-
-        if not logs:
-            data[med.name] = {
-                'type': med.get_medication_type_display(),
-                'points': [
-                    {'date': d.strftime('%Y-%m-%d'), 'quantity': med.current_quantity}
-                    for d in all_dates
-                ]
-            }
+        start_date = rows[0][1] if rows else today
+    n_days = (today - start_date).days + 1
+    all_dates = [(start_date + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(n_days)]
+
+    med_index = {med_id: i for i, (med_id, *_rest) in enumerate(medications)}
+    initial = np.array([m[3] for m in medications], dtype=float)
+    series_idx, day_idx, values = [], [], []
+    seen = set()
+    for med_id, snap_day, closing, opening in rows:
+        i = med_index.get(med_id)
+        if i is None or snap_day > today:
             continue
-        log_map = {}
-        for log in logs:
-            log_map[log.timestamp.date()] = log.new_quantity
-
-        points = []
-        last_qty = med.current_quantity
-        for d in reversed(all_dates):
-            if d in log_map:
-                last_qty = log_map[d]
-            points.append({'date': d.strftime('%Y-%m-%d'), 'quantity': last_qty})
-
-        points.reverse()
-
-        data[med.name] = {
-            'type': med.get_medication_type_display(),
-            'points': points
+        series_idx.append(i)
+        day_idx.append((snap_day - start_date).days)
+        values.append(closing)
+        # Before its first change in the window a medication sits at that day's opening
+        if i not in seen:
+            seen.add(i)
+            initial[i] = opening
+
+    quantities = forward_fill_series(
+        len(medications), n_days, series_idx, day_idx, values, initial
+    ).astype(int).tolist()
+
+    type_labels = dict(Medication.MEDICATION_TYPES)
+    data = {}
+    for (med_id, name, med_type, _qty, _status), series in zip(medications, quantities):
+        data[name] = {
+            'type': type_labels.get(med_type, med_type),
+            'points': [
+                {'date': d, 'quantity': q} for d, q in zip(all_dates, series)
+            ]
         }
 
+    statuses = Counter(m[4] for m in medications)
     summary = {
-        'total':    Medication.objects.count(),
-        'normal':   Medication.objects.filter(status='NORMAL').count(),
-        'low':      Medication.objects.filter(status='LOW').count(),
-        'critical': Medication.objects.filter(status__in=['CRITICAL', 'OUT']).count(),
+        'total':    len(medications),
+        'normal':   statuses['NORMAL'],
+        'low':      statuses['LOW'],
+        'critical': statuses['CRITICAL'] + statuses['OUT'],
     }
     return JsonResponse({'data': data, 'summary': summary})
 
@@ -1433,70 +1615,453 @@ def medication_history_api(request):
 # ACCESS LOG
 # ============================================================================
 
+ACCESS_LOG_PAGE_SIZE = 50
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+
+def filter_access_logs(request):
+    """
+    Apply the access log filters from the query string.
+    Returns (queryset, filters) where filters holds the cleaned values.
+    """
+    filters = {
+        'astronaut': request.GET.get('astronaut', ''),
+        'event_type': request.GET.get('event_type', ''),
+        'medication': request.GET.get('medication', ''),
+        'date_from': request.GET.get('date_from', ''),
+        'date_to': request.GET.get('date_to', ''),
+    }
+    logs = AccessLog.objects.all()
+
+    if filters['astronaut'].isdigit():
+        logs = logs.filter(astronaut_id=int(filters['astronaut']))
+    if filters['event_type'] in dict(AccessLog.EVENT_TYPES):
+        logs = logs.filter(event_type=filters['event_type'])
+    if filters['medication'].isdigit():
+        logs = logs.filter(Exists(AccessLogItem.objects.filter(
+            access_log=OuterRef('pk'), medication_id=int(filters['medication'])
+        )))
+
+    tz = timezone.get_current_timezone()
+    date_from = _parse_date(filters['date_from'])
+    date_to = _parse_date(filters['date_to'])
+    if date_from:
+        logs = logs.filter(timestamp__gte=datetime.combine(date_from, datetime.min.time(), tzinfo=tz))
+    if date_to:
+        logs = logs.filter(timestamp__lt=datetime.combine(date_to + timedelta(days=1), datetime.min.time(), tzinfo=tz))
+
+    return logs, filters
+
+
 @login_required
+@use_replica
 def access_log_view(request):
-    """Combined unlock + restock access log"""
-    from django.db.models import Avg
-
-    logs = AccessLog.objects.select_related('astronaut').prefetch_related('items__medication').all()
-
-    # Summary stats
-    unlock_qs  = logs.filter(event_type='UNLOCK')
-    restock_qs = logs.filter(event_type='RESTOCK')
-    avg_door   = unlock_qs.exclude(door_open_seconds__isnull=True).aggregate(
-        avg=Avg('door_open_seconds')
-    )['avg']
-
-    stats = {
-        'total':         logs.count(),
-        'unlocks':       unlock_qs.count(),
-        'restocks':      restock_qs.count(),
-        'avg_door_open': round(avg_door, 1) if avg_door else '—',
-    }
+    """Combined unlock + restock access log, keyset-paginated on (timestamp, id)"""
+    logs, filters = filter_access_logs(request)
+
+    page, next_cursor, prev_cursor = keyset_page(
+        logs.select_related('astronaut').defer('astronaut__face_encoding').prefetch_related('items__medication'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=ACCESS_LOG_PAGE_SIZE,
+    )
 
-    return render(request, 'access_log.html', {'logs': logs, 'stats': stats})
+    # Summary stats for the whole filtered log in one query
+    totals = logs.aggregate(
+        total=Count('id'),
+        unlocks=Count('id', filter=Q(event_type='UNLOCK')),
+        restocks=Count('id', filter=Q(event_type='RESTOCK')),
+        avg_door=Avg('door_open_seconds', filter=Q(event_type='UNLOCK')),
+    )
+    avg_door = totals.pop('avg_door')
+    stats = dict(totals, avg_door_open=round(avg_door, 1) if avg_door else '—')
+
+    context = {
+        'logs': page,
+        'stats': stats,
+        'filters': filters,
+        'filter_query': urlencode({k: v for k, v in filters.items() if v}),
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'astronauts': Astronaut.objects.only('id', 'name', 'astronaut_id').order_by('name'),
+        'medications': Medication.objects.only('id', 'name').order_by('name'),
+    }
+    return render(request, 'access_log.html', context)
 
 
 @login_required
+@use_replica
 def export_access_log_csv(request):
-    """Export access log to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = (
-        f'attachment; filename="access_log_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv"'
-    )
+    """
+    Export access log to CSV. Accepts the same filters as the access log page
+    (including date_from/date_to) and ?gzip=1; rows are streamed in chunks.
+    """
+    logs, _filters = filter_access_logs(request)
+    logs = logs.select_related('astronaut').defer('astronaut__face_encoding').prefetch_related(
+        Prefetch('items', queryset=AccessLogItem.objects.select_related('medication').order_by('id'))
+    ).order_by('-timestamp', '-id').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    header = ['Date', 'Time', 'Event Type', 'Astronaut', 'Astronaut ID',
+              'Medication', 'Quantity', 'Door Open (seconds)', 'Notes']
 
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Time', 'Event Type', 'Astronaut', 'Astronaut ID',
-                     'Medication', 'Quantity', 'Door Open (seconds)', 'Notes'])
+    return streaming_csv_response(
+        request, f'access_log_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        header, _access_log_rows(logs), compress=request.GET.get('gzip') == '1'
+    )
 
-    logs = AccessLog.objects.select_related('astronaut').prefetch_related('items__medication').all()
 
+def _access_log_rows(logs):
     for log in logs:
+        door_open = log.door_open_seconds if log.event_type == 'UNLOCK' and log.door_open_seconds is not None else ''
+        astronaut_name = log.astronaut.name if log.astronaut else 'System'
+        astronaut_id = log.astronaut.astronaut_id if log.astronaut else ''
         items = list(log.items.all())
         if items:
             for i, item in enumerate(items):
-                writer.writerow([
+                yield [
                     log.timestamp.strftime('%Y-%m-%d'),
                     log.timestamp.strftime('%H:%M:%S'),
                     log.get_event_type_display(),
-                    log.astronaut.name if log.astronaut else 'System',
-                    log.astronaut.astronaut_id if log.astronaut else '',
+                    astronaut_name,
+                    astronaut_id,
                     item.medication.name,
                     item.quantity,
-                    log.door_open_seconds if log.event_type == 'UNLOCK' and log.door_open_seconds is not None else '',
+                    door_open,
                     log.notes if i == 0 else '',  # only write notes on first row per log
-                ])
+                ]
         else:
-            writer.writerow([
+            yield [
                 log.timestamp.strftime('%Y-%m-%d'),
                 log.timestamp.strftime('%H:%M:%S'),
                 log.get_event_type_display(),
-                log.astronaut.name if log.astronaut else 'System',
-                log.astronaut.astronaut_id if log.astronaut else '',
+                astronaut_name,
+                astronaut_id,
                 '',
                 '',
-                log.door_open_seconds if log.event_type == 'UNLOCK' and log.door_open_seconds is not None else '',
+                door_open,
                 log.notes,
-            ])
+            ]
+
+
+@login_required
+@use_replica
+def export_logs_columnar(request):
+    """
+    Columnar log export as a zip of month-partitioned column files.
+    ?table= (repeatable, default all), ?format=auto|parquet|npz, and
+    ?cursor= from a previous response's X-Export-Cursor to only get new rows.
+    """
+    tables = request.GET.getlist('table') or list(COLUMNAR_TABLES)
+    unknown = [t for t in tables if t not in COLUMNAR_TABLES]
+    if unknown:
+        return JsonResponse({'success': False, 'message': f'Unknown table: {", ".join(unknown)}'}, status=400)
+    try:
+        fmt = resolve_columnar_format(request.GET.get('format', 'auto'))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    cursors = {}
+    if request.GET.get('cursor'):
+        try:
+            padded = request.GET['cursor'] + '=' * (-len(request.GET['cursor']) % 4)
+            cursors = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (ValueError, TypeError):
+            return JsonResponse({'success': False, 'message': 'Invalid cursor'}, status=400)
+        # {table: last exported id}, as handed out in X-Export-Cursor
+        if not isinstance(cursors, dict) or not all(
+            table in COLUMNAR_TABLES and type(last_id) is int and last_id >= 0
+            for table, last_id in cursors.items()
+        ):
+            return JsonResponse({'success': False, 'message': 'Invalid cursor'}, status=400)
+
+    with tempfile.TemporaryDirectory() as export_dir:
+        cursors, written = export_columnar_tables(export_dir, tables, cursors, fmt=fmt)
+        archive = tempfile.TemporaryFile()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+            # Column files are already compressed; just store them
+            for root, _dirs, files in os.walk(export_dir):
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    zf.write(path, os.path.relpath(path, export_dir))
+            zf.writestr('_export_state.json', json.dumps({'cursors': cursors, 'format': fmt, 'rows': written}, indent=2))
+    archive.seek(0)
+
+    next_cursor = base64.urlsafe_b64encode(json.dumps(cursors, separators=(',', ':')).encode()).decode().rstrip('=')
+    response = FileResponse(
+        archive, as_attachment=True,
+        filename=f'logs_columnar_{timezone.now().strftime("%Y%m%d_%H%M%S")}.zip',
+        content_type='application/zip',
+    )
+    response['X-Export-Cursor'] = next_cursor
+    response['X-Export-Rows'] = str(sum(written.values()))
+    return response
+
+
+# ============================================================================
+# WARNING LOG
+# ============================================================================
 
-    return response
\ No newline at end of file
+WARNING_PAGE_SIZE = 50
+
+
+def filter_warnings(request):
+    """
+    WarningLog queryset for ?severity=, ?acknowledged= (true/false/'' for all)
+    and ?astronaut=. Defaults to the unacknowledged queue.
+    """
+    filters = {
+        'severity': request.GET.get('severity', ''),
+        'acknowledged': request.GET.get('acknowledged', 'false'),
+        'astronaut': request.GET.get('astronaut', ''),
+    }
+
+    warnings = WarningLog.objects.all()
+    if filters['acknowledged'] == 'false':
+        warnings = warnings.filter(acknowledged=False)
+    elif filters['acknowledged'] == 'true':
+        warnings = warnings.filter(acknowledged=True)
+    if filters['severity'] in dict(WarningLog.SEVERITY_CHOICES):
+        warnings = warnings.filter(severity=filters['severity'])
+    if filters['astronaut'].isdigit():
+        warnings = warnings.filter(astronaut_id=int(filters['astronaut']))
+    return warnings, filters
+
+
+def _warning_page(request, warnings, page_size=WARNING_PAGE_SIZE):
+    return keyset_page(
+        warnings.select_related('astronaut', 'medication', 'acknowledged_by').defer(
+            'astronaut__face_encoding', 'acknowledged_by__face_encoding'
+        ),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=page_size,
+    )
+
+
+def acknowledge_warnings(request, warnings):
+    """Acknowledge every pending row in warnings with a single UPDATE"""
+    astronaut = request.user.astronaut if hasattr(request.user, 'astronaut') else None
+    updated = update_journaled(
+        warnings.filter(acknowledged=False),
+        acknowledged=True,
+        acknowledged_by=astronaut,
+        acknowledged_at=timezone.now(),
+    )
+    if updated:
+        # .update() sends no signals
+        bump_warnings_version()
+    return updated
+
+
+@login_required
+def warning_log_view(request):
+    """Warning review page: pending queue by default, keyset-paginated"""
+    if request.GET.get('export') == 'csv':
+        return export_warnings_csv(request)
+
+    warnings, filters = filter_warnings(request)
+    page, next_cursor, prev_cursor = _warning_page(request, warnings)
+
+    stats = warning_stats()
+    stats['total'] = WarningLog.objects.count()
+    stats['acknowledged'] = stats['total'] - stats['pending']
+
+    context = {
+        'warnings': page,
+        'stats': stats,
+        'filters': filters,
+        'filter_query': urlencode({k: v for k, v in filters.items() if k == 'acknowledged' or v}),
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+    }
+    return render(request, 'warning_log.html', context)
+
+
+@login_required
+@require_POST
+def acknowledge_warning(request, warning_id):
+    """Acknowledge one warning from the review page"""
+    acknowledge_warnings(request, WarningLog.objects.filter(id=warning_id))
+    # Back to the same filtered page, but never off this site
+    referer = request.META.get('HTTP_REFERER')
+    if referer and url_has_allowed_host_and_scheme(referer, allowed_hosts={request.get_host()},
+                                                   require_https=request.is_secure()):
+        return redirect(referer)
+    return redirect('medical_inventory:warning_log')
+
+
+@login_required
+def warnings_api(request):
+    """
+    JSON review queue. Same filters as the page plus ?after=<cursor> and
+    ?limit= (max 200); includes the live pending/critical counts.
+    """
+    warnings, filters = filter_warnings(request)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', WARNING_PAGE_SIZE)), 200))
+    except ValueError:
+        limit = WARNING_PAGE_SIZE
+    page, next_cursor, prev_cursor = _warning_page(request, warnings, page_size=limit)
+
+    return JsonResponse({
+        'success': True,
+        'warnings': [
+            {
+                'id': w.id,
+                'timestamp': w.timestamp.isoformat(),
+                'astronaut': w.astronaut.name,
+                'astronaut_id': w.astronaut_id,
+                'medication': w.medication.name,
+                'medication_id': w.medication_id,
+                'quantity_taken': w.quantity_taken,
+                'severity': w.severity,
+                'message': w.warning_message,
+                'acknowledged': w.acknowledged,
+                'acknowledged_by': w.acknowledged_by.name if w.acknowledged_by else None,
+                'acknowledged_at': w.acknowledged_at.isoformat() if w.acknowledged_at else None,
+            }
+            for w in page
+        ],
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'filters': filters,
+        **warning_stats(),
+    })
+
+
+@login_required
+@require_POST
+def acknowledge_warnings_api(request):
+    """
+    Bulk acknowledge in one UPDATE. Body: {"ids": [...]} or {"up_to": cursor}
+    to clear everything at or older than a queue position (optionally with
+    the same severity/astronaut filters as the queue).
+    """
+    try:
+        data = json.loads(request.body or '{}')
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+
+    if data.get('ids'):
+        try:
+            ids = [int(i) for i in data['ids']]
+        except (TypeError, ValueError):
+            return JsonResponse({'success': False, 'message': 'ids must be integers'}, status=400)
+        warnings = WarningLog.objects.filter(id__in=ids)
+    elif data.get('up_to'):
+        position = decode_cursor(data['up_to'])
+        if not position:
+            return JsonResponse({'success': False, 'message': 'Invalid cursor'}, status=400)
+        timestamp, pk = position
+        warnings = WarningLog.objects.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lte=pk))
+        if data.get('severity') in dict(WarningLog.SEVERITY_CHOICES):
+            warnings = warnings.filter(severity=data['severity'])
+        if str(data.get('astronaut', '')).isdigit():
+            warnings = warnings.filter(astronaut_id=int(data['astronaut']))
+    else:
+        return JsonResponse({'success': False, 'message': 'Provide ids or up_to'}, status=400)
+
+    acknowledged = acknowledge_warnings(request, warnings)
+    return JsonResponse({'success': True, 'acknowledged': acknowledged, **warning_stats()})
+
+
+@login_required
+@use_replica
+def export_warnings_csv(request):
+    """Stream the filtered warning log as CSV"""
+    warnings, _filters = filter_warnings(request)
+    warnings = warnings.select_related('astronaut', 'medication', 'acknowledged_by').defer(
+        'astronaut__face_encoding', 'acknowledged_by__face_encoding'
+    ).order_by('-timestamp', '-id').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    header = ['Timestamp', 'Astronaut', 'Medication', 'Quantity', 'Severity',
+              'Message', 'Acknowledged', 'Acknowledged By', 'Acknowledged At']
+    rows = (
+        [
+            w.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            w.astronaut.name,
+            w.medication.name,
+            w.quantity_taken,
+            w.get_severity_display(),
+            w.warning_message,
+            'Yes' if w.acknowledged else 'No',
+            w.acknowledged_by.name if w.acknowledged_by else '',
+            w.acknowledged_at.strftime('%Y-%m-%d %H:%M:%S') if w.acknowledged_at else '',
+        ]
+        for w in warnings
+    )
+    return streaming_csv_response(
+        request, f'warnings_{timezone.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        header, rows, compress=request.GET.get('gzip') == '1'
+    )
+
+
+# ============================================================================
+# SYNC API (edge kiosks / habitat modules <-> central)
+# ============================================================================
+
+def _sync_authorized(request):
+    """Shared-secret bearer token (SYNC_TOKEN); the API is off while it is unset"""
+    token = getattr(settings, 'SYNC_TOKEN', '')
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+@csrf_exempt
+def sync_changes_api(request):
+    """
+    Changes since ?since=<seq>, at most ?limit= per batch, encoded per
+    ?encoding=gzip|lzma|json (see sync.changes_since for the layout).
+    """
+    if not _sync_authorized(request):
+        return JsonResponse({'success': False, 'message': 'Unauthorized'}, status=401)
+    try:
+        since = max(0, int(request.GET.get('since', 0)))
+        limit = max(1, min(int(request.GET.get('limit', CHANGE_BATCH_SIZE)), MAX_CHANGE_BATCH_SIZE))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'since and limit must be integers'}, status=400)
+    codec = request.GET.get('encoding', 'gzip')
+    if codec not in SYNC_CODECS:
+        return JsonResponse({'success': False, 'message': f'Unknown encoding: {codec}'}, status=400)
+
+    payload = changes_since(since, limit)
+    response = HttpResponse(encode_payload(payload, codec), content_type='application/octet-stream')
+    response['X-Sync-Encoding'] = codec
+    response['X-Sync-Cursor'] = str(payload['cursor'])
+    response['X-Sync-More'] = '1' if payload['more'] else '0'
+    return response
+
+
+@csrf_exempt
+def sync_checkpoint_api(request, node_id):
+    """Last journal id applied for a node (a rebuilt kiosk starts numbering above it)"""
+    if not _sync_authorized(request):
+        return JsonResponse({'success': False, 'message': 'Unauthorized'}, status=401)
+    checkpoint = SyncCheckpoint.objects.filter(node_id=node_id).first()
+    return JsonResponse({'success': True, 'last_journal_id': checkpoint.last_journal_id if checkpoint else 0})
+
+
+@csrf_exempt
+@require_POST
+def sync_push_api(request):
+    """Apply one batch of an edge node's write journal (body encoded per X-Sync-Encoding)"""
+    if not _sync_authorized(request):
+        return JsonResponse({'success': False, 'message': 'Unauthorized'}, status=401)
+    try:
+        data = decode_payload(request.body, request.headers.get('X-Sync-Encoding', 'gzip'))
+        node_id = int(data['node'])
+        entries = [journal_from_wire(row) for row in data['entries']]
+    except (ValueError, KeyError, TypeError) as e:
+        return JsonResponse({'success': False, 'message': f'Invalid sync batch: {e}'}, status=400)
+    if not entries:
+        return JsonResponse({'success': False, 'message': 'Empty batch'}, status=400)
+
+    last_journal_id = apply_pushed_batch(node_id, entries)
+    print(f"Sync: applied {len(entries)} journal entries from node {node_id} (up to {last_journal_id})")
+    return JsonResponse({'success': True, 'last_journal_id': last_journal_id})
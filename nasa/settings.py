@@ -2,6 +2,7 @@ from pathlib import Path
 from dotenv import load_dotenv
 import os
 import hashlib
+import warnings
 
 
 load_dotenv()
@@ -32,6 +33,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'medical_inventory.routers.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,6 +82,88 @@ DATABASES = {
     }
 }
 
+# Optional read replica for reports, graphs and exports (views marked @use_replica).
+# Unset DB_REPLICA_* values fall back to the primary's. A client that writes is
+# read from the primary for DB_REPLICA_LAG_SECONDS so it always sees its own changes.
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        HOST=os.getenv('DB_REPLICA_HOST'),
+        PORT=int(os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT'])),
+        NAME=os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        USER=os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        PASSWORD=os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        TEST={'MIRROR': 'default'},
+    )
+DATABASE_ROUTERS = ['medical_inventory.routers.ReplicaRouter']
+DB_REPLICA_LAG_SECONDS = int(os.getenv('DB_REPLICA_LAG_SECONDS', '5'))
+
+# Every new connection to the managed PostgreSQL costs a TLS handshake plus
+# authentication, so don't open one per request. DB_CONN_STRATEGY:
+#   'persistent' - reuse each worker thread's connection for DB_CONN_MAX_AGE
+#                  seconds, checked before reuse so a dropped link reconnects
+#   'pool'       - psycopg 3 connection pool (needs psycopg[pool]); use this under
+#                  ASGI, where request threads don't live long enough to reuse a connection
+#   'none'       - connect per request
+# Measure with: python manage.py benchmark_db_connections
+DB_CONN_STRATEGY = os.getenv('DB_CONN_STRATEGY', 'persistent')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+
+if DB_CONN_STRATEGY == 'pool':
+    try:
+        import psycopg  # noqa: F401
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        # Logging isn't configured yet while settings load; a warning is shown once per process
+        warnings.warn('DB_CONN_STRATEGY=pool needs psycopg[pool]; falling back to persistent connections',
+                      RuntimeWarning)
+        DB_CONN_STRATEGY = 'persistent'
+
+for _database in DATABASES.values():
+    if DB_CONN_STRATEGY == 'pool':
+        _database['CONN_MAX_AGE'] = 0
+        _database['OPTIONS'] = dict(_database.get('OPTIONS', {}), pool={
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': 10,
+        })
+    elif DB_CONN_STRATEGY == 'persistent':
+        _database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+        _database['CONN_HEALTH_CHECKS'] = True
+    else:
+        _database['CONN_MAX_AGE'] = 0
+
+# Edge mode (offline-first kiosk): every request is served from a local SQLite
+# copy, so losing the link to the central database costs nothing. Local writes
+# are journaled and `python manage.py sync_edge --loop 30` pushes them upstream
+# and refreshes crew/catalogue data. Give every kiosk its own EDGE_NODE_ID.
+EDGE_MODE = os.getenv('EDGE_MODE', 'False') == 'True'
+EDGE_NODE_ID = int(os.getenv('EDGE_NODE_ID', '1'))
+# Delta sync over HTTP instead of a direct database link (bandwidth-limited
+# sites such as a habitat module): the central server enables /api/sync/ by
+# setting SYNC_TOKEN; a node sets the same token and SYNC_CENTRAL_URL, e.g.
+# https://ground.example/api/sync/. SYNC_ENCODING is gzip, lzma or json.
+SYNC_TOKEN = os.getenv('SYNC_TOKEN', '')
+SYNC_CENTRAL_URL = os.getenv('SYNC_CENTRAL_URL', '')
+SYNC_ENCODING = os.getenv('SYNC_ENCODING', 'gzip')
+if EDGE_MODE:
+    _central = DATABASES.pop('default')
+    # Fail fast when the link is down; only the sync job ever connects here
+    DATABASES['central'] = dict(_central, OPTIONS=dict(_central.get('OPTIONS', {}), connect_timeout=5))
+    DATABASES.pop('replica', None)
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.getenv('EDGE_DB_PATH', str(BASE_DIR / 'db.sqlite3')),
+        'OPTIONS': {
+            # WAL lets the kiosk read while the sync job writes
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -114,6 +198,41 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+
+# Cache for version-stamped inventory payloads and the inventory/face/warning
+# version counters. Every process that writes - web workers, sync_edge,
+# enroll_crew, register_face, sweep_expired - must share it, so it is never
+# per-process (a system check enforces this). Without REDIS_URL it lives in
+# files under CACHE_DIR, shared by every process on this host; set REDIS_URL
+# when web workers run on more than one host.
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / 'cache')),
+            # Payloads are keyed by version and pile up until they expire
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+if EDGE_MODE:
+    # A kiosk has no Redis and must not depend on the link: the kiosk server
+    # and `sync_edge --loop` share a file cache next to the edge database, so
+    # pulled stock and newly synced crew faces reach the running server
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', str(Path(DATABASES['default']['NAME']).parent / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
 # Authentication
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = 'medical_inventory:home'
@@ -123,6 +242,21 @@ ESP32_SERIAL_PORT = 'COM3'
 ESP32_BAUD_RATE = 115200
 CAMERA_INDEX = int(os.getenv('CAMERA_INDEX', '0'))
 
+# Server-sent inventory events (ASGI): streams close after this long and the browser reconnects;
+# under WSGI every response is a single batch
+INVENTORY_EVENTS_MAX_SECONDS = int(os.getenv('INVENTORY_EVENTS_MAX_SECONDS', '300'))
+
+# Expiry sweep / dashboard: lots expiring within this many days are flagged
+EXPIRY_WARNING_DAYS = int(os.getenv('EXPIRY_WARNING_DAYS', '30'))
+
+# Background face enrollment: concurrent encoding jobs per server process
+ENROLLMENT_WORKERS = int(os.getenv('ENROLLMENT_WORKERS', '1'))
+
+# OCR backend for the bottle reader: 'auto', 'tesserocr' (persistent engine) or 'pytesseract'
+OCR_BACKEND = os.getenv('OCR_BACKEND', 'auto')
+OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'eng')
+TESSDATA_PATH = os.getenv('TESSDATA_PREFIX') or None
+
 
 EMERGENCY_PIN_HASH = hashlib.sha256('1234'.encode()).hexdigest()
 